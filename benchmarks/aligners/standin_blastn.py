@@ -0,0 +1,40 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# standin_blastn.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+############################################
+# Stand-in of blastn for the benchmarks (see standin_utils.py).
+# Reports the hits as m2p_split_blast runs blastn:
+# -outfmt "6 qseqid qlen sseqid slen length qstart qend sstart send bitscore evalue pident mismatch gapopen"
+############################################
+
+import sys
+
+from standin_utils import read_fasta_lengths, load_hits, get_alignment, get_option
+
+args = sys.argv[1:]
+
+db_path = get_option(args, "-db")
+query_path = get_option(args, "-query", "-")
+
+hits_dict = load_hits(db_path)
+
+for (query_id, query_len) in read_fasta_lengths(query_path):
+    for hit in hits_dict.get(query_id, []):
+        (subject, subject_len, hit_sstart, strand, identity, coverage) = hit
+        (align_len, qstart, qend, sstart, send) = get_alignment(hit, query_len)
+        
+        # Blast reports the minus strand with sstart > send
+        if strand == "-": (sstart, send) = (send, sstart)
+        
+        mismatches = int(round(align_len*(100.0-identity)/100.0))
+        bitscore = round(1.8*(align_len-mismatches), 1)
+        
+        sys.stdout.write("\t".join([query_id, str(query_len), subject, str(subject_len), str(align_len),
+                                    str(qstart), str(qend), str(sstart), str(send),
+                                    str(bitscore), "1e-50", "%.2f" % identity, str(mismatches), "0"])+"\n")
+
+## END
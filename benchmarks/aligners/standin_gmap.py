@@ -0,0 +1,67 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# standin_gmap.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+############################################
+# Stand-in of GMAP (and GMAPL) for the benchmarks (see standin_utils.py).
+# Reports the hits with the default text output of GMAP,
+# which is the one parsed (and compressed) by m2p_gmap,
+# applying the --min-identity and --min-trimmed-coverage thresholds.
+############################################
+
+import sys
+
+from standin_utils import read_fasta_lengths, load_hits, get_alignment, get_option
+
+# Numbers are printed by GMAP with thousands separators
+def _gmap_number(number):
+    return "{:,}".format(number)
+
+args = sys.argv[1:]
+
+dbs_path = get_option(args, "-D")
+db_name = get_option(args, "-d")
+max_paths = int(get_option(args, "-n", "100"))
+query_path = args[-1]
+
+min_identity = 0.0
+min_coverage = 0.0
+for arg in args:
+    if arg.startswith("--min-identity="): min_identity = float(arg.split("=")[1])*100.0
+    elif arg.startswith("--min-trimmed-coverage="): min_coverage = float(arg.split("=")[1])*100.0
+
+hits_dict = load_hits(dbs_path+"/"+db_name)
+
+for (query_id, query_len) in read_fasta_lengths(query_path):
+    query_hits = [hit for hit in hits_dict.get(query_id, [])
+                  if hit[4] >= min_identity and hit[5]*100.0 >= min_coverage][:max_paths]
+    
+    sys.stdout.write(">"+query_id+"\n")
+    sys.stdout.write("Paths ("+str(len(query_hits))+"):\n")
+    
+    for path_num, hit in enumerate(query_hits):
+        (subject, subject_len, hit_sstart, strand, identity, coverage) = hit
+        (align_len, qstart, qend, sstart, send) = get_alignment(hit, query_len)
+        
+        # GMAP reports the minus strand with genomic start > end
+        if strand == "-": (sstart, send) = (send, sstart)
+        
+        genomic_range = subject+":"+_gmap_number(sstart)+".."+_gmap_number(send)
+        matches = int(round(align_len*identity/100.0))
+        
+        sys.stdout.write("  Path "+str(path_num+1)+": query "+str(qstart)+".."+str(qend)+" ("+str(align_len)+" bp)"+\
+                         " => genome "+genomic_range+" ("+str(align_len)+" bp)\n")
+        sys.stdout.write("    cDNA direction: sense\n")
+        sys.stdout.write("    Genomic pos: "+genomic_range+" ("+strand+" strand)\n")
+        sys.stdout.write("    Number of exons: 1\n")
+        sys.stdout.write("    Coverage: %.1f (query length: %d bp)\n" % (coverage*100.0, query_len))
+        sys.stdout.write("    Trimmed coverage: %.1f (trimmed length: %d bp, trimmed region: 1..%d)\n" % (coverage*100.0, query_len, query_len))
+        sys.stdout.write("    Percent identity: %.1f (%d matches, %d mismatches, 0 indels, 0 unknowns)\n" % (identity, matches, align_len-matches))
+        sys.stdout.write("\n")
+    
+    if len(query_hits) == 0: sys.stdout.write("\n")
+
+## END
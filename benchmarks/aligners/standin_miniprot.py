@@ -0,0 +1,50 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# standin_miniprot.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+############################################
+# Stand-in of miniprot for the benchmarks (see standin_utils.py).
+# Reports the hits as "miniprot --gff": a ##PAF line (0-based)
+# followed by the GFF features (1-based) of each alignment.
+############################################
+
+import sys
+
+from standin_utils import read_fasta_lengths, load_hits, get_alignment
+
+MPI_EXT = ".mpi"
+
+args = sys.argv[1:]
+
+db_path = args[0]
+if db_path.endswith(MPI_EXT): db_path = db_path[:-len(MPI_EXT)]
+query_path = args[1]
+
+hits_dict = load_hits(db_path)
+
+sys.stdout.write("##gff-version 3\n")
+
+mrna_num = 0
+for (query_id, query_len) in read_fasta_lengths(query_path):
+    for rank, hit in enumerate(hits_dict.get(query_id, [])):
+        (subject, subject_len, hit_sstart, strand, identity, coverage) = hit
+        (align_len, qstart, qend, sstart, send) = get_alignment(hit, query_len)
+        
+        mrna_num += 1
+        matches = int(round(align_len*identity/100.0))
+        
+        sys.stdout.write("\t".join(["##PAF", query_id, str(query_len), str(qstart-1), str(qend), strand,
+                                    subject, str(subject_len), str(sstart-1), str(send),
+                                    str(matches), str(align_len), "0", "AS:i:"+str(matches*3)])+"\n")
+        
+        attributes = "ID=MP%06d;Rank=%d;Identity=%.4f;Positive=%.4f;Target=%s %d %d" % \
+                     (mrna_num, rank+1, identity/100.0, identity/100.0, query_id, qstart, qend)
+        sys.stdout.write("\t".join([subject, "miniprot", "mRNA", str(sstart), str(send), str(matches*3),
+                                    strand, ".", attributes])+"\n")
+        sys.stdout.write("\t".join([subject, "miniprot", "CDS", str(sstart), str(send), str(matches*3),
+                                    strand, "0", "Parent=MP%06d;Rank=%d;Identity=%.4f" % (mrna_num, rank+1, identity/100.0)])+"\n")
+
+## END
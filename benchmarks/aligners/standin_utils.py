@@ -0,0 +1,92 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# standin_utils.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+############################################
+# Common code of the stand-in aligners of the benchmarks.
+# These do not align anything: the hits of each query are read
+# from the "<db>.hits" file written by bmap_bench_data.py
+# in the databases folder, and reported in the format of each aligner.
+############################################
+
+import sys
+
+HITS_FILE_EXT = ".hits"
+
+# Fields of the rows of a hits file
+HIT_QUERY = 0
+HIT_SUBJECT = 1
+HIT_SUBJECT_LEN = 2
+HIT_SSTART = 3
+HIT_STRAND = 4
+HIT_IDENTITY = 5
+HIT_COVERAGE = 6
+
+# Returns a list of (query_id, query_len) in the same order as in the FASTA
+def read_fasta_lengths(fasta_path):
+    fasta_lengths = []
+    
+    if fasta_path == "-" or fasta_path == "/dev/stdin":
+        fasta_file = sys.stdin
+    else:
+        fasta_file = open(fasta_path, 'r')
+    
+    query_id = None
+    query_len = 0
+    for fasta_line in fasta_file:
+        if fasta_line.startswith(">"):
+            if query_id != None: fasta_lengths.append((query_id, query_len))
+            query_id = fasta_line[1:].strip().split(" ")[0]
+            query_len = 0
+        else:
+            query_len += len(fasta_line.strip())
+    
+    if query_id != None: fasta_lengths.append((query_id, query_len))
+    
+    return fasta_lengths
+
+# Returns a dict [query_id] = [(subject, subject_len, sstart, strand, identity, coverage), ...]
+def load_hits(db_path):
+    hits_dict = {}
+    
+    for hit_line in open(db_path+HITS_FILE_EXT, 'r'):
+        hit_data = hit_line.strip().split("\t")
+        
+        hit = (hit_data[HIT_SUBJECT], long(hit_data[HIT_SUBJECT_LEN]), long(hit_data[HIT_SSTART]),
+               hit_data[HIT_STRAND], float(hit_data[HIT_IDENTITY]), float(hit_data[HIT_COVERAGE]))
+        
+        query_id = hit_data[HIT_QUERY]
+        if query_id in hits_dict:
+            hits_dict[query_id].append(hit)
+        else:
+            hits_dict[query_id] = [hit]
+    
+    return hits_dict
+
+# Returns the aligned region of a hit: (align_len, qstart, qend, sstart, send),
+# with 1-based coordinates and sstart < send also for the minus strand
+def get_alignment(hit, query_len):
+    (subject, subject_len, sstart, strand, identity, coverage) = hit
+    
+    align_len = max(1, int(round(query_len*coverage)))
+    qstart = 1
+    qend = align_len
+    send = min(subject_len, sstart+align_len-1)
+    
+    return (align_len, qstart, qend, sstart, send)
+
+# Returns the value of an option (e.g. "-db path") of a command line
+def get_option(args, option, default = None):
+    value = default
+    
+    if option in args:
+        option_pos = args.index(option)
+        if option_pos+1 < len(args):
+            value = args[option_pos+1]
+    
+    return value
+
+## END
@@ -0,0 +1,277 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# bmap_bench.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+############################################
+# This script times barleymap end-to-end on the data
+# created with bmap_bench_data.py:
+# - find: as bmap_find, retrieving the queries IDs from the datasets
+#   (DatasetsRetriever and MappingsParser).
+# - align: as bmap_align, aligning the queries FASTA with the stand-in aligners
+#   and mapping the alignments (Mappers).
+# Each run is followed by the enrichment of the map and the output of the results
+# (to /dev/null), and the time of each stage is taken from metrics_utils.
+############################################
+
+import sys, os, traceback
+from optparse import OptionParser
+
+BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_PATH, "..", "src"))
+
+from barleymapcore.db.ConfigBase import ConfigBase
+from barleymapcore.db.PathsConfig import PathsConfig
+from barleymapcore.db.MapsConfig import MapsConfig
+from barleymapcore.db.DatabasesConfig import DatabasesConfig
+from barleymapcore.db.DatasetsConfig import DatasetsConfig
+from barleymapcore.alignment.AlignmentFacade import AlignmentFacade
+from barleymapcore.datasets.DatasetsFacade import DatasetsFacade
+from barleymapcore.annotators.GenesAnnotator import AnnotatorsFactory
+from barleymapcore.maps.MapMarkers import MapMarkers
+from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
+from barleymapcore.maps.enrichment.MapEnricher import SHOW_ON_INTERVALS
+
+from barleymapcore.output.OutputFacade import OutputFacade
+
+SCENARIO_FIND = "find"
+SCENARIO_ALIGN = "align"
+
+SHOW_GENES = "genes"
+SHOW_MARKERS = "markers"
+SHOW_ANCHORED = "anchored"
+SHOW_NONE = "none"
+
+QUERIES_FASTA = "queries.fasta"
+QUERIES_IDS = "queries.ids"
+METRICS_REPORT = "bmap_bench.json"
+
+DEFAULT_SCENARIOS = SCENARIO_FIND+","+SCENARIO_ALIGN
+DEFAULT_ALIGNER = "gmap"
+DEFAULT_SHOW = SHOW_GENES
+DEFAULT_RUNS = 3
+DEFAULT_THREADS = 1
+DEFAULT_DATASETS_THREADS = 1
+DEFAULT_THRES_ID = 98.0
+DEFAULT_THRES_COV = 95.0
+DEFAULT_EXTEND_WINDOW = 0.0
+
+## The configuration of the synthetic barleymap installation
+class BenchConfig(object):
+    _paths_config = None
+    _maps_config = None
+    _databases_config = None
+    _datasets_config = None
+    _annotator = None
+    
+    def __init__(self, data_path, verbose = False):
+        self._paths_config = PathsConfig()
+        self._paths_config.load_config(data_path)
+        app_path = self._paths_config.get_app_path()
+        
+        self._maps_config = MapsConfig(app_path+ConfigBase.MAPS_CONF)
+        self._databases_config = DatabasesConfig(app_path+ConfigBase.DATABASES_CONF, verbose)
+        self._datasets_config = DatasetsConfig(app_path+ConfigBase.DATASETS_CONF)
+        self._annotator = AnnotatorsFactory.get_annotator(app_path+ConfigBase.DATASETS_ANNOTATION_CONF,
+                                                          app_path+ConfigBase.ANNOTATION_TYPES_CONF,
+                                                          self._paths_config.get_annot_path(), verbose)
+    
+    def get_paths_config(self):
+        return self._paths_config
+    
+    def get_maps_config(self):
+        return self._maps_config
+    
+    def get_databases_config(self):
+        return self._databases_config
+    
+    def get_datasets_config(self):
+        return self._datasets_config
+    
+    def get_annotator(self):
+        return self._annotator
+
+# Enrichment and output of a map already created by map_markers
+def _enrich_and_print(map_markers, map_config, bench_config, datasets_facade, show, extend_window, output_printer):
+    show_genes = show == SHOW_GENES
+    show_markers = show == SHOW_MARKERS
+    show_anchored = show == SHOW_ANCHORED
+    annotator = bench_config.get_annotator() if show_genes else None
+    
+    if show != SHOW_NONE:
+        map_markers.enrichment(annotator, show_markers, show_genes, show_anchored, SHOW_ON_INTERVALS,
+                               datasets_facade, map_config.get_main_datasets(), extend_window, False,
+                               constrain_fine_mapping = False)
+    
+    mapping_results = map_markers.get_mapping_results()
+    
+    with metrics_utils.stage("output", map = map_config.get_name()):
+        if show_markers:
+            output_printer.print_map_with_markers(mapping_results.get_map_with_markers(), map_config, False)
+        elif show_genes:
+            output_printer.print_map_with_genes(mapping_results.get_map_with_genes(), map_config, False, True, annotator)
+        elif show_anchored:
+            output_printer.print_map_with_anchored(mapping_results.get_map_with_anchored(), map_config, False)
+        else:
+            output_printer.print_map(mapping_results.get_mapped(), map_config, False)
+        
+        output_printer.print_unmapped(mapping_results.get_unmapped(), map_config)
+        output_printer.print_unaligned(mapping_results.get_unaligned(), map_config)
+    
+    return
+
+def run_find(data_path, map_config, bench_config, show, extend_window, datasets_threads, output_printer, verbose):
+    paths_config = bench_config.get_paths_config()
+    datasets_config = bench_config.get_datasets_config()
+    datasets_facade = DatasetsFacade(datasets_config, paths_config.get_datasets_path(), paths_config.get_maps_path(),
+                                     verbose = verbose, n_threads = datasets_threads)
+    
+    sort_by = map_config.get_default_sort_by()
+    
+    map_markers = MapMarkers(paths_config.get_maps_path(), map_config, datasets_facade, verbose)
+    map_markers.retrieve_mappings(os.path.join(data_path, QUERIES_IDS), datasets_config.get_datasets_list(),
+                                  sort_by, False)
+    
+    _enrich_and_print(map_markers, map_config, bench_config, datasets_facade, show, extend_window, output_printer)
+    
+    return
+
+def run_align(data_path, map_config, bench_config, aligner_list, n_threads, show, extend_window, datasets_threads,
+              output_printer, verbose):
+    paths_config = bench_config.get_paths_config()
+    datasets_config = bench_config.get_datasets_config()
+    datasets_facade = DatasetsFacade(datasets_config, paths_config.get_datasets_path(), paths_config.get_maps_path(),
+                                     verbose = verbose, n_threads = datasets_threads)
+    
+    # A new facade for each run, so that the alignments are not reused from its cache
+    alignment_facade = AlignmentFacade(paths_config, verbose = verbose)
+    
+    sort_by = map_config.get_default_sort_by()
+    
+    map_markers = MapMarkers(paths_config.get_maps_path(), map_config, alignment_facade, verbose)
+    map_markers.perform_mappings(os.path.join(data_path, QUERIES_FASTA), map_config.get_db_list(),
+                                 bench_config.get_databases_config(), aligner_list,
+                                 DEFAULT_THRES_ID, DEFAULT_THRES_COV, n_threads,
+                                 False, sort_by, False, paths_config.get_tmp_files_path())
+    
+    _enrich_and_print(map_markers, map_config, bench_config, datasets_facade, show, extend_window, output_printer)
+    
+    return
+
+def print_summary(report, output_desc):
+    output_desc.write("#scenario\tmap\trun\twall_time\tcpu_time\tchildren_cpu_time\n")
+    for record in report["stages"]:
+        if record["name"] != "benchmark": continue
+        attrs = record["attrs"]
+        output_desc.write("\t".join([attrs["scenario"], attrs["map"], attrs["run"],
+                                     "%.3f" % record["wall_time"], "%.3f" % record["cpu_time"],
+                                     "%.3f" % record["children_cpu_time"]])+"\n")
+    
+    output_desc.write("#stage\tcalls\twall_time\tcpu_time\tchildren_cpu_time\n")
+    for (name, stage_summary) in sorted(report["summary"].items()):
+        if name == "benchmark": continue
+        output_desc.write("\t".join([name, str(stage_summary["calls"]),
+                                     "%.3f" % stage_summary["wall_time"], "%.3f" % stage_summary["cpu_time"],
+                                     "%.3f" % stage_summary["children_cpu_time"]])+"\n")
+    
+    output_desc.write("#counter\tvalue\n")
+    for (name, value) in sorted(report["counters"].items()):
+        output_desc.write(name+"\t"+str(value)+"\n")
+    
+    return
+
+############# BMAP_BENCH
+try:
+    
+    ## Usage
+    __usage = "usage: bmap_bench.py [OPTIONS] DATA_DIR\n\n"+\
+              "typical: bmap_bench.py --scenarios=align --aligner=gmap,blastn --runs=5 bench_data"
+    optParser = OptionParser(__usage)
+    
+    optParser.add_option('--scenarios', action='store', dest='scenarios', type='string', default=DEFAULT_SCENARIOS,
+                         help='Comma delimited list of scenarios: find, align (default "'+DEFAULT_SCENARIOS+'").')
+    optParser.add_option('--maps', action='store', dest='maps_param', type='string',
+                         help='Comma delimited list of maps (default: all the maps of the data).')
+    optParser.add_option('--aligner', action='store', dest='aligner', type='string', default=DEFAULT_ALIGNER,
+                         help='Comma delimited list of stand-in aligners for the align scenario: '+\
+                         'gmap, blastn, hsblastn, miniprot (default "'+DEFAULT_ALIGNER+'").')
+    optParser.add_option('--threads', action='store', dest='n_threads', type='int', default=DEFAULT_THREADS,
+                         help='Number of threads for the aligners (default '+str(DEFAULT_THREADS)+').')
+    optParser.add_option('--datasets-threads', action='store', dest='datasets_threads', type='int', default=DEFAULT_DATASETS_THREADS,
+                         help='Number of datasets read at the same time for the enrichment (default '+str(DEFAULT_DATASETS_THREADS)+').')
+    optParser.add_option('--show', action='store', dest='show', type='string', default=DEFAULT_SHOW,
+                         help='Enrichment of the maps: genes, markers, anchored or none (default "'+DEFAULT_SHOW+'").')
+    optParser.add_option('-e', '--extend', action='store', dest='extend_window', type='float', default=DEFAULT_EXTEND_WINDOW,
+                         help='Centimorgans or basepairs to extend the enrichment (default '+str(DEFAULT_EXTEND_WINDOW)+').')
+    optParser.add_option('--runs', action='store', dest='runs', type='int', default=DEFAULT_RUNS,
+                         help='Number of runs of each scenario and map (default '+str(DEFAULT_RUNS)+').')
+    optParser.add_option('--metrics', action='store', dest='metrics_path', type='string',
+                         help='JSON report of the time, CPU and memory of each stage (default DATA_DIR/'+METRICS_REPORT+').')
+    optParser.add_option('-v', '--verbose', action='store_true', dest='verbose', help='More information printed.')
+    
+    (options, arguments) = optParser.parse_args()
+    
+    if not arguments or len(arguments)==0:
+        optParser.exit(0, "You may wish to run '-help' option.\n")
+    
+    data_path = os.path.abspath(arguments[0])
+    verbose_param = options.verbose if options.verbose else False
+    
+    metrics_path = options.metrics_path if options.metrics_path else os.path.join(data_path, METRICS_REPORT)
+    metrics_utils.enable(metrics_path)
+    
+    scenarios = options.scenarios.strip().split(",")
+    for scenario in scenarios:
+        if scenario not in [SCENARIO_FIND, SCENARIO_ALIGN]:
+            raise m2pException("Unrecognized scenario "+scenario+".")
+    
+    if options.show not in [SHOW_GENES, SHOW_MARKERS, SHOW_ANCHORED, SHOW_NONE]:
+        raise m2pException("Unrecognized --show value "+options.show+".")
+    
+    aligner_list = options.aligner.strip().split(",")
+    
+    bench_config = BenchConfig(data_path, verbose_param)
+    maps_config = bench_config.get_maps_config()
+    if options.maps_param:
+        maps_ids = maps_config.get_maps_ids(options.maps_param.strip().split(","))
+    else:
+        maps_ids = sorted(maps_config.get_maps().keys())
+    
+    # The results are printed, but not kept
+    output_file = open(os.devnull, 'w')
+    output_printer = OutputFacade.get_expanded_printer(output_file, verbose = verbose_param, show_headers = True)
+    
+    for scenario in scenarios:
+        for map_id in maps_ids:
+            map_config = maps_config.get_map_config(map_id)
+            
+            for run in xrange(options.runs):
+                sys.stderr.write("bmap_bench: "+scenario+" on map "+map_id+", run "+str(run+1)+"\n")
+                
+                with metrics_utils.stage("benchmark", scenario = scenario, map = map_config.get_name(), run = run+1):
+                    if scenario == SCENARIO_FIND:
+                        run_find(data_path, map_config, bench_config, options.show, options.extend_window,
+                                 options.datasets_threads, output_printer, verbose_param)
+                    else:
+                        run_align(data_path, map_config, bench_config, aligner_list, options.n_threads,
+                                  options.show, options.extend_window, options.datasets_threads,
+                                  output_printer, verbose_param)
+    
+    output_file.close()
+    
+    print_summary(metrics_utils.get_report(), sys.stdout)
+
+except m2pException as m2pe:
+    sys.stderr.write("\nThere was an error.\n")
+    sys.stderr.write(m2pe.msg+"\n")
+    sys.exit(1)
+except Exception as e:
+    sys.stderr.write("\nThere was an error.\n")
+    sys.stderr.write(str(e)+"\n")
+    traceback.print_exc(file=sys.stderr)
+    sys.exit(1)
+
+## END
@@ -0,0 +1,395 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# bmap_bench_data.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+############################################
+# This script creates a synthetic barleymap installation
+# (paths.conf, conf files, maps, datasets, annotation and databases)
+# and the queries (FASTA and IDs) to be used by bmap_bench.py.
+#
+# The genome has --chroms chromosomes tiled by --contigs contigs,
+# and two maps are configured:
+# - "Physical": a physical map of the chromosomes (database "genome").
+# - "Anchored": a genetic/physical map of the contigs (database "contigs").
+# The markers and genes datasets have files for both maps.
+#
+# The databases are not real: the alignments of the queries are written
+# to a "<db>.hits" file, which is read by the stand-in aligners (aligners/).
+############################################
+
+import sys, os, random
+from optparse import OptionParser
+
+BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+ALIGNERS_PATH = os.path.join(BENCH_PATH, "aligners")
+ANNOTATION_TYPES_PATH = os.path.join(BENCH_PATH, "..", "conf", "annotation_types.conf")
+
+GENOME_DB = "genome"
+CONTIGS_DB = "contigs"
+PHYSICAL_MAP = "physical"
+ANCHORED_MAP = "anchored"
+MARKERS_DATASET = "markers"
+GENES_DATASET = "genes"
+
+QUERIES_FASTA = "queries.fasta"
+QUERIES_IDS = "queries.ids"
+
+DEFAULT_CHROMS = 7
+DEFAULT_CHROM_LENGTH = 500000000
+DEFAULT_CHROM_CM = 150.0
+DEFAULT_CONTIGS = 20000
+DEFAULT_MARKERS = 20000
+DEFAULT_GENES = 30000
+DEFAULT_QUERIES = 5000
+DEFAULT_QUERY_LENGTH = 300
+DEFAULT_MULTIPLE = 0.02
+DEFAULT_UNALIGNED = 0.1
+DEFAULT_SEED = 1
+
+GENE_MIN_LENGTH = 1000
+GENE_MAX_LENGTH = 10000
+GO_TERMS = 5000
+GENE_CLASSES = ["HC_G", "HC_u", "LC_u", "LC_te_frag"]
+
+## A feature (marker or gene) of the synthetic genome
+class Feature(object):
+    _feature_id = ""
+    _positions = None # [(chrom_num, start, end, strand), ...]
+    
+    def __init__(self, feature_id, positions):
+        self._feature_id = feature_id
+        self._positions = positions
+    
+    def get_feature_id(self):
+        return self._feature_id
+    
+    def get_positions(self):
+        return self._positions
+
+## The chromosomes and contigs of the synthetic genome
+class Genome(object):
+    _num_chroms = 0
+    _chrom_length = 0
+    _chrom_cm = 0.0
+    _contigs_per_chrom = 0
+    _contig_length = 0
+    
+    def __init__(self, num_chroms, chrom_length, chrom_cm, num_contigs):
+        self._num_chroms = num_chroms
+        self._chrom_length = chrom_length
+        self._chrom_cm = chrom_cm
+        self._contigs_per_chrom = max(1, num_contigs / num_chroms)
+        self._contig_length = chrom_length / self._contigs_per_chrom
+    
+    def get_chrom_name(self, chrom_num):
+        return "chr"+str(chrom_num)+"H"
+    
+    def get_chroms(self):
+        return range(1, self._num_chroms+1)
+    
+    def get_chrom_length(self):
+        return self._chrom_length
+    
+    def get_chrom_cm(self):
+        return self._chrom_cm
+    
+    def get_contig_length(self):
+        return self._contig_length
+    
+    def get_contigs(self, chrom_num):
+        return range(self._contigs_per_chrom)
+    
+    def get_contig_id(self, chrom_num, contig_num):
+        return "contig_%07d" % ((chrom_num-1)*self._contigs_per_chrom+contig_num+1)
+    
+    # Returns (contig_num, offset within the contig) of a position of a chromosome
+    def get_contig_pos(self, pos):
+        contig_num = min((pos-1) / self._contig_length, self._contigs_per_chrom-1)
+        return (contig_num, pos-contig_num*self._contig_length)
+    
+    # Returns (cm, bp) of the contig in the anchored map
+    def get_contig_map_pos(self, contig_num):
+        bp_pos = contig_num*self._contig_length+1
+        cm_pos = round(float(bp_pos)/self._chrom_length*self._chrom_cm, 4)
+        return (cm_pos, bp_pos)
+
+def _write_lines(file_path, lines):
+    with open(file_path, 'w') as output_file:
+        for line in lines:
+            output_file.write(line+"\n")
+    
+    return
+
+def _create_features(genome, prefix, num_features, min_length, max_length, multiple, rand):
+    features = []
+    
+    for feature_num in xrange(num_features):
+        num_positions = 2 if rand.random() < multiple else 1
+        positions = []
+        for position_num in xrange(num_positions):
+            chrom_num = rand.choice(genome.get_chroms())
+            feature_length = rand.randint(min_length, max_length)
+            start = rand.randint(1, genome.get_chrom_length()-feature_length)
+            strand = rand.choice(["+", "-"])
+            positions.append((chrom_num, start, start+feature_length-1, strand))
+        
+        features.append(Feature(prefix+"_%07d" % (feature_num+1), positions))
+    
+    return features
+
+def write_paths_conf(app_path, dbs_path):
+    aligner_path = lambda aligner: os.path.join(ALIGNERS_PATH, "standin_"+aligner+".py")
+    
+    paths_conf = [("app_path", app_path),
+                  ("genmap_path", "app_aux/"),
+                  ("split_blast_path", "app_aux/"),
+                  ("tmp_files_path", app_path+"tmp_files"),
+                  ("datasets_path", app_path+"datasets/"),
+                  ("annot_path", app_path+"datasets_annotation/"),
+                  ("maps_path", app_path+"maps/"),
+                  ("blastn_app_path", aligner_path("blastn")),
+                  ("blastn_dbs_path", dbs_path),
+                  ("gmap_app_path", aligner_path("gmap")),
+                  ("gmap_dbs_path", dbs_path),
+                  ("gmapl_app_path", aligner_path("gmap")),
+                  ("hsblastn_app_path", aligner_path("hsblastn")),
+                  ("hsblastn_dbs_path", dbs_path),
+                  ("miniprot_app_path", aligner_path("miniprot")),
+                  ("miniprot_dbs_path", dbs_path),
+                  ("align2graph_app_path", "none"),
+                  ("align2graph_dbs_path", "none"),
+                  ("citation", "none"),
+                  ("stdalone_app", "none")]
+    
+    _write_lines(app_path+"paths.conf", ["# Created by bmap_bench_data.py"]+[" ".join(entry) for entry in paths_conf])
+    
+    return
+
+def write_conf_files(app_path):
+    conf_path = app_path+"conf/"
+    
+    _write_lines(conf_path+"databases.conf", ["# name unique_id type",
+                                              "Genome "+GENOME_DB+" std",
+                                              "Contigs "+CONTIGS_DB+" std"])
+    
+    main_datasets = MARKERS_DATASET+","+GENES_DATASET
+    _write_lines(conf_path+"maps.conf", ["# name id has_cm has_bp default_pos_type map_type search_type db_list folder_name main_datasets",
+                                         "Physical "+PHYSICAL_MAP+" cm_false bp_true bp physical greedy "+GENOME_DB+" "+PHYSICAL_MAP+" "+main_datasets,
+                                         "Anchored "+ANCHORED_MAP+" cm_true bp_true cm anchored greedy "+CONTIGS_DB+" "+ANCHORED_MAP+" "+main_datasets])
+    
+    _write_lines(conf_path+"datasets.conf", ["# name unique_id type filename file_type db_list synonyms_file records_prefix",
+                                             "Markers "+MARKERS_DATASET+" genetic_marker "+QUERIES_FASTA+" fna ANY no no",
+                                             "Genes "+GENES_DATASET+" gene genes.gtf gtf ANY no no"])
+    
+    _write_lines(conf_path+"datasets_annotation.conf", ["# name unique_id dataset_unique_id filename type",
+                                                        "Genes_desc genes_desc "+GENES_DATASET+" genes.desc.tab txt",
+                                                        "Genes_class genes_class "+GENES_DATASET+" genes.class.tab class",
+                                                        "Genes_go genes_go "+GENES_DATASET+" genes.go.tab go"])
+    
+    _write_lines(conf_path+"annotation_types.conf", [line.rstrip("\n") for line in open(ANNOTATION_TYPES_PATH, 'r')])
+    
+    return
+
+def write_maps(app_path, genome):
+    physical_path = app_path+"maps/"+PHYSICAL_MAP+"/"
+    anchored_path = app_path+"maps/"+ANCHORED_MAP+"/"
+    os.makedirs(physical_path)
+    os.makedirs(anchored_path)
+    
+    _write_lines(physical_path+PHYSICAL_MAP+".chrom",
+                 [genome.get_chrom_name(chrom_num)+"\t"+str(chrom_num)+"\t"+str(genome.get_chrom_length())
+                  for chrom_num in genome.get_chroms()])
+    
+    _write_lines(anchored_path+ANCHORED_MAP+".chrom",
+                 [genome.get_chrom_name(chrom_num)+"\t"+str(chrom_num)+"\t"+str(genome.get_chrom_cm())+"\t"+str(genome.get_chrom_length())
+                  for chrom_num in genome.get_chroms()])
+    
+    with open(anchored_path+ANCHORED_MAP+"."+CONTIGS_DB, 'w') as map_file:
+        map_file.write(">"+ANCHORED_MAP+"\n")
+        map_file.write("#contig\tchr\tcM\tbp\tmultiple_positions\tother_alignments\n")
+        for chrom_num in genome.get_chroms():
+            for contig_num in genome.get_contigs(chrom_num):
+                (cm_pos, bp_pos) = genome.get_contig_map_pos(contig_num)
+                map_file.write("\t".join([genome.get_contig_id(chrom_num, contig_num), genome.get_chrom_name(chrom_num),
+                                          str(cm_pos), str(bp_pos), "No", "No"])+"\n")
+    
+    return
+
+# A dataset file for each map, with the rows sorted by chromosome and position
+def write_dataset(app_path, dataset, features, genome):
+    dataset_path = app_path+"datasets/"+dataset+"/"
+    os.makedirs(dataset_path)
+    
+    physical_rows = []
+    anchored_rows = []
+    for feature in features:
+        positions = feature.get_positions()
+        multiple = "Yes" if len(positions) > 1 else "No"
+        
+        for (chrom_num, start, end, strand) in positions:
+            physical_rows.append((chrom_num, start, end, feature.get_feature_id(), strand, multiple))
+            
+            (contig_num, offset) = genome.get_contig_pos(start)
+            (cm_pos, bp_pos) = genome.get_contig_map_pos(contig_num)
+            anchored_rows.append((chrom_num, cm_pos, bp_pos, feature.get_feature_id(), multiple))
+    
+    physical_rows.sort()
+    anchored_rows.sort()
+    
+    with open(dataset_path+dataset+"."+PHYSICAL_MAP, 'w') as dataset_file:
+        dataset_file.write(">"+PHYSICAL_MAP+"\n")
+        for (chrom_num, start, end, feature_id, strand, multiple) in physical_rows:
+            dataset_file.write("\t".join([feature_id, genome.get_chrom_name(chrom_num), str(start), str(end),
+                                          strand, multiple, multiple])+"\n")
+    
+    with open(dataset_path+dataset+"."+ANCHORED_MAP, 'w') as dataset_file:
+        dataset_file.write(">"+ANCHORED_MAP+"\n")
+        for (chrom_num, cm_pos, bp_pos, feature_id, multiple) in anchored_rows:
+            dataset_file.write("\t".join([feature_id, genome.get_chrom_name(chrom_num), str(cm_pos), str(bp_pos),
+                                          multiple, multiple])+"\n")
+    
+    return
+
+def write_annotation(app_path, genes, rand):
+    annot_path = app_path+"datasets_annotation/"
+    os.makedirs(annot_path)
+    
+    with open(annot_path+"genes.desc.tab", 'w') as desc_file, \
+         open(annot_path+"genes.class.tab", 'w') as class_file, \
+         open(annot_path+"genes.go.tab", 'w') as go_file:
+        
+        for gene in genes:
+            gene_id = gene.get_feature_id()
+            desc_file.write(gene_id+"\tSynthetic protein "+str(rand.randint(1, 1000))+"\n")
+            class_file.write(gene_id+"\t"+rand.choice(GENE_CLASSES)+"\n")
+            for go_num in xrange(rand.randint(0, 4)):
+                go_file.write(gene_id+"\tGO:%07d\n" % rand.randint(1, GO_TERMS))
+    
+    return
+
+# Queries are sequences of markers (aligned to the positions of the marker)
+# and other sequences without alignments
+def write_queries(app_path, markers, genes, num_queries, query_length, unaligned, rand):
+    num_unaligned = int(num_queries*unaligned)
+    query_markers = rand.sample(markers, min(len(markers), num_queries-num_unaligned))
+    query_ids = [marker.get_feature_id() for marker in query_markers]+\
+                ["unaligned_%07d" % (query_num+1) for query_num in xrange(num_unaligned)]
+    
+    with open(app_path+QUERIES_FASTA, 'w') as fasta_file:
+        for query_id in query_ids:
+            sequence = "".join([rand.choice("ACGT") for i in xrange(query_length)])
+            fasta_file.write(">"+query_id+"\n")
+            for line_start in xrange(0, query_length, 60):
+                fasta_file.write(sequence[line_start:line_start+60]+"\n")
+    
+    # The IDs also include genes, to be found in the genes dataset
+    query_genes = rand.sample(genes, min(len(genes), num_queries/10))
+    _write_lines(app_path+QUERIES_IDS, query_ids+[gene.get_feature_id() for gene in query_genes])
+    
+    return query_markers
+
+# The hits of the queries for the stand-in aligners,
+# and empty files for the databases checks of barleymap
+def write_databases(dbs_path, query_markers, genome, rand):
+    for db in [GENOME_DB, CONTIGS_DB]:
+        for db_ext in [".nsq", ".bwt", ".mpi"]:
+            open(dbs_path+db+db_ext, 'w').close()
+        os.makedirs(dbs_path+db)
+        open(dbs_path+db+"/"+db+".ref153positions", 'w').close()
+    
+    with open(dbs_path+GENOME_DB+".hits", 'w') as genome_hits, \
+         open(dbs_path+CONTIGS_DB+".hits", 'w') as contigs_hits:
+        
+        for marker in query_markers:
+            marker_id = marker.get_feature_id()
+            for (chrom_num, start, end, strand) in marker.get_positions():
+                # Most of the hits pass the default thresholds of barleymap
+                identity = "%.2f" % (rand.uniform(98.0, 100.0) if rand.random() < 0.9 else rand.uniform(90.0, 98.0))
+                coverage = "1.0" if rand.random() < 0.9 else "%.2f" % rand.uniform(0.95, 1.0)
+                
+                genome_hits.write("\t".join([marker_id, genome.get_chrom_name(chrom_num), str(genome.get_chrom_length()),
+                                             str(start), strand, identity, coverage])+"\n")
+                
+                (contig_num, offset) = genome.get_contig_pos(start)
+                contigs_hits.write("\t".join([marker_id, genome.get_contig_id(chrom_num, contig_num), str(genome.get_contig_length()),
+                                              str(offset), strand, identity, coverage])+"\n")
+    
+    return
+
+############# BMAP_BENCH_DATA
+try:
+    
+    ## Usage
+    __usage = "usage: bmap_bench_data.py [OPTIONS] OUTPUT_DIR\n\n"+\
+              "typical: bmap_bench_data.py --markers=100000 --queries=20000 bench_data"
+    optParser = OptionParser(__usage)
+    
+    optParser.add_option('--chroms', action='store', dest='chroms', type='int', default=DEFAULT_CHROMS,
+                         help='Number of chromosomes (default '+str(DEFAULT_CHROMS)+').')
+    optParser.add_option('--chrom-length', action='store', dest='chrom_length', type='int', default=DEFAULT_CHROM_LENGTH,
+                         help='Length of each chromosome in bp (default '+str(DEFAULT_CHROM_LENGTH)+').')
+    optParser.add_option('--contigs', action='store', dest='contigs', type='int', default=DEFAULT_CONTIGS,
+                         help='Number of contigs of the anchored map (default '+str(DEFAULT_CONTIGS)+').')
+    optParser.add_option('--markers', action='store', dest='markers', type='int', default=DEFAULT_MARKERS,
+                         help='Number of markers of the markers dataset (default '+str(DEFAULT_MARKERS)+').')
+    optParser.add_option('--genes', action='store', dest='genes', type='int', default=DEFAULT_GENES,
+                         help='Number of genes of the genes dataset (default '+str(DEFAULT_GENES)+').')
+    optParser.add_option('--queries', action='store', dest='queries', type='int', default=DEFAULT_QUERIES,
+                         help='Number of sequences of the query FASTA (default '+str(DEFAULT_QUERIES)+').')
+    optParser.add_option('--query-length', action='store', dest='query_length', type='int', default=DEFAULT_QUERY_LENGTH,
+                         help='Length of the query sequences (default '+str(DEFAULT_QUERY_LENGTH)+').')
+    optParser.add_option('--multiple', action='store', dest='multiple', type='float', default=DEFAULT_MULTIPLE,
+                         help='Fraction of features with 2 positions (default '+str(DEFAULT_MULTIPLE)+').')
+    optParser.add_option('--unaligned', action='store', dest='unaligned', type='float', default=DEFAULT_UNALIGNED,
+                         help='Fraction of queries without alignments (default '+str(DEFAULT_UNALIGNED)+').')
+    optParser.add_option('--seed', action='store', dest='seed', type='int', default=DEFAULT_SEED,
+                         help='Seed of the random numbers, to create the same data again (default '+str(DEFAULT_SEED)+').')
+    
+    (options, arguments) = optParser.parse_args()
+    
+    if not arguments or len(arguments)==0:
+        optParser.exit(0, "You may wish to run '-help' option.\n")
+    
+    app_path = os.path.abspath(arguments[0])+"/"
+    if os.path.exists(app_path):
+        raise Exception("Output directory "+app_path+" already exists.")
+    
+    dbs_path = app_path+"dbs/"
+    for dir_path in [app_path, app_path+"conf", app_path+"tmp_files", dbs_path]:
+        os.makedirs(dir_path)
+    
+    rand = random.Random(options.seed)
+    
+    genome = Genome(options.chroms, options.chrom_length, DEFAULT_CHROM_CM, options.contigs)
+    
+    sys.stderr.write("bmap_bench_data: creating configuration...\n")
+    write_paths_conf(app_path, dbs_path)
+    write_conf_files(app_path)
+    
+    sys.stderr.write("bmap_bench_data: creating maps...\n")
+    write_maps(app_path, genome)
+    
+    sys.stderr.write("bmap_bench_data: creating datasets...\n")
+    markers = _create_features(genome, "marker", options.markers, options.query_length, options.query_length,
+                               options.multiple, rand)
+    genes = _create_features(genome, "gene", options.genes, GENE_MIN_LENGTH, GENE_MAX_LENGTH,
+                             options.multiple, rand)
+    write_dataset(app_path, MARKERS_DATASET, markers, genome)
+    write_dataset(app_path, GENES_DATASET, genes, genome)
+    write_annotation(app_path, genes, rand)
+    
+    sys.stderr.write("bmap_bench_data: creating queries and databases...\n")
+    query_markers = write_queries(app_path, markers, genes, options.queries, options.query_length, options.unaligned, rand)
+    write_databases(dbs_path, query_markers, genome, rand)
+    
+    sys.stderr.write("bmap_bench_data: data created at "+app_path+"\n")
+
+except Exception as e:
+    sys.stderr.write("\nThere was an error.\n")
+    sys.stderr.write(str(e)+"\n")
+    sys.exit(1)
+
+## END
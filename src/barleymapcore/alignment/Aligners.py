@@ -8,12 +8,13 @@
 # Copyright (C) 2025 Bruno Contreras Moreira and Joan Sarria
 # (terms of use can be found within the distributed LICENSE file).
 
-import os, sys
+import os, sys, glob, threading
 
 from barleymapcore.alignment import m2p_split_blast, m2p_gmap, m2p_hsblastn, m2p_miniprot, m2p_align2graph
 import barleymapcore.utils.alignment_utils as alignment_utils
+import barleymapcore.utils.metrics_utils as metrics_utils
 from barleymapcore.m2p_exception import m2pException
-from barleymapcore.db.DatabasesConfig import REF_TYPE_STD, REF_TYPE_BIG, DatabasesConfig
+from barleymapcore.db.DatabasesConfig import REF_TYPE_STD, REF_TYPE_BIG, DEFAULT_BATCH_MODE, DatabasesConfig
 
 ALIGNER_BLASTN = "blastn"
 ALIGNER_GMAP = "gmap"
@@ -21,6 +22,10 @@ ALIGNER_HSBLASTN = "hsblastn"
 ALIGNER_MINIPROT = "miniprot"
 ALIGNER_ALIGN2GRAPH = "align2graph"
 
+# Min number of queries without hits in an aligner which are passed at once
+# to the next one while the former is still running (see ListAligner)
+PIPELINE_BATCH_SIZE = 100
+
 class AlignersFactory(object):
     
     @staticmethod
@@ -43,7 +48,7 @@ class AlignersFactory(object):
         return aligner
     
     @staticmethod
-    def get_aligner_gmap(paths_config, n_threads, verbose):
+    def get_aligner_gmap(paths_config, n_threads, verbose, databases_config = None):
         
         gmapl_app_path = paths_config.get_gmapl_app_path()
         gmap_app_path = paths_config.get_gmap_app_path()
@@ -53,7 +58,7 @@ class AlignersFactory(object):
         # once that ref_type of each given DB is obtained
         # or through ref_type_param when using DBs not configured (--databases-ids)
         
-        aligner = GMAPAligner(gmap_app_path, gmapl_app_path, n_threads, gmap_dbs_path, verbose)
+        aligner = GMAPAligner(gmap_app_path, gmapl_app_path, n_threads, gmap_dbs_path, verbose, databases_config)
         
         return aligner
 
@@ -79,7 +84,8 @@ class AlignersFactory(object):
 
     @staticmethod
     # Returns a new aligner based on the query_type supplied
-    def get_aligner(aligner_list, n_threads, paths_config, verbose = False): # This is an AlignerFactory
+    # databases_config (optional) is used to obtain options of each DB (e.g. batch mode of GMAP)
+    def get_aligner(aligner_list, n_threads, paths_config, verbose = False, databases_config = None): # This is an AlignerFactory
         
         aligner = None
         
@@ -91,13 +97,13 @@ class AlignersFactory(object):
             for aligner_name in aligner_list:
                 
                 try:
-                    aligner = AlignersFactory.get_aligner([aligner_name], n_threads, paths_config, verbose)
+                    aligner = AlignersFactory.get_aligner([aligner_name], n_threads, paths_config, verbose, databases_config)
                     aligners.append(aligner)
                     
                 except m2pException:
                     sys.stderr.write("WARNING: exception obtaining "+aligner_name+".\nSkipping to next aligner.\n")
                 
-            aligner = ListAligner(aligners, tmp_files_dir)
+            aligner = ListAligner(aligners, tmp_files_dir, int(paths_config.get_pipeline_batch_size()))
             
         else:
             aligner_name = aligner_list[0]
@@ -107,7 +113,7 @@ class AlignersFactory(object):
                 
             elif aligner_name == ALIGNER_GMAP:
                 
-                aligner = AlignersFactory.get_aligner_gmap(paths_config, n_threads, verbose)
+                aligner = AlignersFactory.get_aligner_gmap(paths_config, n_threads, verbose, databases_config)
                 
             elif aligner_name == ALIGNER_HSBLASTN:
                 
@@ -128,6 +134,10 @@ class AlignersFactory(object):
 
 class BaseAligner(object):
     
+    # Aligners which report the queries without hits while still aligning,
+    # through the unaligned_callback argument of align (see ListAligner)
+    REPORTS_UNALIGNED = False
+    
     _app_path = ""
     _n_threads = 1
     _dbs_path = ""
@@ -150,6 +160,32 @@ class BaseAligner(object):
     def get_unaligned(self):
         return self._results_unaligned
     
+    def get_n_threads(self):
+        return self._n_threads
+    
+    def set_n_threads(self, n_threads):
+        self._n_threads = n_threads
+    
+    # The files of a DB: the DB itself and those with its name plus an extension
+    # (but not those of other DBs whose name starts with this one, e.g. genome_v2 for genome)
+    def get_db_files(self, db):
+        db_path = os.path.join(self._dbs_path, db)
+        db_files = [db_path] + glob.glob(db_path+".*")
+        
+        return sorted([db_file for db_file in db_files if os.path.isfile(db_file)])
+    
+    # Identifies the current files of a DB (name, size and modification time),
+    # so that cached alignments to a DB which has been rebuilt are not reused
+    def get_db_fingerprint(self, db):
+        db_files = self.get_db_files(db)
+        
+        fingerprint = []
+        for db_file in db_files:
+            db_stat = os.stat(db_file)
+            fingerprint.append(os.path.basename(db_file)+":"+str(db_stat.st_size)+":"+str(int(db_stat.st_mtime)))
+        
+        return ",".join(fingerprint)
+    
 class SplitBlastnAligner(BaseAligner):
     _split_blast_path = ""
     
@@ -183,14 +219,27 @@ class SplitBlastnAligner(BaseAligner):
     
 class GMAPAligner(BaseAligner):
     
+    REPORTS_UNALIGNED = True
+    
     _gmapl_app_path = None
+    _databases_config = None
     
-    def __init__(self, app_path, gmapl_app_path, n_threads, dbs_path, verbose = False):
+    def __init__(self, app_path, gmapl_app_path, n_threads, dbs_path, verbose = False, databases_config = None):
         
         BaseAligner.__init__(self, app_path, n_threads, dbs_path, verbose)
         self._gmapl_app_path = gmapl_app_path
+        self._databases_config = databases_config
     
-    def align(self, fasta_path, db, ref_type, threshold_id, threshold_cov):
+    # The files of a GMAP DB are within its directory
+    def get_db_files(self, db):
+        db_dir = os.path.join(self._dbs_path, db)
+        if not os.path.isdir(db_dir): return []
+        
+        db_files = [os.path.join(db_dir, file_name) for file_name in os.listdir(db_dir)]
+        
+        return sorted([db_file for db_file in db_files if os.path.isfile(db_file)])
+    
+    def align(self, fasta_path, db, ref_type, threshold_id, threshold_cov, unaligned_callback = None):
         
         sys.stderr.write("\n")
         
@@ -207,10 +256,15 @@ class GMAPAligner(BaseAligner):
         else:
             raise m2pException("GMAPAligner: Unrecognized ref type "+ref_type+".")
         
+        if self._databases_config != None:
+            batch_mode = self._databases_config.get_database_batch_mode(db)
+        else:
+            batch_mode = DEFAULT_BATCH_MODE
+        
         # get_hits from m2p_gmap.py
         self._results_hits = m2p_gmap.get_best_score_hits(app_path, self._n_threads, fasta_path, self._dbs_path, db,
                                       threshold_id, threshold_cov, \
-                                      self._verbose)
+                                      self._verbose, unaligned_callback, batch_mode)
         
         query_list = [a.get_query_id() for a in self._results_hits]
         
@@ -322,43 +376,159 @@ class ListAligner(BaseAligner):
     _blastn_hits = []
     _gmap_hits = []
     _tmp_files_dir = ""
+    _min_batch_size = PIPELINE_BATCH_SIZE
     
-    def __init__(self, aligner_list, tmp_files_dir):
+    def __init__(self, aligner_list, tmp_files_dir, min_batch_size = PIPELINE_BATCH_SIZE):
         self._aligner_list = aligner_list
         self._tmp_files_dir = tmp_files_dir
+        self._min_batch_size = min_batch_size
+    
+    def get_db_fingerprint(self, db):
+        return ";".join([aligner.get_db_fingerprint(db) for aligner in self._aligner_list])
         
     def align(self, fasta_path, db, ref_type, threshold_id, threshold_cov):
         fasta_to_align = fasta_path
         
+        self._results_hits = []
+        self._results_unaligned = alignment_utils.filter_list(alignment_utils.get_fasta_headers(fasta_to_align), [])
+        
         prev_aligner_to_align = fasta_to_align
-        fasta_created = False
         
-        try:
-            for aligner in self._aligner_list:
-                if self._verbose: sys.stderr.write("ListAligner: "+str(aligner)+"\n")
-                
-                try:
-                    aligner.align(prev_aligner_to_align, db, ref_type, threshold_id, threshold_cov)
-                except m2pException as m2pe:
-                    sys.stderr.write("\t"+m2pe.msg+"\n")
-                    sys.stderr.write("\tContinuing with next aligner...\n")
-                    continue
-                
-                prev_aligner_to_align = alignment_utils.extract_fasta_headers(fasta_path,
-                                                                              aligner.get_unaligned(), self._tmp_files_dir)
-                fasta_created = True
+        aligner_num = 0
+        while aligner_num < len(self._aligner_list):
+            aligner = self._aligner_list[aligner_num]
+            aligner_num += 1
+            
+            if self._verbose: sys.stderr.write("ListAligner: "+str(aligner)+"\n")
+            
+            try:
+                # The next aligner is started on the queries without hits
+                # while this aligner is still running
+                if aligner.REPORTS_UNALIGNED and aligner_num < len(self._aligner_list):
+                    next_aligner = self._aligner_list[aligner_num]
+                    with metrics_utils.stage("aligner", db = db,
+                                             aligner = aligner.__class__.__name__+","+next_aligner.__class__.__name__):
+                        (hits, unaligned) = self._align_pipelined(aligner, next_aligner, prev_aligner_to_align,
+                                                                  db, ref_type, threshold_id, threshold_cov)
+                    aligner_num += 1
+                else:
+                    with metrics_utils.stage("aligner", db = db, aligner = aligner.__class__.__name__):
+                        aligner.align(prev_aligner_to_align, db, ref_type, threshold_id, threshold_cov)
+                    hits = aligner.get_hits()
+                    unaligned = aligner.get_unaligned()
+                    
+            except m2pException as m2pe:
+                sys.stderr.write("\t"+m2pe.msg+"\n")
+                sys.stderr.write("\tContinuing with next aligner...\n")
+                continue
+            
+            # The unaligned queries are passed to the next aligner through its stdin
+            prev_aligner_to_align = alignment_utils.get_fasta_subset(fasta_path, unaligned)
+            
+            sys.stderr.write("ListAligner: hits "+str(len(hits))+"\n")
+            
+            self._results_hits = self._results_hits + hits
+            self._results_unaligned = unaligned
+            if len(self._results_unaligned) == 0: break # CPCantalapiedra 201701
+        
+        return self.get_hits()
+    
+    # Aligns the queries with aligner and, in another thread, the queries without hits
+    # with next_aligner, in batches, as aligner reports them.
+    # Each batch takes all the queries reported while the previous one was being aligned,
+    # and no less than min_batch_size of them while aligner is running,
+    # since next_aligner loads its DB again on each batch.
+    # The threads are split between both aligners while both of them are running.
+    # Returns the hits of both aligners and the queries without hits from both of them
+    def _align_pipelined(self, aligner, next_aligner, fasta_path, db, ref_type, threshold_id, threshold_cov):
+        
+        n_threads = aligner.get_n_threads()
+        next_n_threads = next_aligner.get_n_threads()
+        
+        pending = []
+        reported = set()
+        # Not empty once aligner has finished
+        finished = []
+        pending_cond = threading.Condition()
+        next_hits = []
+        next_errors = []
+        
+        # Waits for enough queries without hits, or for aligner to finish,
+        # and returns all of them (empty when there are no more queries)
+        def get_batch():
+            with pending_cond:
+                while len(pending) < self._min_batch_size and len(finished) == 0:
+                    pending_cond.wait()
                 
-                sys.stderr.write("ListAligner: hits "+str(len(aligner.get_hits()))+"\n")
+                batch = list(pending)
+                del pending[:]
                 
-                self._results_hits = self._results_hits + aligner.get_hits()
-                self._results_unaligned = aligner.get_unaligned()
-                if len(self._results_unaligned) == 0: break # CPCantalapiedra 201701
+                return batch
         
-        except Exception:
-            raise
+        def align_batches():
+            while True:
+                batch = get_batch()
+                if len(batch) == 0: break
+                if len(next_errors) > 0: continue
+                
+                try:
+                    metrics_utils.count("alignment.pipeline_batches")
+                    next_aligner.align(alignment_utils.get_fasta_subset(fasta_path, batch), db, ref_type, threshold_id, threshold_cov)
+                    next_hits.extend(next_aligner.get_hits())
+                except Exception as e:
+                    next_errors.append(e)
+        
+        def unaligned_callback(query_id):
+            with pending_cond:
+                reported.add(query_id)
+                pending.append(query_id)
+                if len(pending) >= self._min_batch_size:
+                    pending_cond.notify()
+        
+        worker_n_threads = max(1, next_n_threads / 2)
+        aligner.set_n_threads(max(1, n_threads - worker_n_threads))
+        next_aligner.set_n_threads(worker_n_threads)
+        
+        worker = threading.Thread(target=align_batches)
+        worker.daemon = True
+        worker.start()
+        
+        remaining = []
+        try:
+            aligner.align(fasta_path, db, ref_type, threshold_id, threshold_cov, unaligned_callback)
+            
+            hits = aligner.get_hits()
+            unaligned = aligner.get_unaligned()
+            
+            # Queries without hits which were not reported while aligning
+            remaining = [query_id for query_id in unaligned if query_id not in reported]
+            
         finally:
-            if fasta_created: os.remove(prev_aligner_to_align)
+            # The remaining batches can use all the threads
+            with pending_cond:
+                next_aligner.set_n_threads(next_n_threads)
+                pending.extend(remaining)
+                finished.append(True)
+                pending_cond.notify()
             
-        return self.get_hits()
+            worker.join()
+            aligner.set_n_threads(n_threads)
+        
+        for error in next_errors:
+            if isinstance(error, m2pException):
+                sys.stderr.write("\t"+error.msg+"\n")
+                sys.stderr.write("\tContinuing with next aligner...\n")
+                return (hits, unaligned)
+            else:
+                raise error
+        
+        # Only hits of queries which are unaligned by the first aligner
+        unaligned_set = set(unaligned)
+        next_hits = [hit for hit in next_hits if hit.get_query_id() in unaligned_set]
+        
+        next_aligned = set([hit.get_query_id() for hit in next_hits])
+        next_unaligned = [query_id for query_id in unaligned if query_id not in next_aligned]
+        
+        return (hits + next_hits, next_unaligned)
  
 ##
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# AlignmentCache.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+import sys, os, hashlib, marshal, tempfile, fcntl
+
+from barleymapcore.alignment.AlignmentResult import AlignmentResult
+from barleymapcore.alignment.GraphAlignmentResult import GraphAlignmentResult
+from barleymapcore.utils.alignment_utils import FastaSubset
+
+READ_BUFFER_SIZE = 1024*1024
+
+# Types of records in the DiskAlignmentCache
+RECORD_ALIGNMENT = "A"
+RECORD_GRAPH = "G"
+
+## This class keeps the hits and unaligned queries
+## of each alignment of a FASTA file to a database,
+## so that several maps which use the same database
+## do not align the same sequences again.
+## The FASTA file is identified by the digest of its content.
+class AlignmentCache(object):
+    
+    _cache = None
+    _verbose = False
+    
+    def __init__(self, verbose = False):
+        self._cache = {}
+        self._verbose = verbose
+    
+    # fasta can be also a FastaSubset, whose records are digested
+    @staticmethod
+    def get_fasta_digest(fasta):
+        digest = hashlib.sha1()
+        
+        if isinstance(fasta, FastaSubset):
+            for data in fasta.get_records_data():
+                digest.update(data)
+        else:
+            with open(fasta, 'rb') as fasta_file:
+                for data in iter(lambda: fasta_file.read(READ_BUFFER_SIZE), ""):
+                    digest.update(data)
+        
+        return digest.hexdigest()
+    
+    @staticmethod
+    def get_key(fasta_digest, db, ref_type, aligner_list, threshold_id, threshold_cov):
+        return (fasta_digest, db, ref_type, tuple(aligner_list), str(threshold_id), str(threshold_cov))
+    
+    # Returns (hits, unaligned) or None if the alignment is not in the cache
+    def get_alignment(self, key):
+        alignment = self._cache.get(key)
+        
+        if alignment != None and self._verbose:
+            sys.stderr.write("AlignmentCache: reusing alignment to DB "+str(key[1])+"\n")
+        
+        return alignment
+    
+    def add_alignment(self, key, hits, unaligned):
+        self._cache[key] = (hits, unaligned)
+    
+## This class keeps on disk the hits of the sequences aligned to a database,
+## to be reused by other runs of barleymap.
+## Each alignment (the database and the fingerprint of its files, the aligners and the thresholds)
+## has its own directory, with a file for each batch of sequences aligned in a run
+## and an index of the batch which has the hits of each sequence (identified by its digest).
+## The size of the cache is kept in a file, and the least recently used batches
+## are removed only when the cache is larger than max_size (MB)
+class DiskAlignmentCache(object):
+    
+    _cache_path = ""
+    _max_size = 0
+    _verbose = False
+    
+    INDEX_FILE = "index"
+    BATCH_PREFIX = "batch_"
+    SIZE_FILE = "size"
+    LOCK_FILE = "lock"
+    
+    # Once evicting entries, the cache is reduced to this fraction of max_size
+    EVICTION_TARGET = 0.9
+    
+    # The size of the cache is obtained again from its files after this number of batches,
+    # in case that it has changed outside of barleymap (e.g. batches removed by hand)
+    RECOUNT_BATCHES = 1000
+    
+    def __init__(self, cache_path, max_size, verbose = False):
+        self._cache_path = cache_path
+        self._max_size = long(float(max_size)*1024*1024)
+        self._verbose = verbose
+        
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path)
+    
+    @staticmethod
+    def get_alignment_key(db, ref_type, db_fingerprint, aligner_list, threshold_id, threshold_cov):
+        return "\t".join([db, str(ref_type), db_fingerprint, ",".join(aligner_list), str(threshold_id), str(threshold_cov)])
+    
+    @staticmethod
+    def get_sequence_key(alignment_key, sequence):
+        return hashlib.sha1(alignment_key+"\n"+sequence).hexdigest()
+    
+    def _get_alignment_path(self, alignment_key):
+        return os.path.join(self._cache_path, hashlib.sha1(alignment_key).hexdigest())
+    
+    # Returns the name of the batch of each sequence in the index of an alignment
+    def _read_index(self, alignment_path):
+        index = {}
+        
+        try:
+            with open(os.path.join(alignment_path, self.INDEX_FILE), 'r') as index_file:
+                for line in index_file:
+                    index_data = line.rstrip("\n").split("\t")
+                    if len(index_data) != 2: continue # incomplete line
+                    index[index_data[0]] = index_data[1]
+        except IOError:
+            pass
+        
+        return index
+    
+    # queries_keys is a list of (query_id, sequence_key)
+    # Returns a dict with the list of hits (with query_id as query) of each query in the cache,
+    # which is empty if the sequence had no hits
+    def get_hits(self, alignment_key, queries_keys):
+        queries_hits = {}
+        
+        alignment_path = self._get_alignment_path(alignment_key)
+        index = self._read_index(alignment_path)
+        
+        batches_queries = {} # [batch_name] = [(query_id, sequence_key), ...]
+        for (query_id, sequence_key) in queries_keys:
+            batch_name = index.get(sequence_key)
+            if batch_name == None: continue
+            
+            if batch_name in batches_queries:
+                batches_queries[batch_name].append((query_id, sequence_key))
+            else:
+                batches_queries[batch_name] = [(query_id, sequence_key)]
+        
+        for batch_name in batches_queries:
+            batch_path = os.path.join(alignment_path, batch_name)
+            try:
+                with open(batch_path, 'rb') as batch_file:
+                    batch_records = marshal.load(batch_file)
+                # Used now, for the LRU eviction
+                os.utime(batch_path, None)
+            except (IOError, OSError, EOFError, ValueError, TypeError):
+                continue # evicted meanwhile
+            
+            for (query_id, sequence_key) in batches_queries[batch_name]:
+                records = batch_records.get(sequence_key)
+                if records == None: continue
+                queries_hits[query_id] = [_record_to_result(query_id, record) for record in records]
+        
+        return queries_hits
+    
+    # Adds a batch of sequences aligned in a run: sequences_hits[sequence_key] = list of hits
+    # (an empty list if the sequence had no hits)
+    # and evicts other batches if the cache becomes larger than max_size
+    def add_hits(self, alignment_key, sequences_hits):
+        alignment_path = self._get_alignment_path(alignment_key)
+        
+        batch_records = {}
+        for sequence_key in sequences_hits:
+            batch_records[sequence_key] = [_result_to_record(hit) for hit in sequences_hits[sequence_key]]
+        
+        lock_file = self._lock()
+        try:
+            if not os.path.exists(alignment_path):
+                os.makedirs(alignment_path)
+            
+            # The batch is complete before it is added to the index,
+            # so that other processes never read an incomplete batch
+            (file_desc, batch_path) = tempfile.mkstemp(dir=alignment_path, prefix=self.BATCH_PREFIX)
+            with os.fdopen(file_desc, 'wb') as batch_file:
+                marshal.dump(batch_records, batch_file)
+            batch_name = os.path.basename(batch_path)
+            
+            index_data = "".join([sequence_key+"\t"+batch_name+"\n" for sequence_key in batch_records])
+            with open(os.path.join(alignment_path, self.INDEX_FILE), 'a') as index_file:
+                index_file.write(index_data)
+            
+            size_data = self._read_size()
+            if size_data == None:
+                # Obtained from its files, this batch included
+                (cache_size, num_batches) = (self._get_size(), 1)
+            else:
+                (cache_size, num_batches) = size_data
+                cache_size += os.path.getsize(batch_path)+len(index_data)
+                num_batches += 1
+            
+            if cache_size > self._max_size or num_batches >= self.RECOUNT_BATCHES:
+                cache_size = self._evict()
+                num_batches = 0
+            
+            self._write_size(cache_size, num_batches)
+        finally:
+            self._unlock(lock_file)
+        
+        return
+    
+    # Only a process (or thread) at a time adds batches and updates the size of the cache
+    def _lock(self):
+        lock_file = open(os.path.join(self._cache_path, self.LOCK_FILE), 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        
+        return lock_file
+    
+    def _unlock(self, lock_file):
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+    
+    # Returns (size of the cache, batches added since its size was obtained from its files)
+    # or None if the size has not been kept yet
+    def _read_size(self):
+        try:
+            with open(os.path.join(self._cache_path, self.SIZE_FILE), 'r') as size_file:
+                size_data = size_file.read().split()
+            
+            return (long(size_data[0]), int(size_data[1]))
+        except (IOError, ValueError, IndexError):
+            return None
+    
+    def _write_size(self, cache_size, num_batches):
+        (file_desc, tmp_path) = tempfile.mkstemp(dir=self._cache_path)
+        with os.fdopen(file_desc, 'w') as size_file:
+            size_file.write(str(cache_size)+"\t"+str(num_batches)+"\n")
+        os.rename(tmp_path, os.path.join(self._cache_path, self.SIZE_FILE))
+    
+    # Returns (size of the cache, list of (mtime, size, alignment_path, batch_name) of each batch)
+    def _get_batches(self):
+        batches = []
+        cache_size = 0
+        
+        for alignment_name in os.listdir(self._cache_path):
+            alignment_path = os.path.join(self._cache_path, alignment_name)
+            if not os.path.isdir(alignment_path): continue
+            
+            for file_name in os.listdir(alignment_path):
+                try:
+                    file_stat = os.stat(os.path.join(alignment_path, file_name))
+                except OSError:
+                    continue
+                
+                cache_size += file_stat.st_size
+                if file_name != self.INDEX_FILE:
+                    batches.append((file_stat.st_mtime, file_stat.st_size, alignment_path, file_name))
+        
+        return (cache_size, batches)
+    
+    def _get_size(self):
+        (cache_size, batches) = self._get_batches()
+        
+        return cache_size
+    
+    # Removes the least recently used batches, and their sequences from the indexes,
+    # if the cache is larger than max_size
+    # Returns the size of the cache
+    def _evict(self):
+        (cache_size, batches) = self._get_batches()
+        
+        if cache_size <= self._max_size: return cache_size
+        
+        target_size = self._max_size*self.EVICTION_TARGET
+        evicted = {} # [alignment_path] = set of batch names
+        num_evicted = 0
+        for (batch_mtime, batch_size, alignment_path, batch_name) in sorted(batches):
+            if cache_size <= target_size: break
+            try:
+                os.remove(os.path.join(alignment_path, batch_name))
+            except OSError:
+                continue
+            cache_size -= batch_size
+            num_evicted += 1
+            
+            if alignment_path in evicted:
+                evicted[alignment_path].add(batch_name)
+            else:
+                evicted[alignment_path] = set([batch_name])
+        
+        for alignment_path in evicted:
+            cache_size += self._remove_from_index(alignment_path, evicted[alignment_path])
+        
+        if self._verbose: sys.stderr.write("DiskAlignmentCache: evicted "+str(num_evicted)+" batches\n")
+        
+        return cache_size
+    
+    # Rewrites the index of an alignment without the sequences of the batches removed
+    # Returns the change in size of the index
+    def _remove_from_index(self, alignment_path, batch_names):
+        index_path = os.path.join(alignment_path, self.INDEX_FILE)
+        
+        try:
+            index_size = os.path.getsize(index_path)
+            with open(index_path, 'r') as index_file:
+                index_lines = [line for line in index_file
+                               if line.rstrip("\n").split("\t")[-1] not in batch_names]
+        except (IOError, OSError):
+            return 0
+        
+        if len(index_lines) == 0:
+            os.remove(index_path)
+            try:
+                os.rmdir(alignment_path)
+            except OSError: # with batches not indexed yet
+                pass
+            
+            return -index_size
+        
+        (file_desc, tmp_path) = tempfile.mkstemp(dir=alignment_path)
+        with os.fdopen(file_desc, 'w') as index_file:
+            index_file.writelines(index_lines)
+        os.rename(tmp_path, index_path)
+        
+        return os.path.getsize(index_path)-index_size
+
+# The fields of an alignment, except the query_id, as a tuple which can be marshalled
+def _result_to_record(result):
+    if isinstance(result, GraphAlignmentResult):
+        record = (RECORD_GRAPH, result.get_ref_id(), result.get_ref_start(), result.get_ref_end(), result.get_ref_strand(),
+                  result.get_subj_name(), result.get_subj_id(), result.get_subj_start(), result.get_subj_end(),
+                  result.get_subj_strand(), result.get_perc_ident(), result.get_perc_cover(), result.get_align_score(),
+                  result.get_subj_multmaps(), result.get_graph_ranges(), result.get_graph_id(), result.get_algorithm())
+    else:
+        record = (RECORD_ALIGNMENT, result.get_subject_id(), result.get_align_ident(), result.get_query_cov(),
+                  result.get_align_score(), result.get_strand(), result.get_qstart_pos(), result.get_qend_pos(),
+                  result.get_local_position(), result.get_end_position(), result.get_db_id(), result.get_algorithm())
+    
+    return record
+
+def _record_to_result(query_id, record):
+    if record[0] == RECORD_GRAPH:
+        result = GraphAlignmentResult()
+        result.create_from_attributes(query_id, *record[1:])
+    else:
+        result = AlignmentResult()
+        result.create_from_attributes(query_id, *record[1:])
+    
+    return result
+
+## END
@@ -9,28 +9,43 @@ from barleymapcore.m2p_exception import m2pException
 from barleymapcore.db.MapsConfig import MapsConfig
 from barleymapcore.alignment.Aligners import *
 from barleymapcore.alignment.AlignmentResult import AlignmentResults
+from barleymapcore.alignment.AlignmentCache import AlignmentCache, DiskAlignmentCache
+import barleymapcore.utils.metrics_utils as metrics_utils
+
+import copy
+from multiprocessing.pool import ThreadPool
 
 ALIGNMENT_TYPE_GREEDY = "greedy"
 ALIGNMENT_TYPE_HIERARCHICAL = "hierarchical"
+ALIGNMENT_TYPE_HIERARCHICAL_PARALLEL = "hierarchical_parallel"
 ALIGNMENT_TYPE_BEST_SCORE = "best_score"
 
 class AlignmentEnginesFactory(object):
     @staticmethod
-    def get_alignment_engine(search_type, aligner_list, paths_config, ref_type_param, n_threads, verbose):
+    def get_alignment_engine(search_type, aligner_list, paths_config, ref_type_param, n_threads, verbose,
+                             alignment_cache = None, disk_alignment_cache = None, databases_config = None):
         
         alignment_engine = None
         
         if search_type == ALIGNMENT_TYPE_GREEDY:
             
-            alignment_engine = GreedyEngine(aligner_list, paths_config, ref_type_param, n_threads, verbose)
+            alignment_engine = GreedyEngine(aligner_list, paths_config, ref_type_param, n_threads, verbose,
+                                            alignment_cache, disk_alignment_cache, databases_config)
             
         elif search_type == ALIGNMENT_TYPE_HIERARCHICAL:
             
-            alignment_engine = HierarchicalEngine(aligner_list, paths_config, ref_type_param, n_threads, verbose)
+            alignment_engine = HierarchicalEngine(aligner_list, paths_config, ref_type_param, n_threads, verbose,
+                                                  alignment_cache, disk_alignment_cache, databases_config)
+            
+        elif search_type == ALIGNMENT_TYPE_HIERARCHICAL_PARALLEL:
+            
+            alignment_engine = HierarchicalParallelEngine(aligner_list, paths_config, ref_type_param, n_threads, verbose,
+                                                          alignment_cache, disk_alignment_cache, databases_config)
             
         elif search_type == ALIGNMENT_TYPE_BEST_SCORE:
             
-            alignment_engine = BestScoreEngine(aligner_list, paths_config, ref_type_param, n_threads, verbose)
+            alignment_engine = BestScoreEngine(aligner_list, paths_config, ref_type_param, n_threads, verbose,
+                                               alignment_cache, disk_alignment_cache, databases_config)
             
         else:
             raise m2pException("Unrecognized search type "+search_type+".")
@@ -47,27 +62,237 @@ class AlignmentEngine(object):
     _verbose = False
     
     _aligner = None
+    _aligner_list = None
+    _alignment_cache = None
+    _disk_alignment_cache = None
+    _databases_config = None
     
-    def __init__(self, aligner_list, paths_config, ref_type_param, n_threads, verbose):
+    def __init__(self, aligner_list, paths_config, ref_type_param, n_threads, verbose,
+                 alignment_cache = None, disk_alignment_cache = None, databases_config = None):
         self._paths_config = paths_config
         self._ref_type_param = ref_type_param
         self._n_threads = n_threads
         self._verbose = verbose
+        self._aligner_list = aligner_list
+        self._alignment_cache = alignment_cache
+        self._disk_alignment_cache = disk_alignment_cache
+        self._databases_config = databases_config
         
         self._load_aligner(aligner_list)
     
     def _load_aligner(self, aligner_list):
         self._aligner = None # reset aligner
         
-        aligner = AlignersFactory.get_aligner(aligner_list, self._n_threads, self._paths_config, self._verbose)
+        aligner = AlignersFactory.get_aligner(aligner_list, self._n_threads, self._paths_config, self._verbose,
+                                              self._databases_config)
         
         self._aligner = aligner
         
         return
     
+    # Aligns the fasta to each DB, independently of the results to other DBs
+    # Several DBs are aligned at once if there are several threads,
+    # splitting the threads among them, each DB with its own aligner
+    # Returns the hits to all the DBs, in the same order as dbs_list
+    def _align_dbs(self, fasta_to_align, dbs_list, databases_config, threshold_id, threshold_cov):
+        
+        dbs_hits = self._align_each_db(fasta_to_align, dbs_list, databases_config, threshold_id, threshold_cov)
+        
+        results = []
+        for db_hits in dbs_hits:
+            results.extend(db_hits)
+        
+        return results
+    
+    # Number of DBs aligned at once by _align_each_db
+    def _get_num_workers(self, dbs_list):
+        return min(len(dbs_list), self._n_threads)
+    
+    # As _align_dbs, but returns a list with the hits to each DB
+    def _align_each_db(self, fasta_to_align, dbs_list, databases_config, threshold_id, threshold_cov):
+        
+        num_workers = self._get_num_workers(dbs_list)
+        
+        if num_workers > 1:
+            db_threads = max(1, self._n_threads / num_workers)
+            
+            if self._verbose: sys.stderr.write("AlignmentEngine: aligning to "+str(num_workers)+" DBs at once, "+\
+                                               str(db_threads)+" threads each\n")
+            
+            # The stages of the workers are children of the current one
+            parent = metrics_utils.get_current_stage()
+            
+            def align_db(db):
+                with metrics_utils.parent_stage(parent):
+                    aligner = AlignersFactory.get_aligner(self._aligner_list, db_threads, self._paths_config, self._verbose,
+                                                          self._databases_config)
+                    return self._align_db(fasta_to_align, db, databases_config, threshold_id, threshold_cov, aligner)
+            
+            pool = ThreadPool(num_workers)
+            try:
+                dbs_hits = pool.map(align_db, dbs_list)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            dbs_hits = [self._align_db(fasta_to_align, db, databases_config, threshold_id, threshold_cov, self._aligner)
+                        for db in dbs_list]
+        
+        return dbs_hits
+    
+    def _align_db(self, fasta_to_align, db, databases_config, threshold_id, threshold_cov, aligner):
+        hits = []
+        
+        # Obtain ref_type of current database
+        ref_type = self.get_reftype(db, databases_config)
+        
+        try:
+            ## Alignment of fasta sequences to the DB
+            ##
+            (hits, db_unaligned) = self._align(fasta_to_align, db, ref_type, threshold_id, threshold_cov, aligner)
+            
+        except m2pException as m2pe:
+            sys.stderr.write("\t"+m2pe.msg+"\n")
+            sys.stderr.write("\tContinuing with alignments to next DB...\n")
+        
+        return hits
+    
     def perform_alignment(self, query_fasta_path, dbs_list, databases_config, threshold_id, threshold_cov):
         raise m2pException("SearchEngine is an abstract class. 'perform_alignment' must be implemented in a child class.")
     
+    # Aligns only the first query of each group of queries with identical sequences,
+    # and copies its hits (and whether it is unaligned) to the other queries of the group
+    def perform_unique_alignment(self, query_fasta_path, dbs_list, databases_config, threshold_id, threshold_cov):
+        
+        unique_queries = []
+        duplicates = {} # [query_id of first query] = query_ids of the other queries with the same sequence
+        first_queries = {} # [sequence] = query_id of first query
+        for (header, sequence) in alignment_utils.get_fasta_records(query_fasta_path):
+            query_id = header.split(" ")[0]
+            sequence_key = sequence.upper()
+            if sequence_key in first_queries:
+                duplicates[first_queries[sequence_key]].append(query_id)
+            else:
+                first_queries[sequence_key] = query_id
+                duplicates[query_id] = []
+                unique_queries.append(query_id)
+        
+        num_duplicates = sum([len(query_duplicates) for query_duplicates in duplicates.itervalues()])
+        
+        if num_duplicates == 0:
+            return self.perform_alignment(query_fasta_path, dbs_list, databases_config, threshold_id, threshold_cov)
+        
+        sys.stderr.write("AlignmentEngine: "+str(num_duplicates)+" queries with the same sequence as other queries. "+\
+                         "Aligning "+str(len(unique_queries))+" unique sequences.\n")
+        
+        unique_fasta = alignment_utils.get_fasta_subset(query_fasta_path, unique_queries)
+        alignment_results = self.perform_alignment(unique_fasta, dbs_list, databases_config, threshold_id, threshold_cov)
+        
+        results = []
+        for alignment_result in alignment_results.get_aligned():
+            results.append(alignment_result)
+            for query_id in duplicates.get(alignment_result.get_query_id(), []):
+                duplicate_result = copy.copy(alignment_result)
+                duplicate_result.set_query_id(query_id)
+                results.append(duplicate_result)
+        
+        unaligned = []
+        for query_id in alignment_results.get_unaligned():
+            unaligned.append(query_id)
+            unaligned.extend(duplicates.get(query_id, []))
+        
+        results = self._sort_results(results)
+        
+        return AlignmentResults(results, unaligned)
+    
+    # Aligns the fasta to the DB, or reuses a previous alignment of the same sequences
+    # to the same DB if there is an AlignmentCache
+    # Returns (hits, unaligned)
+    def _align(self, fasta_path, db, ref_type, threshold_id, threshold_cov, aligner = None):
+        if aligner == None: aligner = self._aligner
+        
+        alignment_cache = self._alignment_cache
+        
+        if alignment_cache != None:
+            fasta_digest = AlignmentCache.get_fasta_digest(fasta_path)
+            key = AlignmentCache.get_key(fasta_digest, db, ref_type, self._aligner_list, threshold_id, threshold_cov)
+            alignment = alignment_cache.get_alignment(key)
+            if alignment != None:
+                metrics_utils.count("alignment.cache_hits")
+                return alignment
+        
+        with metrics_utils.stage("alignment", db = db, aligner = ",".join(self._aligner_list)):
+            if self._disk_alignment_cache != None:
+                (hits, unaligned) = self._align_with_disk_cache(fasta_path, db, ref_type, threshold_id, threshold_cov, aligner)
+            else:
+                hits = aligner.align(fasta_path, db, ref_type, threshold_id, threshold_cov)
+                unaligned = aligner.get_unaligned()
+        
+        if alignment_cache != None:
+            alignment_cache.add_alignment(key, hits, unaligned)
+        
+        return (hits, unaligned)
+    
+    # Only the sequences which are not in the DiskAlignmentCache are aligned
+    # Returns (hits, unaligned)
+    def _align_with_disk_cache(self, fasta_path, db, ref_type, threshold_id, threshold_cov, aligner):
+        disk_cache = self._disk_alignment_cache
+        
+        alignment_key = DiskAlignmentCache.get_alignment_key(db, ref_type, aligner.get_db_fingerprint(db),
+                                                             self._aligner_list, threshold_id, threshold_cov)
+        
+        queries_ids = []
+        queries_keys = []
+        for (header, sequence) in alignment_utils.get_fasta_records(fasta_path):
+            query_id = header.split(" ")[0]
+            queries_ids.append(query_id)
+            queries_keys.append((query_id, DiskAlignmentCache.get_sequence_key(alignment_key, sequence)))
+        
+        cached_hits = disk_cache.get_hits(alignment_key, queries_keys)
+        
+        hits = []
+        queries_hits = {} # [query_id] = number of hits
+        missing_keys = []
+        for (query_id, sequence_key) in queries_keys:
+            query_hits = cached_hits.get(query_id)
+            if query_hits != None:
+                hits.extend(query_hits)
+                queries_hits[query_id] = len(query_hits)
+            else:
+                missing_keys.append((query_id, sequence_key))
+        
+        sys.stderr.write("AlignmentEngine: DB "+str(db)+", sequences in alignment cache "+
+                         str(len(queries_ids)-len(missing_keys))+", to align "+str(len(missing_keys))+"\n")
+        metrics_utils.count("alignment.disk_cache_hits", len(queries_ids)-len(missing_keys))
+        metrics_utils.count("alignment.disk_cache_misses", len(missing_keys))
+        
+        if len(missing_keys) > 0:
+            fasta_to_align = alignment_utils.get_fasta_subset(fasta_path, [query_id for (query_id, sequence_key) in missing_keys])
+            new_hits = aligner.align(fasta_to_align, db, ref_type, threshold_id, threshold_cov)
+            
+            new_queries_hits = {}
+            for hit in new_hits:
+                query_id = hit.get_query_id()
+                if query_id in new_queries_hits:
+                    new_queries_hits[query_id].append(hit)
+                else:
+                    new_queries_hits[query_id] = [hit]
+            
+            # Sequences without hits are also cached
+            sequences_hits = {}
+            for (query_id, sequence_key) in missing_keys:
+                query_hits = new_queries_hits.get(query_id, [])
+                sequences_hits[sequence_key] = query_hits
+                queries_hits[query_id] = len(query_hits)
+            
+            disk_cache.add_hits(alignment_key, sequences_hits)
+            
+            hits.extend(new_hits)
+        
+        unaligned = [query_id for query_id in queries_ids if queries_hits.get(query_id, 0) == 0]
+        
+        return (hits, unaligned)
+    
     def get_alignment_results(self, ):
         return self._alignment_results
     
@@ -187,88 +412,103 @@ class GreedyEngine(AlignmentEngine):
         
         return unaligned
     
+    def perform_alignment(self, query_fasta_path, dbs_list, databases_config, threshold_id, threshold_cov):
+        
+        fasta_to_align = query_fasta_path
+        
+        if self._verbose: sys.stderr.write("GreedyEngine: performing alignment...\n")
+        
+        # Alignments to all DBs (independent of each other)
+        results = self._align_dbs(fasta_to_align, dbs_list, databases_config, threshold_id, threshold_cov)
+        
+        results = self._sort_results(results)
+        
+        ## Recover unmapped queries
+        unaligned = self._get_unaligned(query_fasta_path, results)
+        
+        alignment_results = AlignmentResults(results, unaligned) # reset alignment results
+        
+        return alignment_results
+
+## This Engine iterates over databases.
+## Once a query hits a databases, is not searched
+## in subsequent DBs
+class HierarchicalEngine(AlignmentEngine):
+    
     def perform_alignment(self, query_fasta_path, dbs_list, databases_config, threshold_id, threshold_cov):
         
         fasta_to_align = query_fasta_path
         
         results = []
+        unaligned = []
         
-        if self._verbose: sys.stderr.write("GreedyEngine: performing alignment...\n")
+        if self._verbose: sys.stderr.write("HierarchicalEngine: performing alignment...\n")
         
-        # Create a record for each DB
         for db in dbs_list:
-            
             # Obtain ref_type of current database
             ref_type = self.get_reftype(db, databases_config)
             
             try:
-                ## Alignment of fasta sequences to the DB
-                ##
-                hits = self._aligner.align(fasta_to_align, db, ref_type, threshold_id, threshold_cov)
+                (db_hits, unaligned) = self._align(fasta_to_align, db, ref_type, threshold_id, threshold_cov)
                 
-                results.extend(hits)
+                results.extend(db_hits)
                 
+                ## Recover unmapped queries if needed
+                ## (they are passed to the aligner through its stdin)
+                if len(unaligned) > 0:
+                    fasta_to_align = alignment_utils.get_fasta_subset(fasta_to_align, unaligned)
+                else:
+                    break # Once all queries have been found in DBs
+                # else: fasta_to_align = fasta_path
             except m2pException as m2pe:
                 sys.stderr.write("\t"+m2pe.msg+"\n")
                 sys.stderr.write("\tContinuing with alignments to next DB...\n")
         
         results = self._sort_results(results)
         
-        ## Recover unmapped queries
-        unaligned = self._get_unaligned(query_fasta_path, results)
+        ## Unmapped queries are those from last DB which was queried
         
         alignment_results = AlignmentResults(results, unaligned) # reset alignment results
         
         return alignment_results
 
-## This Engine iterates over databases.
-## Once a query hits a databases, is not searched
-## in subsequent DBs
-class HierarchicalEngine(AlignmentEngine):
+## Speculative version of the HierarchicalEngine:
+## all the queries are aligned to all the DBs at once,
+## and then the hits of each query are kept only from
+## the first DB (in the order of dbs_list) with hits for that query.
+## The results are the same as those of HierarchicalEngine, using more CPU.
+class HierarchicalParallelEngine(HierarchicalEngine):
     
     def perform_alignment(self, query_fasta_path, dbs_list, databases_config, threshold_id, threshold_cov):
         
+        # If the DBs would be aligned one after another anyway (e.g. a single thread),
+        # the queries with hits in a DB are not aligned to the next ones
+        if self._get_num_workers(dbs_list) < 2:
+            return HierarchicalEngine.perform_alignment(self, query_fasta_path, dbs_list, databases_config,
+                                                        threshold_id, threshold_cov)
+        
         fasta_to_align = query_fasta_path
         
-        results = []
+        if self._verbose: sys.stderr.write("HierarchicalParallelEngine: performing alignment...\n")
         
-        if self._verbose: sys.stderr.write("HierarchicalEngine: performing alignment...\n")
+        dbs_hits = self._align_each_db(fasta_to_align, dbs_list, databases_config, threshold_id, threshold_cov)
         
-        tmp_files_list = []
-        tmp_files_dir = self._paths_config.get_tmp_files_path()
-        try:
-            for db in dbs_list:
-                # Obtain ref_type of current database
-                ref_type = self.get_reftype(db, databases_config)
-                
-                try:
-                    db_hits = self._aligner.align(fasta_to_align, db, ref_type, threshold_id, threshold_cov)
-                    
-                    results.extend(db_hits)
-                    
-                    ## Recover unmapped queries if needed
-                    unmapped = self._aligner.get_unaligned()
-                    
-                    if len(unmapped) > 0:
-                        fasta_to_align = alignment_utils.extract_fasta_headers(fasta_to_align, unmapped, tmp_files_dir)
-                        tmp_files_list.append(fasta_to_align)
-                    else:
-                        break # Once all queries have been found in DBs
-                    # else: fasta_to_align = fasta_path
-                except m2pException as m2pe:
-                    sys.stderr.write("\t"+m2pe.msg+"\n")
-                    sys.stderr.write("\tContinuing with alignments to next DB...\n")
+        results = []
+        aligned = set()
+        for db_hits in dbs_hits:
+            db_aligned = set()
+            for alignment_result in db_hits:
+                query_id = alignment_result.get_query_id()
+                if query_id not in aligned:
+                    results.append(alignment_result)
+                    db_aligned.add(query_id)
             
-        except Exception:
-            raise
-        finally:
-            for tmp_file in tmp_files_list:
-                os.remove(tmp_file)
+            aligned.update(db_aligned)
         
         results = self._sort_results(results)
         
-        ## Recover unmapped queries from last DB which was queried
-        unaligned = self._aligner.get_unaligned()
+        fasta_headers = alignment_utils.get_fasta_headers(query_fasta_path)
+        unaligned = alignment_utils.filter_list(fasta_headers, aligned)
         
         alignment_results = AlignmentResults(results, unaligned) # reset alignment results
         
@@ -294,26 +534,10 @@ class BestScoreEngine(AlignmentEngine):
         
         fasta_to_align = query_fasta_path
         
-        results = []
-        
         if self._verbose: sys.stderr.write("BestScoreEngine: performing alignment...\n")
         
-        # Create a record for each DB
-        for db in dbs_list:
-            
-            # Obtain ref_type of current database
-            ref_type = self.get_reftype(db, databases_config)
-            
-            try:
-                ## Alignment of fasta sequences to the DB
-                ##
-                hits = self._aligner.align(fasta_to_align, db, ref_type, threshold_id, threshold_cov)
-                
-                results.extend(hits)
-                
-            except m2pException as m2pe:
-                sys.stderr.write("\t"+m2pe.msg+"\n")
-                sys.stderr.write("\tContinuing with alignments to next DB...\n")
+        # Alignments to all DBs (independent of each other)
+        results = self._align_dbs(fasta_to_align, dbs_list, databases_config, threshold_id, threshold_cov)
         
         results = self._best_score(results)
         results = self._sort_results(results)
@@ -12,6 +12,7 @@ from barleymapcore.db.DatabasesConfig import REF_TYPE_STD
 
 from barleymapcore.alignment.AlignmentEngines import AlignmentEnginesFactory
 from barleymapcore.alignment.AlignmentResult import AlignmentResults, AlignmentResult
+from barleymapcore.alignment.AlignmentCache import AlignmentCache, DiskAlignmentCache
 
 class AlignmentFacade():
     
@@ -19,11 +20,22 @@ class AlignmentFacade():
     
     _alignment_results = None
     
+    # Alignments already performed with this facade (e.g. for other maps)
+    _alignment_cache = None
+    # Alignments performed in previous runs (if alignment_cache_path is configured)
+    _disk_alignment_cache = None
+    
     _verbose = False
     
     def __init__(self, paths_config, verbose = False):
         self._paths_config = paths_config
         self._verbose = verbose
+        self._alignment_cache = AlignmentCache(verbose)
+        
+        alignment_cache_path = paths_config.get_alignment_cache_path()
+        if alignment_cache_path:
+            self._disk_alignment_cache = DiskAlignmentCache(alignment_cache_path,
+                                                            paths_config.get_alignment_cache_size(), verbose)
     
     def _create_alignment_results(self, query_path):
         results = []
@@ -84,10 +96,12 @@ class AlignmentFacade():
         
         ## Create the SearchEngine (greedy, hierarchical, exhaustive searches on top of splitblast, gmap,...)
         alignment_engine = AlignmentEnginesFactory.get_alignment_engine(search_type, aligner_list, self._paths_config, 
-                                                               ref_type_param, n_threads, self._verbose)
+                                                               ref_type_param, n_threads, self._verbose,
+                                                               self._alignment_cache, self._disk_alignment_cache,
+                                                               databases_config)
         
-        ## Perform the search and alignments
-        alignment_results = alignment_engine.perform_alignment(query_fasta_path, dbs_list, databases_config, threshold_id, threshold_cov)
+        ## Perform the search and alignments (once for each group of identical sequences)
+        alignment_results = alignment_engine.perform_unique_alignment(query_fasta_path, dbs_list, databases_config, threshold_id, threshold_cov)
         
         self._alignment_results = alignment_results
         
@@ -5,22 +5,26 @@
 # Copyright (C)  2017  Carlos P Cantalapiedra.
 # (terms of use can be found within the distributed LICENSE file).
 
+# Note that it uses __slots__ since there could be millions of them in memory
 class AlignmentResult(object):
-    
-    _query_id = ""
-    _subject_id = ""
-    _align_ident = -1.0
-    _query_cov = -1.0
-    _align_score = -1
-    _strand = "+"
-    _local_position = -1
-    _end_position = -1
-    _qstart_pos = -1
-    _qend_pos = -1
-    _db_id = ""
-    _algorithm = ""
+    __slots__ = ("_query_id", "_subject_id", "_align_ident", "_query_cov", "_align_score",
+                 "_strand", "_local_position", "_end_position", "_qstart_pos", "_qend_pos",
+                 "_db_id", "_algorithm")
     
     def __init__(self):
+        self._query_id = ""
+        self._subject_id = ""
+        self._align_ident = -1.0
+        self._query_cov = -1.0
+        self._align_score = -1
+        self._strand = "+"
+        self._local_position = -1
+        self._end_position = -1
+        self._qstart_pos = -1
+        self._qend_pos = -1
+        self._db_id = ""
+        self._algorithm = ""
+        
         return
     
     def create_from_attributes(self, query_id, subject_id, align_ident, query_cov, align_score,
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# DatabasesWarmer.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+import sys, os, mmap
+
+## This class maps in memory the files of the databases of several aligners,
+## and reads a byte of each page of them (again in each call to warm),
+## so that the aligners started later find the index pages already in memory,
+## specially GMAP with the memory mapped batch modes (see DatabasesConfig).
+## It is meant to be used by a long-lived process (see bmap_dbs_warm.py)
+class DatabasesWarmer(object):
+    
+    _aligners = None
+    _verbose = False
+    
+    # [db_file] = (mmap, (st_ino, st_mtime, st_size) of the file mapped)
+    _maps = None
+    
+    def __init__(self, aligners, verbose = False):
+        self._aligners = aligners
+        self._verbose = verbose
+        self._maps = {}
+    
+    # Returns the number of bytes read
+    def warm(self, dbs_list):
+        warm_bytes = 0
+        warm_files = set()
+        
+        for db in dbs_list:
+            for aligner in self._aligners:
+                db_files = aligner.get_db_files(db)
+                
+                if len(db_files) == 0:
+                    sys.stderr.write("DatabasesWarmer: no files for DB "+str(db)+" with "+aligner.__class__.__name__+"\n")
+                
+                for db_file in db_files:
+                    db_map = self._get_map(db_file)
+                    if db_map == None: continue
+                    
+                    warm_files.add(db_file)
+                    
+                    for offset in xrange(0, len(db_map), mmap.PAGESIZE):
+                        db_map[offset]
+                    
+                    warm_bytes += len(db_map)
+        
+        # The files removed (or not warmed anymore) are released
+        for db_file in self._maps.keys():
+            if db_file not in warm_files:
+                self._maps.pop(db_file)[0].close()
+        
+        return warm_bytes
+    
+    def _get_map(self, db_file):
+        try:
+            db_stat = os.stat(db_file)
+        except OSError:
+            return None
+        
+        db_file_id = (db_stat.st_ino, db_stat.st_mtime, db_stat.st_size)
+        
+        db_map = None
+        if db_file in self._maps:
+            (db_map, mapped_file_id) = self._maps[db_file]
+            
+            # The file was rebuilt (even in place with the same size),
+            # so the pages of the file mapped are released
+            if mapped_file_id != db_file_id:
+                db_map.close()
+                del self._maps[db_file]
+                db_map = None
+        
+        if db_map == None:
+            try:
+                with open(db_file, 'rb') as db_fileobj:
+                    db_map = mmap.mmap(db_fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+                    db_stat = os.fstat(db_fileobj.fileno())
+            except (IOError, ValueError, EnvironmentError): # empty files can not be mapped
+                return None
+            
+            if self._verbose: sys.stderr.write("DatabasesWarmer: mapped "+db_file+"\n")
+            
+            self._maps[db_file] = (db_map, (db_stat.st_ino, db_stat.st_mtime, db_stat.st_size))
+        
+        return db_map
+    
+    def close(self):
+        for (db_map, db_file_id) in self._maps.itervalues():
+            db_map.close()
+        
+        self._maps = {}
+        
+        return
+
+## END
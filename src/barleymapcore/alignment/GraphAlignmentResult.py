@@ -5,29 +5,36 @@
 # Copyright (C) 2025 Bruno Contreras Moreira and Joan Sarria
 # (terms of use can be found within the distributed LICENSE file).
 
+# Note that it uses __slots__ since there could be millions of them in memory
 class GraphAlignmentResult(object):
-    
-    _query_id = ""
-    # scores
-    perc_ident = 0.0
-    perc_cover = 0.0
-    align_score = 0.0
-    # graph alignment attributes, coords in reference used to build graph (PHG)
-    _ref_id = "."
-    _ref_start = -1
-    _ref_end = -1
-    _ref_strand = "."
-    # genome alignment attributes, coords in matched genome (gmap)
-    _subj_mult_maps = "No"
-    _subj_name = "."
-    _subj_id = "."
-    _subj_start = -1
-    _subj_end = -1
-    _subj_strand = "."
-    # string with all overlapping graph ranges
-    _graph_ranges = "."
+    __slots__ = ("_query_id", "perc_ident", "perc_cover", "align_score",
+                 "_ref_id", "_ref_start", "_ref_end", "_ref_strand",
+                 "_subj_multmaps", "_subj_name", "_subj_id", "_subj_start", "_subj_end", "_subj_strand",
+                 "_graph_ranges", "_db_id", "_algorithm")
     
     def __init__(self):
+        self._query_id = ""
+        # scores
+        self.perc_ident = 0.0
+        self.perc_cover = 0.0
+        self.align_score = 0.0
+        # graph alignment attributes, coords in reference used to build graph (PHG)
+        self._ref_id = "."
+        self._ref_start = -1
+        self._ref_end = -1
+        self._ref_strand = "."
+        # genome alignment attributes, coords in matched genome (gmap)
+        self._subj_multmaps = "No"
+        self._subj_name = "."
+        self._subj_id = "."
+        self._subj_start = -1
+        self._subj_end = -1
+        self._subj_strand = "."
+        # string with all overlapping graph ranges
+        self._graph_ranges = "."
+        self._db_id = ""
+        self._algorithm = ""
+        
         return
     
     def create_from_attributes(self, query_id, ref_id, ref_start, ref_end, ref_strand, 
@@ -7,10 +7,10 @@
 # (terms of use can be found within the distributed LICENSE file).
 
 import sys, re, os
-from subprocess import Popen, PIPE
 
 from barleymapcore.alignment.GraphAlignmentResult import *
 from barleymapcore.m2p_exception import m2pException
+from barleymapcore.utils.alignment_utils import stream_command_output, get_query_input
 
 #from Aligners import SELECTION_BEST_SCORE, SELECTION_NONE
 
@@ -19,8 +19,6 @@ MAX_NUMBER_PATHS_PER_QUERY = 100
 
 def __align2graph(align2graph_app_path, n_threads, threshold_id, threshold_cov, query_fasta_path, align2graph_dbs_path, db_name, verbose = False):
 
-    results = []
-    
     ###### Check that DB is available for this aligner
     dbpath = align2graph_dbs_path + "/" + db_name   
     dbpathfile = dbpath + ".bmap.yaml"
@@ -32,6 +30,9 @@ def __align2graph(align2graph_app_path, n_threads, threshold_id, threshold_cov,
     align2graph_thres_id = float(threshold_id) / 100.0
     align2graph_thres_cov = float(threshold_cov) / 100.0
 
+    # A FastaSubset is written to the stdin of align2graph
+    (query_path, query_data) = get_query_input(query_fasta_path)
+    
     # build actual align2graph call 
     align2graph_cmd = "".join([align2graph_app_path, \
                    " --graph_yaml ", dbpathfile, \
@@ -39,7 +40,7 @@ def __align2graph(align2graph_app_path, n_threads, threshold_id, threshold_cov,
                    " --minident ", str(threshold_id), \
                    " --mincover ", str(threshold_cov), \
                    " --add_ranges ", \
-                   " ",query_fasta_path,
+                   " ",query_path,
                    ])
     
     print(align2graph_cmd)
@@ -48,29 +49,12 @@ def __align2graph(align2graph_app_path, n_threads, threshold_id, threshold_cov,
     
     if verbose: sys.stderr.write("m2p_align2graph: Executing '"+align2graph_cmd+"'\n")
     
-    retValue = 0
-    FNULL = open(os.devnull, 'w')
-    if verbose:
-        p = Popen(align2graph_cmd, shell=True, stdout=PIPE, stderr=sys.stderr)
-    else:
-        p = Popen(align2graph_cmd, shell=True, stdout=PIPE, stderr=PIPE)
-    
-    com_list = p.communicate()
-    output = com_list[0]
-    output_err = com_list[1]
-    retValue = p.returncode
+    # The output is consumed line by line as it is produced,
+    # instead of being buffered as a whole with communicate()
+    output = stream_command_output(align2graph_cmd, "m2p_align2graph", verbose, query_data)
     
-    if retValue != 0:
-        if verbose:
-            raise Exception("m2p_align2graph: return != 0. "+align2graph_cmd+"\n"+str(output)+"\n")
-        else:
-            raise Exception("m2p_align2graph: return != 0. "+align2graph_cmd+"\nError: "+str(output_err)+"\n")
+    results = (line for line in output if line != "")
     
-    else:
-        if verbose: sys.stderr.write("m2p_align2graph: return value "+str(retValue)+"\n")
-
-        [results.append(line) for line in output.strip().split("\n") if line != ""]
-
     return results
 
 
@@ -82,7 +66,10 @@ def __filter_align2graph_results(results, threshold_id, threshold_cov, db_name,
     
     algorithm = "align2graph"
     
+    raw_num = 0
     for line in results:
+        
+        raw_num += 1
    
         if not line.startswith("#"):
 
@@ -113,6 +100,8 @@ def __filter_align2graph_results(results, threshold_id, threshold_cov, db_name,
                         
             filtered_results.append(result_tuple)
     
+    if verbose: sys.stderr.write("m2p_align2graph: raw results --> "+str(raw_num)+"\n")
+    
     return filtered_results
 
 
@@ -120,14 +109,13 @@ def get_best_score_hits(align2graph_app_path, n_threads, query_fasta_path, align
              threshold_id, threshold_cov, verbose = False):
     results = []
     
-    if verbose: sys.stderr.write("m2p_align2graph: "+query_fasta_path+" against "+db_name+"\n")
+    if verbose: sys.stderr.write("m2p_align2graph: "+str(query_fasta_path)+" against "+db_name+"\n")
     
     results = __align2graph(align2graph_app_path, n_threads, threshold_id, threshold_cov, query_fasta_path,
                      align2graph_dbs_path, db_name, verbose)
     
-    if verbose: sys.stderr.write("m2p_align2graph: raw results --> "+str(len(results))+"\n")
-    if len(results)>0:
-        results = __filter_align2graph_results(results, threshold_id, threshold_cov, db_name, verbose)
+    # Raw results are filtered on the fly
+    results = __filter_align2graph_results(results, threshold_id, threshold_cov, db_name, verbose)
     if verbose: sys.stderr.write("m2p_align2graph: pass-filter results --> "+str(len(results))+"\n")
     #sys.stderr.write(str(results)+"\n")
     
@@ -6,17 +6,20 @@
 # (terms of use can be found within the distributed LICENSE file).
 
 import sys, re, os
-from subprocess import Popen, PIPE
 
 from barleymapcore.alignment.AlignmentResult import *
 from barleymapcore.m2p_exception import m2pException
+from barleymapcore.utils.alignment_utils import stream_command_output, get_query_input
+# GMAP -B
+from barleymapcore.db.DatabasesConfig import DEFAULT_BATCH_MODE
 
 #from Aligners import SELECTION_BEST_SCORE, SELECTION_NONE
 
 ALIGNER = "GMAP"
 MAX_NUMBER_PATHS_PER_QUERY = 100
 
-def __gmap(gmap_app_path, n_threads, threshold_id, threshold_cov, query_fasta_path, gmap_dbs_path, db_name, verbose = False):
+def __gmap(gmap_app_path, n_threads, threshold_id, threshold_cov, query_fasta_path, gmap_dbs_path, db_name, verbose = False,
+           unaligned_callback = None, batch_mode = DEFAULT_BATCH_MODE):
     
     # CPCantalapiedra 201701
     ###### Check that DB is available for this aligner
@@ -30,7 +33,8 @@ def __gmap(gmap_app_path, n_threads, threshold_id, threshold_cov, query_fasta_pa
     # GMAP
     __command = "".join([gmap_app_path, \
                 " -t ", str(n_threads), \
-                " -B 0 -n ", str(MAX_NUMBER_PATHS_PER_QUERY)])
+                " -B ", str(batch_mode), \
+                " -n ", str(MAX_NUMBER_PATHS_PER_QUERY)])
     
     gmap_thres_id = float(threshold_id) / 100.0
     gmap_thres_cov = float(threshold_cov) / 100.0
@@ -42,29 +46,19 @@ def __gmap(gmap_app_path, n_threads, threshold_id, threshold_cov, query_fasta_pa
     __db = "".join([" -d ", db_name])
     __db_dir = "".join([" -D ", gmap_dbs_path])
     
-    gmap_cmd = " ".join([__command, __filter_id, __filter_cov, __db, __db_dir, query_fasta_path])
+    # A FastaSubset is written to the stdin of GMAP
+    (query_path, query_data) = get_query_input(query_fasta_path)
+    
+    gmap_cmd = " ".join([__command, __filter_id, __filter_cov, __db, __db_dir, query_path])
     
     if verbose: sys.stderr.write("m2p_gmap: Executing '"+gmap_cmd+"'\n")
     
-    retValue = 0
-    FNULL = open(os.devnull, 'w')
-    if verbose:
-        p = Popen(gmap_cmd, shell=True, stdout=PIPE, stderr=sys.stderr)
-    else:
-        p = Popen(gmap_cmd, shell=True, stdout=PIPE, stderr=PIPE)
-    
-    com_list = p.communicate()
-    output = com_list[0]
-    output_err = com_list[1]
-    retValue = p.returncode
-    
-    if retValue != 0:
-        if verbose:
-            raise Exception("m2p_gmap: return != 0. "+gmap_cmd+"\n")
-        else:
-            raise Exception("m2p_gmap: return != 0. "+gmap_cmd+"\nError: "+str(output_err)+"\n")
+    # The output of GMAP is consumed line by line as it is produced,
+    # instead of being buffered as a whole with communicate()
+    output = stream_command_output(gmap_cmd, "m2p_gmap", verbose, query_data)
     
-    if verbose: sys.stderr.write("m2p_gmap: GMAP return value "+str(retValue)+"\n"+str(output_err)+"\n")
+    if unaligned_callback != None:
+        output = __report_unaligned(output, unaligned_callback)
     
     results = __compress(output, db_name)
     
@@ -74,13 +68,27 @@ def __gmap(gmap_app_path, n_threads, threshold_id, threshold_cov, query_fasta_pa
     
     return results
 
+# Calls unaligned_callback with the id of each query without paths (or chimeric),
+# as soon as its block of GMAP output is read, since GMAP already applied the thresholds
+def __report_unaligned(output, unaligned_callback):
+    
+    query_id = None
+    for output_line in output:
+        if output_line.startswith(">"):
+            query_id = output_line[1:].split(" ")[0]
+        elif output_line.startswith("Paths ") and ("Paths (0)" in output_line or "chimera" in output_line):
+            unaligned_callback(query_id)
+        
+        yield output_line
+    
+    return
+
 # NOTE that this method could create an different format
 # but that has been created like this for further compatibility with
 # existing GMAP -Z (compressed) format.
+# Lines are yielded one by one, so that the output can be streamed to the filter.
 def __compress(output, db_name):
     
-    compressed = []
-    
     new_line = None
     query_id = None
     is_chimera = False
@@ -89,7 +97,7 @@ def __compress(output, db_name):
     direction_exp = re.compile("cDNA direction: (sense|antisense|indeterminate)")
     strand_exp = re.compile("([+-]) strand")
     
-    for output_line in output.strip().split("\n"):
+    for output_line in output:
         
         ##print "M2PGMAP***********************"
         #sys.stdout.write(str(output_line)+"\n")
@@ -106,7 +114,7 @@ def __compress(output, db_name):
         else:
             
             if "chimera" in output_line:
-                compressed.append("chimera")
+                yield "chimera"
                 is_chimera = True
                 query_id = prev_query_id
                 continue
@@ -166,7 +174,7 @@ def __compress(output, db_name):
                         
                         #sys.stderr.write("Inserting new line: "+str(new_line)+"\n")
                         
-                        compressed.append(" ".join(new_line))
+                        yield " ".join(new_line)
                         
                         new_line = None
                     
@@ -203,11 +211,9 @@ def __compress(output, db_name):
         
         #sys.stderr.write("Inserting new line: "+str(new_line)+"\n")
         
-        compressed.append(" ".join(new_line))
+        yield " ".join(new_line)
     
-    #sys.stderr.write("Len results "+str(len(compressed))+"\n")
-    
-    return compressed
+    return
 
 def __filter_gmap_results(results, threshold_id, threshold_cov, db_name, verbose = False):
     filtered_results = []
@@ -221,8 +227,11 @@ def __filter_gmap_results(results, threshold_id, threshold_cov, db_name, verbose
     
     algorithm = "gmap"
     
+    raw_num = 0
     for line in results:
         
+        raw_num += 1
+        
         #sys.stderr.write("m2p_gmap Result "+str(line)+"\n")
         
         # Specific GMAP pre-filter: chimera results
@@ -332,22 +341,23 @@ def __filter_gmap_results(results, threshold_id, threshold_cov, db_name, verbose
         for alignment_result in filter_dict[query_id]["query_list"]:
             filtered_results.append(alignment_result)
     
+    if verbose: sys.stderr.write("m2p_gmap: raw results --> "+str(raw_num)+"\n")
     if verbose: sys.stderr.write("m2p_gmap: number of chimeras found: "+str(chimera_num)+"\n")
     
     return filtered_results
 
+# unaligned_callback, if given, is called with each query without hits while GMAP is still running
 def get_best_score_hits(gmap_app_path, n_threads, query_fasta_path, gmap_dbs_path, db_name, \
-             threshold_id, threshold_cov, verbose = False):
+             threshold_id, threshold_cov, verbose = False, unaligned_callback = None, batch_mode = DEFAULT_BATCH_MODE):
     results = []
     
-    if verbose: sys.stderr.write("m2p_gmap: "+query_fasta_path+" against "+db_name+"\n")
+    if verbose: sys.stderr.write("m2p_gmap: "+str(query_fasta_path)+" against "+db_name+"\n")
     
     results = __gmap(gmap_app_path, n_threads, threshold_id, threshold_cov, query_fasta_path,
-                     gmap_dbs_path, db_name, verbose)
+                     gmap_dbs_path, db_name, verbose, unaligned_callback, batch_mode)
     
-    if verbose: sys.stderr.write("m2p_gmap: raw results --> "+str(len(results))+"\n")
-    if len(results)>0:
-        results = __filter_gmap_results(results, threshold_id, threshold_cov, db_name, verbose)
+    # Raw results are filtered on the fly, keeping only the best scores of each query
+    results = __filter_gmap_results(results, threshold_id, threshold_cov, db_name, verbose)
     if verbose: sys.stderr.write("m2p_gmap: pass-filter results --> "+str(len(results))+"\n")
     #sys.stderr.write(str(results)+"\n")
     
@@ -6,9 +6,8 @@
 # (terms of use can be found within the distributed LICENSE file).
 
 import sys, os
-from subprocess import Popen, PIPE
 
-from barleymapcore.utils.alignment_utils import load_fasta_lengths
+from barleymapcore.utils.alignment_utils import load_fasta_lengths, stream_command_output, get_query_input
 from barleymapcore.m2p_exception import m2pException
 from barleymapcore.alignment.AlignmentResult import *
 
@@ -27,7 +26,6 @@ ALIGN_SCORE = 11
 # ALIGN_QLEN = there is no query len in HS-Blastn tabular results
 
 def __hs_blast(hsblastn_app_path, n_threads, query_fasta_path, hsblastn_dbs_path, db_name, verbose = False):
-    results = []
     
     # CPCantalapiedra 201701
     ###### Check that DB is available for this aligner
@@ -46,43 +44,23 @@ def __hs_blast(hsblastn_app_path, n_threads, query_fasta_path, hsblastn_dbs_path
                 #'-outfmt \"6 qseqid qlen sseqid slen length qstart qend sstart send bitscore evalue pident mismatch gapopen\"'])
     
     blast_db = "".join(["-db ", dbpath]) # blast_db = "".join(["-db ", blast_dbs_path, db_name , ".fa"]) # 
-    blast_query = " ".join(["-query ", query_fasta_path])
+    # A FastaSubset is written to the stdin of HS-Blastn
+    (query_path, query_data) = get_query_input(query_fasta_path)
+    blast_query = " ".join(["-query ", query_path])
     #blast_cmd = " ".join([ResourcesMng.get_deploy_dir()+blast_command, blast_db, blast_query])
     blast_cmd = " ".join([blast_command, blast_db, blast_query])
     
     if verbose: sys.stderr.write(os.path.basename(__file__)+": Running '"+blast_cmd+"'\n")
     
-    retValue = 0
-    FNULL = open(os.devnull, 'w')
-    if verbose:
-        p = Popen(blast_cmd, shell=True, stdout=PIPE, stderr=sys.stderr)
-    else:
-        p = Popen(blast_cmd, shell=True, stdout=PIPE, stderr=PIPE)
-    
-    com_list = p.communicate()
-    output = com_list[0]
-    output_err = com_list[1]
-    retValue = p.returncode
-    
-    if retValue != 0:
-        if verbose:
-            raise Exception(os.path.basename(__file__)+": HS-Blastn return != 0. "+blast_cmd+"\n"+str(output)+"\n")
-        else:
-            raise Exception(os.path.basename(__file__)+": HS-Blastn return != 0. "+blast_cmd+"\n"+str(output)+"\n"+str(output_err)+"\n")
-    
-    if "error" in output or "Error" in output or "ERROR" in output:
-        sys.stderr.write("m2p_hs_blast: error in hs-blastn output. We will report 0 results for this alignment.\n")
-        sys.stderr.write(output+"\n")
-        sys.stderr.write(str(output_err)+"\n")
-        results = []
-    else:
-        if verbose: sys.stderr.write(os.path.basename(__file__)+": HS-Blastn return value "+str(retValue)+"\n")
-        
-        [results.append(line) for line in output.strip().split("\n") if line != ""]
+    # The output of HS-Blastn is consumed line by line as it is produced,
+    # instead of being buffered as a whole with communicate()
+    output = stream_command_output(blast_cmd, os.path.basename(__file__), verbose, query_data)
+    
+    results = (line for line in output if line != "")
     
     return results
 
-def __filter_blast_results(results, threshold_id, threshold_cov, db_name, qlen_dict, verbose = False):
+def __filter_blast_results(results, threshold_id, threshold_cov, db_name, query_fasta_path, verbose = False):
     
     filtered_results = []
     
@@ -94,7 +72,18 @@ def __filter_blast_results(results, threshold_id, threshold_cov, db_name, qlen_d
     
     algorithm = "hsblastn"
     
+    qlen_dict = None
+    
+    raw_num = 0
     for line in results:
+        
+        if "error" in line or "Error" in line or "ERROR" in line:
+            sys.stderr.write("m2p_hs_blast: error in hs-blastn output. We will report 0 results for this alignment.\n")
+            sys.stderr.write(line+"\n")
+            return []
+        
+        raw_num += 1
+        
         line_data = line.split("\t")
         
         # filter: based on identity
@@ -108,7 +97,8 @@ def __filter_blast_results(results, threshold_id, threshold_cov, db_name, qlen_d
         query_id = line_data[ALIGN_QUERY]
         
         # HS-Blastn does not report the query length
-        # so we obtain it from a previously set up dictionary
+        # so we obtain it from a dictionary, loaded with the first result
+        if qlen_dict == None: qlen_dict = load_fasta_lengths(query_fasta_path)
         query_len = qlen_dict[query_id]
         
         query_cov = (align_len/float(query_len))*100
@@ -158,21 +148,20 @@ def __filter_blast_results(results, threshold_id, threshold_cov, db_name, qlen_d
         for alignment_result in filter_dict[query_id]["query_list"]:
             filtered_results.append(alignment_result)
     
+    if verbose: sys.stderr.write(os.path.basename(__file__)+": raw results --> "+str(raw_num)+"\n")
+    
     return filtered_results
 
 def get_best_score_hits(hsblastn_app_path, n_threads, query_fasta_path, hsblastn_dbs_path, db_name, \
                         threshold_id, threshold_cov, verbose = False):
     
-    if verbose: sys.stderr.write(os.path.basename(__file__)+": "+query_fasta_path+" against "+db_name+"\n")
+    if verbose: sys.stderr.write(os.path.basename(__file__)+": "+str(query_fasta_path)+" against "+db_name+"\n")
     
     results = __hs_blast(hsblastn_app_path, n_threads, query_fasta_path, hsblastn_dbs_path, db_name, verbose)
     
-    if verbose: sys.stderr.write(os.path.basename(__file__)+": raw results --> "+str(len(results))+"\n")
+    # Raw results are filtered on the fly, keeping only the best scores of each query
+    results = __filter_blast_results(results, threshold_id, threshold_cov, db_name, query_fasta_path, verbose)
     
-    if len(results)>0:
-        qlen_dict = load_fasta_lengths(query_fasta_path)
-        results = __filter_blast_results(results, threshold_id, threshold_cov, db_name, qlen_dict, verbose)
-        
     if verbose: sys.stderr.write(os.path.basename(__file__)+": pass-filter results --> "+str(len(results))+"\n")
     #sys.stderr.write(str(len(results))+"\n")
     #sys.stderr.write(str(results)+"\n")
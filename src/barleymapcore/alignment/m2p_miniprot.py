@@ -7,10 +7,10 @@
 # (terms of use can be found within the distributed LICENSE file).
 
 import sys, re, os
-from subprocess import Popen, PIPE
 
 from barleymapcore.alignment.AlignmentResult import *
 from barleymapcore.m2p_exception import m2pException
+from barleymapcore.utils.alignment_utils import stream_command_output, get_query_input
 
 #from Aligners import SELECTION_BEST_SCORE, SELECTION_NONE
 
@@ -19,8 +19,6 @@ MAX_NUMBER_PATHS_PER_QUERY = 100
 
 def __miniprot(miniprot_app_path, n_threads, threshold_id, threshold_cov, query_fasta_path, miniprot_dbs_path, db_name, verbose = False):
 
-    results = []
-    
     ###### Check that DB is available for this aligner
     dbpath = miniprot_dbs_path + "/" + db_name
     dbpathfile = dbpath + ".mpi"
@@ -32,10 +30,13 @@ def __miniprot(miniprot_app_path, n_threads, threshold_id, threshold_cov, query_
     miniprot_thres_id = float(threshold_id) / 100.0
     miniprot_thres_cov = float(threshold_cov) / 100.0
 
+    # A FastaSubset is written to the stdin of miniprot
+    (query_path, query_data) = get_query_input(query_fasta_path)
+    
     # build actual miniprot call 
     miniprot_cmd = "".join([miniprot_app_path, \
                    " ",dbpathfile,
-                   " ",query_fasta_path,
+                   " ",query_path,
                    " -t ", str(n_threads), \
                    " --gff --outc=", str(miniprot_thres_cov)])
     
@@ -43,29 +44,12 @@ def __miniprot(miniprot_app_path, n_threads, threshold_id, threshold_cov, query_
     
     if verbose: sys.stderr.write("m2p_miniprot: Executing '"+miniprot_cmd+"'\n")
     
-    retValue = 0
-    FNULL = open(os.devnull, 'w')
-    if verbose:
-        p = Popen(miniprot_cmd, shell=True, stdout=PIPE, stderr=sys.stderr)
-    else:
-        p = Popen(miniprot_cmd, shell=True, stdout=PIPE, stderr=PIPE)
-    
-    com_list = p.communicate()
-    output = com_list[0]
-    output_err = com_list[1]
-    retValue = p.returncode
+    # The output is consumed line by line as it is produced,
+    # instead of being buffered as a whole with communicate()
+    output = stream_command_output(miniprot_cmd, "m2p_miniprot", verbose, query_data)
     
-    if retValue != 0:
-        if verbose:
-            raise Exception("m2p_miniprot: return != 0. "+miniprot_cmd+"\n"+str(output)+"\n")
-        else:
-            raise Exception("m2p_miniprot: return != 0. "+miniprot_cmd+"\nError: "+str(output_err)+"\n")
+    results = (line for line in output if line != "")
     
-    else:
-        if verbose: sys.stderr.write("m2p_miniprot: MINIPROT return value "+str(retValue)+"\n")
-
-        [results.append(line) for line in output.strip().split("\n") if line != ""]
-
     return results
 
 
@@ -80,7 +64,10 @@ def __filter_miniprot_results(results, threshold_id, threshold_cov, db_name, ver
     
     algorithm = "miniprot"
     
+    raw_num = 0
     for line in results:
+        
+        raw_num += 1
     
         # https://lh3.github.io/miniprot/miniprot.html#9
         # ##PAF A0A4Y1QZC6_PRUDU 281 3 281 - NC_047651.1 26138581 13209470 13214284 834 834 0 AS:i:1141 ...
@@ -135,6 +122,8 @@ def __filter_miniprot_results(results, threshold_id, threshold_cov, db_name, ver
                         
                         filtered_results.append(result_tuple)
     
+    if verbose: sys.stderr.write("m2p_miniprot: raw results --> "+str(raw_num)+"\n")
+    
     return filtered_results
 
 
@@ -142,14 +131,13 @@ def get_best_score_hits(miniprot_app_path, n_threads, query_fasta_path, miniprot
              threshold_id, threshold_cov, verbose = False):
     results = []
     
-    if verbose: sys.stderr.write("m2p_miniprot: "+query_fasta_path+" against "+db_name+"\n")
+    if verbose: sys.stderr.write("m2p_miniprot: "+str(query_fasta_path)+" against "+db_name+"\n")
     
     results = __miniprot(miniprot_app_path, n_threads, threshold_id, threshold_cov, query_fasta_path,
                      miniprot_dbs_path, db_name, verbose)
     
-    if verbose: sys.stderr.write("m2p_miniprot: raw results --> "+str(len(results))+"\n")
-    if len(results)>0:
-        results = __filter_miniprot_results(results, threshold_id, threshold_cov, db_name, verbose)
+    # Raw results are filtered on the fly
+    results = __filter_miniprot_results(results, threshold_id, threshold_cov, db_name, verbose)
     if verbose: sys.stderr.write("m2p_miniprot: pass-filter results --> "+str(len(results))+"\n")
     #sys.stderr.write(str(results)+"\n")
     
@@ -5,18 +5,29 @@
 # Copyright (C)  2013-2014  Carlos P Cantalapiedra.
 # (terms of use can be found within the distributed LICENSE file).
 
-import sys, os
-from subprocess import Popen, PIPE
+import sys, os, threading, heapq, Queue
 
 from barleymapcore.m2p_exception import m2pException
 from barleymapcore.alignment.AlignmentResult import *
+from barleymapcore.utils.alignment_utils import stream_command_output, get_fasta_records
 
 #from Aligners import SELECTION_BEST_SCORE, SELECTION_NONE
 
 ALIGNER = "Blastn(SplitBlast)-Megablast"
 
+# Number of shards of the query for each thread,
+# so that a thread which ends its shard early takes another one
+SHARDS_PER_THREAD = 4
+# Lines of output passed at once from the workers, and batches waiting to be consumed
+OUTPUT_BATCH_SIZE = 1000
+OUTPUT_QUEUE_SIZE = 64
+
+# Put in the output queue by each worker when it ends
+_WORKER_END = None
+
+# The split_blast_path parameter is kept for compatibility,
+# the query is now split and aligned without split_blast.pl
 def __split_blast(split_blast_path, blast_app_path, n_threads, query_fasta_path, blast_dbs_path, db_name, verbose = False):
-    results = []
     
     # CPCantalapiedra 201701
     ###### Check that DB is available for this aligner
@@ -30,61 +41,131 @@ def __split_blast(split_blast_path, blast_app_path, n_threads, query_fasta_path,
         
         raise m2pException("DB path "+dbpath+" for "+ALIGNER+" aligner NOT FOUND.")
     
-    ###### Split blast bins
-    ###### Retrieve num of fasta seqs to calculate necessary bins
-    retValue = 0
-    p = Popen(" ".join(["cat", query_fasta_path, " | grep -c \"^>\""]), \
-              shell=True, stdout=PIPE, stderr=sys.stderr)
-    output = p.communicate()[0]
-    retValue = p.returncode
-    if retValue == 0:
-        num_of_seqs = int(output)
-        split_blast_bins = (num_of_seqs / 50) + 1
-    else:
-        split_blast_bins = 100
+    ###### Split the query in shards of similar total length
+    shards = __get_shards(get_fasta_records(query_fasta_path), n_threads)
+    
+    if verbose: sys.stderr.write("m2p_split_blast: query split in "+str(len(shards))+" shards\n")
     
-    ###### Split blast
-    blast_command = " ".join([split_blast_path+"split_blast.pl", str(n_threads), str(split_blast_bins), blast_app_path, \
+    ###### Blast of each shard, reading the query from stdin
+    blast_command = " ".join([blast_app_path, \
                 "-dust no -soft_masking false -task megablast", \
-                '-outfmt \\"6 qseqid qlen sseqid slen length qstart qend sstart send bitscore evalue pident mismatch gapopen\\"'])
+                '-outfmt "6 qseqid qlen sseqid slen length qstart qend sstart send bitscore evalue pident mismatch gapopen"'])
     
-    blast_db = "".join(["-db ", dbpath]) # blast_db = "".join(["-db ", blast_dbs_path, db_name , ".fa"]) # 
-    blast_query = " ".join(["-query ", query_fasta_path])
-    #blast_cmd = " ".join([ResourcesMng.get_deploy_dir()+blast_command, blast_db, blast_query])
+    blast_db = "".join(["-db ", dbpath])
+    blast_query = "-query -"
     blast_cmd = " ".join([blast_command, blast_db, blast_query])
     
     if verbose: sys.stderr.write("m2p_split_blast: Executing '"+blast_cmd+"'\n")
     
-    retValue = 0
-    FNULL = open(os.devnull, 'w')
-    if verbose:
-        p = Popen(blast_cmd, shell=True, stdout=PIPE, stderr=sys.stderr)
-    else:
-        p = Popen(blast_cmd, shell=True, stdout=PIPE, stderr=PIPE)
+    # The output of Blast is consumed line by line as it is produced,
+    # instead of being buffered as a whole with communicate()
+    output = __run_shards(blast_cmd, shards, n_threads, verbose)
     
-    com_list = p.communicate()
-    output = com_list[0]
-    output_err = com_list[1]
-    retValue = p.returncode
+    results = (line for line in output if line != "" and not line.startswith("#"))
     
-    if retValue != 0:
-        if verbose:
-            raise Exception("m2p_split_blast: Blast return != 0. "+blast_cmd+"\n"+str(output)+"\n")
-        else:
-            raise Exception("m2p_split_blast: Blast return != 0. "+blast_cmd+"\n"+str(output)+"\n"+str(output_err)+"\n")
+    return results
+
+# Splits the (header, sequence) records in shards, balanced by the total length of their sequences.
+# Each sequence is added to the shard with less total length, from the longest sequence to the shortest.
+# Returns the shards, as lists of fasta records, from the longest to the shortest.
+def __get_shards(fasta_records, n_threads):
     
-    if "error" in output or "Error" in output or "ERROR" in output:
-        sys.stderr.write("m2p_split_blast: error in blast output. We will report 0 results for this alignment.\n")
-        sys.stderr.write(output+"\n")
-        sys.stderr.write(str(output_err)+"\n")
-        results = []
+    if n_threads > 1:
+        num_shards = min(len(fasta_records), n_threads*SHARDS_PER_THREAD)
     else:
-        if verbose: sys.stderr.write("m2p_split_blast: Blast return value "+str(retValue)+"\n")
+        num_shards = min(len(fasta_records), 1)
+    
+    shards = [[] for i in range(num_shards)]
+    shards_heap = [(0, i) for i in range(num_shards)]
+    
+    for (header, sequence) in sorted(fasta_records, key=lambda record: len(record[1]), reverse=True):
+        (shard_len, shard_num) = heapq.heappop(shards_heap)
+        shards[shard_num].append(">"+header+"\n"+sequence+"\n")
+        heapq.heappush(shards_heap, (shard_len+len(sequence), shard_num))
+    
+    shards_lens = dict((shard_num, shard_len) for (shard_len, shard_num) in shards_heap)
+    
+    return [shards[num] for num in sorted(shards_lens, key=shards_lens.get, reverse=True)]
+
+# Runs blast_cmd for each shard with a pool of n_threads workers
+# and yields the lines of output of all of them, as they are produced
+def __run_shards(blast_cmd, shards, n_threads, verbose = False):
+    
+    if len(shards) == 0: return
+    
+    # A single shard is aligned in this thread
+    if len(shards) == 1:
+        for line in stream_command_output(blast_cmd, "m2p_split_blast", verbose, shards[0]):
+            yield line
+        return
+    
+    shards_queue = Queue.Queue()
+    for shard in shards:
+        shards_queue.put(shard)
+    
+    output_queue = Queue.Queue(OUTPUT_QUEUE_SIZE)
+    stop = threading.Event()
+    
+    num_workers = min(n_threads, len(shards))
+    workers = []
+    for i in range(num_workers):
+        worker = threading.Thread(target=_shard_worker, args=(blast_cmd, shards_queue, output_queue, stop, verbose))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+    
+    ended_workers = 0
+    try:
+        while ended_workers < num_workers:
+            output = output_queue.get()
+            if output is _WORKER_END:
+                ended_workers += 1
+            elif isinstance(output, Exception):
+                raise output
+            else:
+                for line in output:
+                    yield line
+    finally:
+        # Stop the workers, consuming their pending output so that none is blocked
+        stop.set()
+        while ended_workers < num_workers:
+            if output_queue.get() is _WORKER_END:
+                ended_workers += 1
         
-        [results.append(line) for line in output.strip().split("\n") if line != "" and not line.startswith("#")]
-        # startswith("#") due to split_blast.pl printing in stdout comments, warnings and so on
+        for worker in workers:
+            worker.join()
     
-    return results
+    return
+
+def _shard_worker(blast_cmd, shards_queue, output_queue, stop, verbose):
+    try:
+        while not stop.is_set():
+            try:
+                shard = shards_queue.get_nowait()
+            except Queue.Empty:
+                break
+            
+            output = stream_command_output(blast_cmd, "m2p_split_blast", verbose, shard)
+            try:
+                lines = []
+                for line in output:
+                    lines.append(line)
+                    if len(lines) >= OUTPUT_BATCH_SIZE:
+                        if stop.is_set(): break
+                        output_queue.put(lines)
+                        lines = []
+                
+                if len(lines) > 0 and not stop.is_set():
+                    output_queue.put(lines)
+            finally:
+                output.close()
+    
+    except Exception as e:
+        output_queue.put(e)
+    finally:
+        output_queue.put(_WORKER_END)
+    
+    return
 
 def __filter_blast_results(results, threshold_id, threshold_cov, db_name, verbose = False):
     
@@ -98,7 +179,16 @@ def __filter_blast_results(results, threshold_id, threshold_cov, db_name, verbos
     
     algorithm = "blastn"
     
+    raw_num = 0
     for line in results:
+        
+        if "error" in line or "Error" in line or "ERROR" in line:
+            sys.stderr.write("m2p_split_blast: error in blast output. We will report 0 results for this alignment.\n")
+            sys.stderr.write(line+"\n")
+            return []
+        
+        raw_num += 1
+        
         line_data = line.split("\t")
         
         # filter: based on identity
@@ -157,20 +247,20 @@ def __filter_blast_results(results, threshold_id, threshold_cov, db_name, verbos
         for alignment_result in filter_dict[query_id]["query_list"]:
             filtered_results.append(alignment_result)
     
+    if verbose: sys.stderr.write("m2p_split_blast: raw results --> "+str(raw_num)+"\n")
+    
     return filtered_results
 
 def get_best_score_hits(split_blast_path, blast_app_path, n_threads, query_fasta_path, blast_dbs_path, db_name, \
                         threshold_id, threshold_cov, verbose = False):
     
-    if verbose: sys.stderr.write("m2p_split_blast: "+query_fasta_path+" against "+db_name+"\n")
+    if verbose: sys.stderr.write("m2p_split_blast: "+str(query_fasta_path)+" against "+db_name+"\n")
     
     results = __split_blast(split_blast_path, blast_app_path, n_threads, query_fasta_path, blast_dbs_path, db_name, verbose)
     
-    if verbose: sys.stderr.write("m2p_split_blast: raw results --> "+str(len(results))+"\n")
+    # Raw results are filtered on the fly, keeping only the best scores of each query
+    results = __filter_blast_results(results, threshold_id, threshold_cov, db_name, verbose)
     
-    if len(results)>0:
-        results = __filter_blast_results(results, threshold_id, threshold_cov, db_name, verbose)
-        
     if verbose: sys.stderr.write("m2p_split_blast: pass-filter results --> "+str(len(results))+"\n")
     #sys.stderr.write(str(len(results))+"\n")
     #sys.stderr.write(str(results)+"\n")
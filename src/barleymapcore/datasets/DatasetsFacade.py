@@ -22,11 +22,12 @@ class DatasetsFacade(DatasetsRetriever):
     
     _datasets_retriever = None
     
-    def __init__(self, datasets_config, datasets_path, maps_path, verbose = True):
+    # n_threads: number of datasets read at the same time to retrieve features
+    def __init__(self, datasets_config, datasets_path, maps_path, verbose = True, n_threads = DatasetsRetriever.DEFAULT_N_THREADS):
         self._datasets_config = datasets_config
         self._datasets_path = datasets_path
         self._verbose = verbose
-        self._datasets_retriever = DatasetsRetriever(datasets_config, datasets_path, maps_path, verbose)
+        self._datasets_retriever = DatasetsRetriever(datasets_config, datasets_path, maps_path, verbose, n_threads)
     
     def get_results(self):
         return self._datasets_retriever.get_results()
@@ -81,4 +82,30 @@ class DatasetsFacade(DatasetsRetriever):
         
         return featured_map_intervals
     
+    ### Obtain features of several types within a series of alignment intervals
+    ### reading each dataset once. Returns a dict: features_dict[feature_type] = features
+    def retrieve_features_by_pos_types(self, map_intervals, map_config, chrom_dict, map_sort_by, dataset_list, feature_types):
+        
+        if self._verbose: sys.stderr.write("DatasetsFacade: loading features of types "+",".join(feature_types)+" associated to physical positions...\n")
+        
+        multiple_param = True
+        
+        features_dict = self._datasets_retriever.retrieve_datasets_by_pos_types(map_intervals, dataset_list, map_config, chrom_dict,
+                                                                                multiple_param, map_sort_by, feature_types)
+        
+        return features_dict
+    
+    ### Obtain features of several types on each of a series of alignment intervals
+    ### reading each dataset once. Returns a dict: featured_intervals_dict[feature_type] = featured_map_intervals
+    def retrieve_features_on_pos_types(self, map_intervals, map_config, chrom_dict, map_sort_by, dataset_list, feature_types):
+        
+        if self._verbose: sys.stderr.write("DatasetsFacade: loading features of types "+",".join(feature_types)+" associated to physical positions...\n")
+        
+        multiple_param = True
+        
+        featured_intervals_dict = self._datasets_retriever.retrieve_datasets_on_pos_types(map_intervals, dataset_list, map_config, chrom_dict,
+                                                                                          multiple_param, map_sort_by, feature_types)
+        
+        return featured_intervals_dict
+    
 ## END
\ No newline at end of file
@@ -5,27 +5,39 @@
 # Copyright (C)  2017  Carlos P Cantalapiedra.
 # (terms of use can be found within the distributed LICENSE file).
 
-import sys, os
+import sys, os, threading, Queue
 
 from barleymapcore.db.DatasetsConfig import DatasetsConfig
 from barleymapcore.maps.reader.MappingsParser import MappingsParser
+from barleymapcore.maps.reader.IndexFiles import KeysFilter, index_is_available
 from barleymapcore.maps.enrichment.FeatureMapping import FeaturesFactory
+from barleymapcore.maps.MapInterval import FeaturedMapInterval
 from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
+
+# Names of the counters of metrics_utils
+FILTER_SKIPS = "datasets_retriever.filter_skips" # datasets not read because of their KeysFilter
 
 class DatasetsRetriever(object):
     
     _datasets_config = None
     _datasets_path = None
     _maps_path = None
+    _n_threads = 1
     _verbose = False
     
     _results = None
     _unmapped = None
     
-    def __init__(self, datasets_config, datasets_path, maps_path, verbose = False):
+    # Number of datasets read at the same time to retrieve features
+    # (1: one dataset after the other)
+    DEFAULT_N_THREADS = 1
+    
+    def __init__(self, datasets_config, datasets_path, maps_path, verbose = False, n_threads = DEFAULT_N_THREADS):
         self._datasets_config = datasets_config
         self._datasets_path = datasets_path
         self._maps_path = maps_path
+        self._n_threads = n_threads
         self._verbose = verbose
     
     def load_synonyms(self, synonyms):
@@ -89,6 +101,32 @@ class DatasetsRetriever(object):
         
         return ret_value
     
+    # Checks the filter of keys of a dataset file (bmap_datasets_index), if available,
+    # and returns False only if none of the queries are in the dataset
+    def _dataset_has_queries(self, dataset_map_path, synonyms_path, queries):
+        ret_value = True
+        
+        filter_path = dataset_map_path+KeysFilter.FILE_EXT
+        if not index_is_available(filter_path, dataset_map_path):
+            return ret_value
+        
+        # Queries which are synonyms of the markers could not be found in a filter without synonyms
+        has_synonyms = synonyms_path != "" and synonyms_path != DatasetsConfig.SYNONYMS_NO
+        if has_synonyms and not index_is_available(filter_path, synonyms_path):
+            return ret_value
+        
+        keys_filter = KeysFilter(filter_path)
+        try:
+            if has_synonyms and not keys_filter.has_synonyms():
+                sys.stderr.write("WARNING: DatasetsRetriever: filter "+str(filter_path)+" has no synonyms. "+\
+                                 "It will be ignored. Please, re-create it with the synonyms file.\n")
+            else:
+                ret_value = keys_filter.contains_any(queries)
+        finally:
+            keys_filter.close()
+        
+        return ret_value
+    
     def retrieve_datasets_by_id(self, query_ids_path, dataset_list, map_config, chrom_dict, multiple_param = True):
         self._results = []
         
@@ -157,9 +195,17 @@ class DatasetsRetriever(object):
                 
                 sys.stderr.write("\t\t path: "+dataset_map_path+"\n")
                 
+                synonyms_path = dataset_config.get_synonyms()
+                
+                # Skip the dataset, without loading its synonyms nor reading it,
+                # if none of the queries left are in it
+                if not self._dataset_has_queries(dataset_map_path, synonyms_path, temp_query_dict):
+                    sys.stderr.write("\t\t no queries in the filter of the dataset, skipped\n")
+                    metrics_utils.count(FILTER_SKIPS)
+                    continue
+                
                 if self._verbose: sys.stderr.write("\t\t loading synonyms\n")
                 
-                synonyms_path = dataset_config.get_synonyms()
                 dataset_synonyms = self.load_synonyms(synonyms_path)
                 
                 sys.stderr.write("\t\t synonyms: "+synonyms_path+"\n")
@@ -173,8 +219,9 @@ class DatasetsRetriever(object):
                 if self._verbose: sys.stderr.write("\t\t parsing dataset file\n")
                 
                 mappings_parser = MappingsParser()
-                map_results = mappings_parser.parse_mapping_file_by_id(temp_query_dict, dataset_map_path, map_config, chrom_dict,
-                                                      multiple_param, dataset_synonyms, test_set)
+                with metrics_utils.stage("dataset_retrieval", dataset = dataset, map = map_id):
+                    map_results = mappings_parser.parse_mapping_file_by_id(temp_query_dict, dataset_map_path, map_config, chrom_dict,
+                                                          multiple_param, dataset_synonyms, test_set)
                 
             else:
                 # TODO refactor to handled exception
@@ -203,98 +250,219 @@ class DatasetsRetriever(object):
         
         return
     
+    # Returns the type, among feature_types, of the features of a dataset of dataset_type
+    # or None if the dataset does not provide any of feature_types
+    # Note that MAP type is a subtype of ANCHORED and therefore MAP types are accepted with ANCHORED filtering
+    @staticmethod
+    def get_feature_type(dataset_type, feature_types):
+        feature_type = None
+        
+        if dataset_type in feature_types:
+            feature_type = dataset_type
+        elif dataset_type == DatasetsConfig.DATASET_TYPE_MAP and DatasetsConfig.DATASET_TYPE_ANCHORED in feature_types:
+            feature_type = DatasetsConfig.DATASET_TYPE_ANCHORED
+        
+        return feature_type
+    
     def retrieve_datasets_by_pos(self, map_intervals, dataset_list, map_config, chrom_dict,
                                  multiple_param, map_sort_by, feature_type = DatasetsConfig.DATASET_TYPE_GENETIC_MARKER):
+        
+        features_dict = self.retrieve_datasets_by_pos_types(map_intervals, dataset_list, map_config, chrom_dict,
+                                                            multiple_param, map_sort_by, [feature_type])
+        
+        return features_dict[feature_type]
+    
+    ## This method searches the features of several types at once,
+    ## reading each dataset only once, and returns a dict
+    ## with the list of features of each type: features_dict[feature_type] = features
+    def retrieve_datasets_by_pos_types(self, map_intervals, dataset_list, map_config, chrom_dict,
+                                       multiple_param, map_sort_by, feature_types):
+        features_dict = dict([(feature_type, []) for feature_type in feature_types])
+        
+        retrieve_dataset = lambda dataset: self._retrieve_dataset_by_pos(dataset, map_intervals, map_config, chrom_dict,
+                                                                         map_sort_by, feature_types)
+        
+        # The features of each dataset are merged in the order of dataset_list
+        for dataset_features in self._retrieve_datasets(retrieve_dataset, dataset_list):
+            if dataset_features == None: continue
+            
+            (feature_type, features) = dataset_features
+            features_dict[feature_type].extend(features)
+        
+        return features_dict
+    
+    # Returns (feature_type, features) of a dataset within the intervals
+    # or None if the dataset does not share databases with the map or is not of any of feature_types
+    def _retrieve_dataset_by_pos(self, dataset, map_intervals, map_config, chrom_dict, map_sort_by, feature_types):
         features = []
         
         map_id = map_config.get_id()
         
-        # Look for markers for each dataset
-        for dataset in dataset_list:
-            
-            sys.stderr.write("\t dataset: "+dataset+"\n")
-            
-            # Check if map and dataset do share databases
-            dataset_config = self._datasets_config.get_dataset_config(dataset)
-            if not self.common_dbs(dataset_config, map_config):
-                continue
-            
-            dataset_type = dataset_config.get_dataset_type()
-            dataset_name = dataset_config.get_dataset_name()#datasets_dict[dataset]["dataset_name"]
-            
-            ####### If dataset type is the type requested, pass, else (dataset type does not match the one requested) continue
-            ###### Note that MAP type is a subtype of ANCHORED and therefore MAP types are accepted with ANCHORED filtering
-            if dataset_type == feature_type or (dataset_type == DatasetsConfig.DATASET_TYPE_MAP and feature_type == DatasetsConfig.DATASET_TYPE_ANCHORED):
-                pass
-            else:
-                continue
-            
-            if self._verbose: sys.stderr.write("\t dataset: "+dataset+"\n")
-            
-            ########## Retrieve markers within intervals
-            ##########
-            dataset_map_path = self.get_dataset_path(dataset, map_id, dataset_type)
-            
-            sys.stderr.write("\t\t path: "+dataset_map_path+"\n")
+        sys.stderr.write("\t dataset: "+dataset+"\n")
+        
+        # Check if map and dataset do share databases
+        dataset_config = self._datasets_config.get_dataset_config(dataset)
+        if not self.common_dbs(dataset_config, map_config):
+            return None
+        
+        dataset_type = dataset_config.get_dataset_type()
+        dataset_name = dataset_config.get_dataset_name()#datasets_dict[dataset]["dataset_name"]
+        
+        ####### If dataset type is one of the types requested, pass, else continue
+        feature_type = self.get_feature_type(dataset_type, feature_types)
+        if feature_type == None:
+            return None
+        
+        if self._verbose: sys.stderr.write("\t dataset: "+dataset+"\n")
+        
+        ########## Retrieve markers within intervals
+        ##########
+        dataset_map_path = self.get_dataset_path(dataset, map_id, dataset_type)
+        
+        sys.stderr.write("\t\t path: "+dataset_map_path+"\n")
+        
+        if os.path.exists(dataset_map_path) and os.path.isfile(dataset_map_path):
+            if self._verbose: sys.stderr.write("DatasetsRetriever: loading features from map data: "+dataset_map_path+"\n")
             
-            if os.path.exists(dataset_map_path) and os.path.isfile(dataset_map_path):
-                if self._verbose: sys.stderr.write("DatasetsRetriever: loading features from map data: "+dataset_map_path+"\n")
-                
-                mappings_parser = MappingsParser()
+            mappings_parser = MappingsParser()
+            with metrics_utils.stage("dataset_retrieval", dataset = dataset, map = map_id):
                 mapping_results_list = mappings_parser.parse_mapping_file_by_pos(map_intervals, dataset_map_path, chrom_dict, map_config, map_sort_by)
+            
+            for mapping_result in mapping_results_list:
+                marker_id = mapping_result.get_marker_id()
                 
-                for mapping_result in mapping_results_list:
-                    marker_id = mapping_result.get_marker_id()
-                    
-                    feature_mapping = FeaturesFactory.get_feature(marker_id, dataset, dataset_name, feature_type, mapping_result)
-                    features.append(feature_mapping)
-                
-                #features.extend(dataset_features)
+                feature_mapping = FeaturesFactory.get_feature(marker_id, dataset, dataset_name, feature_type, mapping_result)
+                features.append(feature_mapping)
         
-        return features
+        return (feature_type, features)
     
     ## This method searches features in each map_interval
     ## independently of the other map_intervals
     def retrieve_datasets_on_pos(self, map_intervals, dataset_list, map_config, chrom_dict,
                                  multiple_param, map_sort_by, feature_type = DatasetsConfig.DATASET_TYPE_GENETIC_MARKER):
         
-        map_id = map_config.get_id()
+        featured_intervals_dict = self.retrieve_datasets_on_pos_types(map_intervals, dataset_list, map_config, chrom_dict,
+                                                                      multiple_param, map_sort_by, [feature_type])
         
-        # Look for markers for each dataset
-        for dataset in dataset_list:
-            
-            sys.stderr.write("\t dataset: "+dataset+"\n")
-            
-            # Check if map and dataset do share databases
-            dataset_config = self._datasets_config.get_dataset_config(dataset)
-            if not self.common_dbs(dataset_config, map_config):
-                continue
-            
-            dataset_type = dataset_config.get_dataset_type()
-            dataset_name = dataset_config.get_dataset_name()#datasets_dict[dataset]["dataset_name"]
-            
-            ####### If dataset type is the type requested, pass, else (dataset type does not match the one requested) continue
-            ###### Note that MAP type is a subtype of ANCHORED and therefore MAP types are accepted with ANCHORED filtering
-            if dataset_type == feature_type or (dataset_type == DatasetsConfig.DATASET_TYPE_MAP and feature_type == DatasetsConfig.DATASET_TYPE_ANCHORED):
-                pass
+        return featured_intervals_dict[feature_type]
+    
+    ## Same as retrieve_datasets_on_pos, for several feature types at once.
+    ## The features of the first type are added to map_intervals,
+    ## and those of the other types to new FeaturedMapIntervals of the same MapIntervals.
+    ## Returns a dict: featured_intervals_dict[feature_type] = featured_map_intervals
+    def retrieve_datasets_on_pos_types(self, map_intervals, dataset_list, map_config, chrom_dict,
+                                       multiple_param, map_sort_by, feature_types):
+        featured_intervals_dict = {}
+        for feature_type in feature_types:
+            if len(featured_intervals_dict) == 0:
+                featured_intervals_dict[feature_type] = map_intervals
             else:
-                continue
-            
-            if self._verbose: sys.stderr.write("\t dataset: "+dataset+"\n")
-            
-            ########## Retrieve markers within intervals
-            ##########
-            dataset_map_path = self.get_dataset_path(dataset, map_id, dataset_type)
+                featured_intervals_dict[feature_type] = [FeaturedMapInterval(featured_map_interval.get_map_interval())
+                                                         for featured_map_interval in map_intervals]
+        
+        retrieve_dataset = lambda dataset: self._retrieve_dataset_on_pos(dataset, map_intervals, map_config, chrom_dict,
+                                                                         map_sort_by, feature_types)
+        
+        # The features of each dataset are merged in the order of dataset_list
+        for dataset_features in self._retrieve_datasets(retrieve_dataset, dataset_list):
+            if dataset_features == None: continue
             
-            sys.stderr.write("\t\t path: "+dataset_map_path+"\n")
+            (feature_type, dataset_intervals) = dataset_features
+            for (featured_map_interval, dataset_interval) in zip(featured_intervals_dict[feature_type], dataset_intervals):
+                featured_map_interval.get_features().extend(dataset_interval.get_features())
+        
+        return featured_intervals_dict
+    
+    # Returns (feature_type, featured_map_intervals) with the features of a dataset
+    # on new FeaturedMapIntervals of the same MapIntervals than map_intervals,
+    # or None if the dataset does not share databases with the map or is not of any of feature_types
+    def _retrieve_dataset_on_pos(self, dataset, map_intervals, map_config, chrom_dict, map_sort_by, feature_types):
+        
+        map_id = map_config.get_id()
+        
+        sys.stderr.write("\t dataset: "+dataset+"\n")
+        
+        # Check if map and dataset do share databases
+        dataset_config = self._datasets_config.get_dataset_config(dataset)
+        if not self.common_dbs(dataset_config, map_config):
+            return None
+        
+        dataset_type = dataset_config.get_dataset_type()
+        dataset_name = dataset_config.get_dataset_name()#datasets_dict[dataset]["dataset_name"]
+        
+        ####### If dataset type is one of the types requested, pass, else continue
+        feature_type = self.get_feature_type(dataset_type, feature_types)
+        if feature_type == None:
+            return None
+        
+        if self._verbose: sys.stderr.write("\t dataset: "+dataset+"\n")
+        
+        featured_map_intervals = [FeaturedMapInterval(featured_map_interval.get_map_interval())
+                                  for featured_map_interval in map_intervals]
+        
+        ########## Retrieve markers within intervals
+        ##########
+        dataset_map_path = self.get_dataset_path(dataset, map_id, dataset_type)
+        
+        sys.stderr.write("\t\t path: "+dataset_map_path+"\n")
+        
+        if os.path.exists(dataset_map_path) and os.path.isfile(dataset_map_path):
+            if self._verbose: sys.stderr.write("DatasetsRetriever: loading features from map data: "+dataset_map_path+"\n")
             
-            if os.path.exists(dataset_map_path) and os.path.isfile(dataset_map_path):
-                if self._verbose: sys.stderr.write("DatasetsRetriever: loading features from map data: "+dataset_map_path+"\n")
-                
-                mappings_parser = MappingsParser()
-                featured_map_intervals = mappings_parser.parse_mapping_file_on_pos(map_intervals, dataset_map_path, chrom_dict, map_config, map_sort_by,
-                                                                                   dataset, dataset_name, feature_type)
+            mappings_parser = MappingsParser()
+            with metrics_utils.stage("dataset_retrieval", dataset = dataset, map = map_id):
+                mappings_parser.parse_mapping_file_on_pos(featured_map_intervals, dataset_map_path, chrom_dict, map_config, map_sort_by,
+                                                          dataset, dataset_name, feature_type)
+        
+        return (feature_type, featured_map_intervals)
+    
+    ## Returns the result of retrieve_function for each dataset, in the same order than dataset_list.
+    ## Up to n_threads datasets are read at the same time, each one in a thread of a pool of workers
+    def _retrieve_datasets(self, retrieve_function, dataset_list):
+        
+        num_workers = min(self._n_threads, len(dataset_list))
+        
+        if num_workers <= 1:
+            return [retrieve_function(dataset) for dataset in dataset_list]
+        
+        results = [None]*len(dataset_list)
+        errors = []
+        
+        datasets_queue = Queue.Queue()
+        for dataset_pos in range(len(dataset_list)):
+            datasets_queue.put(dataset_pos)
+        
+        # The stages of the workers are children of the current one
+        parent = metrics_utils.get_current_stage()
+        
+        def retrieve_worker():
+            with metrics_utils.parent_stage(parent):
+                while len(errors) == 0:
+                    try:
+                        dataset_pos = datasets_queue.get_nowait()
+                    except Queue.Empty:
+                        break
+                    
+                    try:
+                        results[dataset_pos] = retrieve_function(dataset_list[dataset_pos])
+                    except Exception as e:
+                        errors.append(e)
+        
+        if self._verbose: sys.stderr.write("DatasetsRetriever: reading "+str(len(dataset_list))+" datasets with "+str(num_workers)+" threads\n")
+        
+        workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=retrieve_worker)
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        
+        for worker in workers:
+            worker.join()
+        
+        for error in errors:
+            raise error
         
-        return featured_map_intervals
+        return results
 
 ## END
\ No newline at end of file
@@ -14,17 +14,24 @@ from barleymapcore.utils.data_utils import load_conf
 REF_NAME = 0
 REF_ID = 1
 REF_TYPE = 2
+REF_BATCH_MODE = 3 # optional
 
 # REF_TYPE values
 REF_TYPE_BIG = "big"
 REF_TYPE_STD = "std"
 
+# REF_BATCH_MODE values: GMAP batch mode (-B), from 0 (no preloading of the index)
+# to 5 (the whole index allocated in memory). Modes 1 and 2 use memory mapped files,
+# whose pages can be kept in memory between runs (see bmap_dbs_warm.py)
+REF_BATCH_MODES = ["0", "1", "2", "3", "4", "5"]
+DEFAULT_BATCH_MODE = "0"
+
 class DatabasesConfig(object):
     
     _config_file = ""
     _verbose = False
     _config_dict = {}
-    # [ref_id] = {"ref_name", "ref_type"}
+    # [ref_id] = {"ref_name", "ref_type", "ref_batch_mode"}
     
     def __init__(self, config_file, verbose = True):
         self._config_file = config_file
@@ -40,7 +47,15 @@ class DatabasesConfig(object):
             ref_name = conf_row[REF_NAME]
             ref_type = conf_row[REF_TYPE]
             
-            self._config_dict[ref_id] = {REF_NAME:ref_name, REF_TYPE:ref_type}
+            if len(conf_row) > REF_BATCH_MODE:
+                ref_batch_mode = conf_row[REF_BATCH_MODE]
+                if ref_batch_mode not in REF_BATCH_MODES:
+                    raise m2pException("DatabasesConfig: wrong batch mode "+ref_batch_mode+" for database "+ref_id+". "+\
+                                       "Allowed values: "+",".join(REF_BATCH_MODES)+".")
+            else:
+                ref_batch_mode = DEFAULT_BATCH_MODE
+            
+            self._config_dict[ref_id] = {REF_NAME:ref_name, REF_TYPE:ref_type, REF_BATCH_MODE:ref_batch_mode}
         
     
     def get_databases(self):
@@ -64,6 +79,12 @@ class DatabasesConfig(object):
         else:
             return None
     
+    def get_database_batch_mode(self, database_id):
+        if self.database_exists(database_id):
+            return self._config_dict[database_id][REF_BATCH_MODE]
+        else:
+            return DEFAULT_BATCH_MODE
+    
     def get_databases_ids(self, databases_names = None):
         databases_ids = []
         
@@ -134,6 +134,7 @@ class MapsConfig(object):
     # SEARCH_TYPE values
     SEARCH_TYPE_GREEDY = "greedy"
     SEARCH_TYPE_HIERARCHICAL = "hierarchical"
+    SEARCH_TYPE_HIERARCHICAL_PARALLEL = "hierarchical_parallel"
     SEARCH_TYPE_EXHAUSTIVE = "exhaustive"
 
     _config_file = ""
@@ -37,6 +37,15 @@ class PathsConfig(object):
     
     # Aux dirs
     _TMP_FILES_PATH = "tmp_files_path"
+    # Optional: persistent cache of alignments, and its max size in MB
+    _ALIGNMENT_CACHE_PATH = "alignment_cache_path"
+    _ALIGNMENT_CACHE_SIZE = "alignment_cache_size"
+    
+    DEFAULT_ALIGNMENT_CACHE_SIZE = "1024"
+    # Optional: min number of queries passed at once from an aligner to the next one
+    _PIPELINE_BATCH_SIZE = "pipeline_batch_size"
+    
+    DEFAULT_PIPELINE_BATCH_SIZE = "100"
     
     _CITATION = "citation"
     _STDALONE_APP = "stdalone_app"
@@ -46,6 +55,9 @@ class PathsConfig(object):
     _genmap_path = ""
     _split_blast_path = ""
     _tmp_files_path = ""
+    _alignment_cache_path = ""
+    _alignment_cache_size = DEFAULT_ALIGNMENT_CACHE_SIZE
+    _pipeline_batch_size = DEFAULT_PIPELINE_BATCH_SIZE
     _datasets_path = ""
     _maps_path = ""
     _annot_path = ""
@@ -74,6 +86,9 @@ class PathsConfig(object):
         self._genmap_path = self._config_path_dict[self._GENMAP_PATH]
         self._split_blast_path = self._config_path_dict[self._SPLIT_BLAST_PATH]
         self._tmp_files_path = self._config_path_dict[self._TMP_FILES_PATH]
+        self._alignment_cache_path = self._config_path_dict.get(self._ALIGNMENT_CACHE_PATH, "")
+        self._alignment_cache_size = self._config_path_dict.get(self._ALIGNMENT_CACHE_SIZE, self.DEFAULT_ALIGNMENT_CACHE_SIZE)
+        self._pipeline_batch_size = self._config_path_dict.get(self._PIPELINE_BATCH_SIZE, self.DEFAULT_PIPELINE_BATCH_SIZE)
         self._datasets_path = self._config_path_dict[self._DATASETS_PATH]
         self._maps_path = self._config_path_dict[self._MAPS_PATH]
         self._annot_path = self._config_path_dict[self._ANNOTATION_PATH]
@@ -98,6 +113,9 @@ class PathsConfig(object):
                              self._GENMAP_PATH:self._genmap_path,
                              self._SPLIT_BLAST_PATH:self._split_blast_path,
                              self._TMP_FILES_PATH:self._tmp_files_path,
+                             self._ALIGNMENT_CACHE_PATH:self._alignment_cache_path,
+                             self._ALIGNMENT_CACHE_SIZE:self._alignment_cache_size,
+                             self._PIPELINE_BATCH_SIZE:self._pipeline_batch_size,
                              self._DATASETS_PATH:self._datasets_path,
                              self._MAPS_PATH:self._maps_path,
                              self._ANNOTATION_PATH:self._annot_path,
@@ -126,6 +144,11 @@ class PathsConfig(object):
         paths_config._genmap_path = config_path_dict[paths_config._GENMAP_PATH]
         paths_config._split_blast_path = config_path_dict[paths_config._SPLIT_BLAST_PATH]
         paths_config._tmp_files_path = config_path_dict[paths_config._TMP_FILES_PATH]
+        paths_config._alignment_cache_path = config_path_dict.get(paths_config._ALIGNMENT_CACHE_PATH, "")
+        paths_config._alignment_cache_size = config_path_dict.get(paths_config._ALIGNMENT_CACHE_SIZE,
+                                                                  paths_config.DEFAULT_ALIGNMENT_CACHE_SIZE)
+        paths_config._pipeline_batch_size = config_path_dict.get(paths_config._PIPELINE_BATCH_SIZE,
+                                                                 paths_config.DEFAULT_PIPELINE_BATCH_SIZE)
         paths_config._datasets_path = config_path_dict[paths_config._DATASETS_PATH]
         paths_config._maps_path = config_path_dict[paths_config._MAPS_PATH]
         paths_config._annot_path = config_path_dict[paths_config._ANNOTATION_PATH]
@@ -160,6 +183,18 @@ class PathsConfig(object):
     def get_tmp_files_path(self):
         return self._tmp_files_path
     
+    # Empty if there is no persistent cache of alignments
+    def get_alignment_cache_path(self):
+        return self._alignment_cache_path
+    
+    # Max size in MB
+    def get_alignment_cache_size(self):
+        return self._alignment_cache_size
+    
+    # Min number of queries passed at once from an aligner to the next one
+    def get_pipeline_batch_size(self):
+        return self._pipeline_batch_size
+    
     def get_datasets_path(self):
         return self._datasets_path
     
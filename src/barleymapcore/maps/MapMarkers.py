@@ -17,7 +17,9 @@ from enrichment.Enrichers import EnricherFactory
 from barleymapcore.datasets.DatasetsFacade import DatasetsFacade
 from barleymapcore.alignment.AlignmentResult import *
 from barleymapcore.db.MapsConfig import MapsConfig
+from barleymapcore.db.DatasetsConfig import DatasetsConfig
 from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
 
 ## Read conf file
 ALIGN_ACTION = "align"
@@ -113,7 +115,8 @@ class MapMarkers(object):
         
         mapper = Mappers.get_alignments_mapper(map_as_physical, self._mapReader, self._verbose)
         
-        self._mapping_results = mapper.create_map(alignment_results, unaligned, map_config, sort_param, multiple_param)
+        with metrics_utils.stage("mapping", map = map_config.get_name()):
+            self._mapping_results = mapper.create_map(alignment_results, unaligned, map_config, sort_param, multiple_param)
         
         sys.stderr.write("MapMarkers: Map "+map_config.get_name()+" created.\n")
         sys.stderr.write("\n")
@@ -137,6 +140,23 @@ class MapMarkers(object):
         
         return enriched_map
     
+    # Same as _get_enriched_map, for several enrichers at once.
+    # Returns a dict: enriched_maps[enricher_type] = enriched_map
+    def _get_enriched_maps(self, map_enricher, enrichers, datasets_facade, datasets_ids, extend_window, collapsed_view, constrain_fine_mapping = False):
+        
+        sys.stderr.write("\tMap : "+self.get_map_config().get_name()+"\n")
+        
+        # 1) Translate mapping results to intervals, once for all the enrichers
+        
+        map_intervals = map_enricher.map_to_intervals(extend_window)
+        
+        # 2) Use those intervals to obtain the features of each enricher
+        # reading each dataset only once, and add them to the map
+        
+        enriched_maps = map_enricher.enrich_multiple(enrichers, map_intervals, datasets_facade, datasets_ids, collapsed_view)
+        
+        return enriched_maps
+    
     #
     def enrichment(self, annotator, show_markers, show_genes, show_anchored, show_how,
                    datasets_facade, datasets_ids, extend_window, collapsed_view, constrain_fine_mapping = False):
@@ -147,33 +167,29 @@ class MapMarkers(object):
         
         sys.stderr.write("MapMarkers: adding features...\n")
         
-        #
+        # The enrichers requested share the intervals and a single pass over the datasets
+        enricher_factory = MapEnricherFactory.get_enricher_factory(show_how)
+        enrichers = []
+        if show_anchored:
+            enrichers.append(enricher_factory.get_anchored_enricher(self._mapReader))
+        if show_genes:
+            enrichers.append(enricher_factory.get_gene_enricher(self._mapReader, annotator))
+        if show_markers:
+            enrichers.append(enricher_factory.get_marker_enricher(self._mapReader))
+        
+        # The MapEnricher is used with several enrichers (see enrich_multiple)
+        map_enricher = MapEnricherFactory.get_map_enricher(show_how, None, mapping_results, self._verbose)
+        
+        enriched_maps = self._get_enriched_maps(map_enricher, enrichers, datasets_facade, datasets_ids, extend_window, collapsed_view, constrain_fine_mapping)
+        
         if show_anchored:
-            
-            enricher_factory = MapEnricherFactory.get_enricher_factory(show_how)
-            enricher = enricher_factory.get_anchored_enricher(self._mapReader)
-            map_enricher = MapEnricherFactory.get_map_enricher(show_how, enricher, mapping_results, self._verbose)
-            
-            enriched_map = self._get_enriched_map(map_enricher, datasets_facade, datasets_ids, extend_window, collapsed_view, constrain_fine_mapping)
-            mapping_results.set_map_with_anchored(enriched_map)
+            mapping_results.set_map_with_anchored(enriched_maps[DatasetsConfig.DATASET_TYPE_ANCHORED])
         
         if show_genes:
-            
-            enricher_factory = MapEnricherFactory.get_enricher_factory(show_how)
-            enricher = enricher_factory.get_gene_enricher(self._mapReader, annotator)
-            map_enricher = MapEnricherFactory.get_map_enricher(show_how, enricher, mapping_results, self._verbose)
-            
-            enriched_map = self._get_enriched_map(map_enricher, datasets_facade, datasets_ids, extend_window, collapsed_view, constrain_fine_mapping)
-            mapping_results.set_map_with_genes(enriched_map)
+            mapping_results.set_map_with_genes(enriched_maps[DatasetsConfig.DATASET_TYPE_GENE])
         
         if show_markers:
-            
-            enricher_factory = MapEnricherFactory.get_enricher_factory(show_how)
-            enricher = enricher_factory.get_marker_enricher(self._mapReader)
-            map_enricher = MapEnricherFactory.get_map_enricher(show_how, enricher, mapping_results, self._verbose)
-            
-            enriched_map = self._get_enriched_map(map_enricher, datasets_facade, datasets_ids, extend_window, collapsed_view, constrain_fine_mapping)
-            mapping_results.set_map_with_markers(enriched_map)
+            mapping_results.set_map_with_markers(enriched_maps[DatasetsConfig.DATASET_TYPE_GENETIC_MARKER])
         
         sys.stderr.write("MapMarkers: added other features.\n")
         
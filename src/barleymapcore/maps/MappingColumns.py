@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MappingColumns.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+# NumPy is optional. Without it the results are sorted as lists.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Below this number of results sorting a list is as fast as building the columns
+MIN_COLUMNS_RESULTS = 10000
+
+## This class holds the fields used to sort a list of
+## MappingResult (or FeatureMapping) objects as NumPy arrays (columns),
+## so that large lists of results are sorted with numpy.lexsort
+## instead of building a tuple of keys for each result
+class MappingColumns(object):
+    _results = None
+    _sort_by = ""
+    _chrom_order = None
+    _sort_pos = None
+    
+    def __init__(self, results, sort_by):
+        self._results = results
+        self._sort_by = sort_by
+        
+        self._chrom_order = numpy.array([result.get_chrom_order() for result in results], dtype=numpy.int64)
+        self._sort_pos = numpy.array([result.get_sort_pos(sort_by) for result in results], dtype=numpy.float64)
+    
+    # Columns can be used if NumPy is installed and there are enough results
+    @staticmethod
+    def can_be_used(results):
+        return numpy != None and len(results) >= MIN_COLUMNS_RESULTS
+    
+    # Same order as Mapper._sort_positions_list:
+    # chrom order, sort position, secondary sort position and marker id
+    def sort_positions(self):
+        results = self._results
+        sort_by = self._sort_by
+        
+        sort_sec_pos = numpy.array([result.get_sort_sec_pos(sort_by) for result in results], dtype=numpy.float64)
+        marker_ids = numpy.array([result.get_marker_id() for result in results])
+        
+        # The last key is the primary one
+        order = numpy.lexsort((marker_ids, sort_sec_pos, self._sort_pos, self._chrom_order))
+        
+        return [results[i] for i in order]
+    
+    # Same order as Enricher.sort_features:
+    # chrom order, sort position, sort end position, dataset name and feature id
+    def sort_features(self):
+        results = self._results
+        sort_by = self._sort_by
+        
+        sort_end_pos = numpy.array([result.get_sort_end_pos(sort_by) for result in results], dtype=numpy.float64)
+        dataset_names = numpy.array([result.get_dataset_name() for result in results])
+        feature_ids = numpy.array([result.get_feature_id() for result in results])
+        
+        # The last key is the primary one
+        order = numpy.lexsort((feature_ids, dataset_names, sort_end_pos, self._sort_pos, self._chrom_order))
+        
+        return [results[i] for i in order]
+
+## END
@@ -8,24 +8,27 @@
 # (terms of use can be found within the distributed LICENSE file).
 
 from MapsBase import MapTypes
+from barleymapcore.m2p_exception import m2pException
+
+# Numeric value of a position, used to sort and compare positions.
+# Positions without a numeric value ("-" of empty results) are -1.0
+def _parse_pos(pos):
+    try:
+        return float(pos)
+    except (TypeError, ValueError):
+        return -1.0
 
 ## This class represents the map position of a marker which has been aligned first to a DB
 ##
+## Note that it uses __slots__ since there could be millions of them in memory.
+## The positions are kept as read (to output them as they are in the map)
+## along with their numeric value, parsed only once, which is used to sort them.
 class MappingResult(object):
-    _marker_id = ""
-    _chrom_name = ""
-    _chrom_order = "-1"
-    _cm_pos = "-1.0"
-    _cm_end_pos = "-1.0"
-    _bp_pos = "-1"
-    _bp_end_pos = "-1"
-    _strand = "-"
-    _multiple_pos = False
-    _other_alignments = "No"
-    _map_name = ""
-    _feature = None
-    
-    _empty = False
+    __slots__ = ("_marker_id", "_chrom_name", "_chrom_order",
+                 "_cm_pos", "_cm_end_pos", "_bp_pos", "_bp_end_pos",
+                 "_cm_num", "_cm_end_num", "_bp_num", "_bp_end_num",
+                 "_strand", "_multiple_pos", "_other_alignments", "_map_name",
+                 "_feature", "_empty")
     
     MAP_FIELDS = 7
     
@@ -40,10 +43,15 @@ class MappingResult(object):
         self._cm_end_pos = cm_end_pos
         self._bp_pos = bp_pos
         self._bp_end_pos = bp_end_pos
+        self._cm_num = _parse_pos(cm_pos)
+        self._cm_end_num = _parse_pos(cm_end_pos)
+        self._bp_num = _parse_pos(bp_pos)
+        self._bp_end_num = _parse_pos(bp_end_pos)
         self._strand = strand
         self._multiple_pos = has_multiple_pos
         self._other_alignments = has_other_alignments
         self._map_name = map_name
+        self._feature = None
         self._empty = empty
     
     # An empty MappingResult can be created for several reasons,
@@ -172,13 +180,14 @@ class MappingResult(object):
     def get_map_name(self):
         return self._map_name
     
+    # The sort positions are the numeric values of the positions
     def get_sort_pos(self, sort_by):
         ret_value = -1
         
         if sort_by == MapTypes.MAP_SORT_PARAM_CM:
-            ret_value = self._cm_pos#float(self._cm_pos)
+            ret_value = self._cm_num
         elif sort_by == MapTypes.MAP_SORT_PARAM_BP:
-            ret_value = self._bp_pos#long(self._bp_pos)
+            ret_value = self._bp_num
         else:
             raise m2pException("Unrecognized sort field "+str(sort_by)+".")
         
@@ -188,9 +197,9 @@ class MappingResult(object):
         ret_value = -1
         
         if sort_by == MapTypes.MAP_SORT_PARAM_CM:
-            ret_value = self._cm_end_pos#float(self._cm_pos)
+            ret_value = self._cm_end_num
         elif sort_by == MapTypes.MAP_SORT_PARAM_BP:
-            ret_value = self._bp_end_pos#long(self._bp_pos)
+            ret_value = self._bp_end_num
         else:
             raise m2pException("Unrecognized sort field "+str(sort_by)+".")
         
@@ -200,9 +209,9 @@ class MappingResult(object):
         ret_value = -1
         
         if sort_by == MapTypes.MAP_SORT_PARAM_CM:
-            ret_value = self._bp_pos
+            ret_value = self._bp_num
         elif sort_by == MapTypes.MAP_SORT_PARAM_BP:
-            ret_value = self._cm_pos
+            ret_value = self._cm_num
         else:
             raise m2pException("Unrecognized sort field "+str(sort_by)+".")
         
@@ -212,9 +221,9 @@ class MappingResult(object):
         ret_value = -1
         
         if sort_by == MapTypes.MAP_SORT_PARAM_CM:
-            ret_value = self._end_end_pos
+            ret_value = self._bp_end_num
         elif sort_by == MapTypes.MAP_SORT_PARAM_BP:
-            ret_value = self._cm_end_pos
+            ret_value = self._cm_end_num
         else:
             raise m2pException("Unrecognized sort field "+str(sort_by)+".")
         
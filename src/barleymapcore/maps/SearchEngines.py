@@ -5,15 +5,17 @@
 # Copyright (C)  2017  Carlos P Cantalapiedra.
 # (terms of use can be found within the distributed LICENSE file).
 
-import sys, os
+import sys
 
 from reader.MapReader import MapReader
 from mappers.Mappers import Mappers
 from barleymapcore.db.MapsConfig import MapsConfig
 from barleymapcore.m2p_exception import m2pException
 import barleymapcore.utils.alignment_utils as alignment_utils
+import barleymapcore.utils.metrics_utils as metrics_utils
 
-from barleymapcore.alignment.AlignmentEngines import ALIGNMENT_TYPE_GREEDY, ALIGNMENT_TYPE_HIERARCHICAL, ALIGNMENT_TYPE_BEST_SCORE
+from barleymapcore.alignment.AlignmentEngines import ALIGNMENT_TYPE_GREEDY, ALIGNMENT_TYPE_HIERARCHICAL, ALIGNMENT_TYPE_BEST_SCORE, \
+                                                     ALIGNMENT_TYPE_HIERARCHICAL_PARALLEL
 
 class SearchEnginesFactory(object):
     @staticmethod
@@ -50,6 +52,11 @@ class SearchEnginesFactory(object):
             search_engine = SearchEngineGreedy(maps_path, best_score_param, databases_config, aligner_list,
                                                    threshold_id, threshold_cov, n_threads, ALIGNMENT_TYPE_HIERARCHICAL, verbose)
             
+        elif search_type == MapsConfig.SEARCH_TYPE_HIERARCHICAL_PARALLEL:
+            
+            search_engine = SearchEngineGreedy(maps_path, best_score_param, databases_config, aligner_list,
+                                                   threshold_id, threshold_cov, n_threads, ALIGNMENT_TYPE_HIERARCHICAL_PARALLEL, verbose)
+            
         elif search_type == MapsConfig.SEARCH_TYPE_EXHAUSTIVE:
             
             if best_score_param:
@@ -95,7 +102,8 @@ class SearchEnginePositions(SearchEngine):
         
         mapper = Mappers.get_alignments_mapper(map_as_physical, map_reader, self._verbose)
         
-        mapping_results = mapper.create_map(aligned, unaligned, map_config, sort_param, multiple_param)
+        with metrics_utils.stage("mapping", map = map_config.get_name()):
+            mapping_results = mapper.create_map(aligned, unaligned, map_config, sort_param, multiple_param)
         
         sys.stderr.write("SearchEnginePositions:"+str(len(mapping_results.get_mapped()))+"\n")
         
@@ -121,7 +129,8 @@ class SearchEngineDatasets(SearchEngine):
         # Obtain Mapper
         mapper = Mappers.get_mappings_mapper(map_reader, self._verbose)
         
-        mapping_results = mapper.create_map(mapping_results, mapping_unmapped, map_config, sort_param)
+        with metrics_utils.stage("mapping", map = map_config.get_name()):
+            mapping_results = mapper.create_map(mapping_results, mapping_unmapped, map_config, sort_param)
         
         sys.stderr.write("SearchEngineDatasets:"+str(len(mapping_results.get_mapped()))+"\n")
         
@@ -170,7 +179,8 @@ class SearchEngineGreedy(SearchEngineAlignments):
         
         mapper = Mappers.get_alignments_mapper(map_as_physical, map_reader, self._verbose)
         
-        mapping_results = mapper.create_map(aligned, unaligned, map_config, sort_param, multiple_param, is_graph)
+        with metrics_utils.stage("mapping", map = map_config.get_name()):
+            mapping_results = mapper.create_map(aligned, unaligned, map_config, sort_param, multiple_param, is_graph)
         
         sys.stderr.write("SearchEngineGreedy: mapped "+str(len(mapping_results.get_mapped()))+"\n")
         
@@ -188,50 +198,43 @@ class SearchEngineExhaustive(SearchEngineAlignments):
         
         current_path = query_path
         
-        tmp_files_list = []
         prev_mapping_results = None
-        try:
-            for db in query_sets_ids:
-                query_set = [db]
-                alignment_results = facade.perform_alignment(current_path, query_set,
-                                                             self._databases_config, self._alignment_type, self._aligner_list, \
-                                                                self._threshold_id, self._threshold_cov, self._n_threads)
-                
-                sys.stderr.write("SearchEngineExhaustive: aligned "+str(len(alignment_results.get_aligned()))+"\n")
-                
-                aligned = alignment_results.get_aligned()
-                unaligned = alignment_results.get_unaligned()
-                
+        for db in query_sets_ids:
+            query_set = [db]
+            alignment_results = facade.perform_alignment(current_path, query_set,
+                                                         self._databases_config, self._alignment_type, self._aligner_list, \
+                                                            self._threshold_id, self._threshold_cov, self._n_threads)
+            
+            sys.stderr.write("SearchEngineExhaustive: aligned "+str(len(alignment_results.get_aligned()))+"\n")
+            
+            aligned = alignment_results.get_aligned()
+            unaligned = alignment_results.get_unaligned()
+            
+            with metrics_utils.stage("mapping", map = map_config.get_name()):
                 mapping_results = mapper.create_map(aligned, unaligned, map_config, sort_param, multiple_param)
-                
-                sys.stderr.write("SearchEngineExhaustive: mapped "+str(len(mapping_results.get_mapped()))+"\n")
-                
-                if prev_mapping_results:
-                    mapping_results.extend(prev_mapping_results)
-                
-                sys.stderr.write("\toverall:"+str(len(mapping_results.get_mapped()))+"\n")
-                
-                unique_unmapped = set([record[0] for record in mapping_results.get_unmapped()])
-                num_unmapped = len(unique_unmapped)
-                sys.stderr.write("SearchEngineExhaustive: unmapped "+str(num_unmapped)+"\n")
-                
-                remaining_queries = self._combine(unaligned, unique_unmapped)
-                
-                sys.stderr.write("SearchEngineExhaustive: total remaining queries "+str(len(remaining_queries))+".\n")
-                
-                if len(remaining_queries)==0:
-                    break
-                else:
-                    current_path = alignment_utils.extract_fasta_headers(current_path, remaining_queries, tmp_files_dir)
-                    tmp_files_list.append(current_path)
-                
-                prev_mapping_results = mapping_results
             
-        except Exception:
-            raise
-        finally:
-            for tmp_file in tmp_files_list:
-                os.remove(tmp_file)
+            sys.stderr.write("SearchEngineExhaustive: mapped "+str(len(mapping_results.get_mapped()))+"\n")
+            
+            if prev_mapping_results:
+                mapping_results.extend(prev_mapping_results)
+            
+            sys.stderr.write("\toverall:"+str(len(mapping_results.get_mapped()))+"\n")
+            
+            unique_unmapped = set([record[0] for record in mapping_results.get_unmapped()])
+            num_unmapped = len(unique_unmapped)
+            sys.stderr.write("SearchEngineExhaustive: unmapped "+str(num_unmapped)+"\n")
+            
+            remaining_queries = self._combine(unaligned, unique_unmapped)
+            
+            sys.stderr.write("SearchEngineExhaustive: total remaining queries "+str(len(remaining_queries))+".\n")
+            
+            if len(remaining_queries)==0:
+                break
+            else:
+                # The remaining queries are passed to the aligners through their stdin
+                current_path = alignment_utils.get_fasta_subset(current_path, remaining_queries)
+            
+            prev_mapping_results = mapping_results
         
         sorted_positions = mapper._sort_positions_list(mapping_results.get_mapped(), sort_param)
         mapping_results.set_mapped(sorted_positions)
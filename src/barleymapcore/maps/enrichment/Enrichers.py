@@ -11,7 +11,9 @@ import sys
 from barleymapcore.db.DatasetsConfig import DatasetsConfig
 from barleymapcore.maps.enrichment.FeatureMapping import FeaturesFactory, FeatureMapping
 from barleymapcore.maps.MappingResults import MappingResult
+from barleymapcore.maps.MappingColumns import MappingColumns
 from barleymapcore.maps.MapInterval import MapInterval
+import barleymapcore.utils.metrics_utils as metrics_utils
 
 ROW_TYPE_POSITION = "pos"
 ROW_TYPE_FEATURE = "feature"
@@ -49,10 +51,21 @@ class Enricher(object):
     def retrieve_features(self, map_config, map_intervals, datasets_facade, dataset_list, map_sort_by):
         raise m2pException("Method 'retrieve_features' should be implemented in a class inheriting Enricher.")
     
+    # Prepares the features retrieved from the datasets to be enriched
+    def process_features(self, features, map_sort_by):
+        # Sort the list by chrom and position
+        features = self.sort_features(features, map_sort_by)
+        
+        return features
+    
     def sort_features(self, features, map_sort_by):
+        # Large lists are sorted as columns (if NumPy is available)
+        if MappingColumns.can_be_used(features):
+            return MappingColumns(features, map_sort_by).sort_features()
+        
         features = sorted(features, key=lambda feature_mapping: \
-                        (int(feature_mapping.get_chrom_order()),
-                         float(feature_mapping.get_sort_pos(map_sort_by)), float(feature_mapping.get_sort_end_pos(map_sort_by)),
+                        (feature_mapping.get_chrom_order(),
+                         feature_mapping.get_sort_pos(map_sort_by), feature_mapping.get_sort_end_pos(map_sort_by),
                         feature_mapping.get_dataset_name(), feature_mapping.get_feature_id()))
         
         return features
@@ -238,7 +251,7 @@ class MarkerEnricher(Enricher):
                                                            DatasetsConfig.DATASET_TYPE_GENETIC_MARKER)
         
         # 3) Sort the list by chrom and position
-        features = self.sort_features(features, map_sort_by)
+        features = self.process_features(features, map_sort_by)
         
         return features
     
@@ -267,7 +280,7 @@ class AnchoredEnricher(Enricher):
                                                            DatasetsConfig.DATASET_TYPE_ANCHORED)
         
         # 3) Sort the list by chrom and position
-        features = self.sort_features(features, map_sort_by)
+        features = self.process_features(features, map_sort_by)
         
         return features
     
@@ -298,14 +311,9 @@ class GeneEnricher(Enricher):
         features = datasets_facade.retrieve_features_by_pos(map_intervals, map_config, chrom_dict, map_sort_by, dataset_list,
                                                            DatasetsConfig.DATASET_TYPE_GENE)
         
-        sys.stderr.write("GeneEnricher: num features "+str(len(features))+"\n")
-        
         # 3) Sort the list by chrom and position
-        features = self.sort_features(features, map_sort_by)
-        
         # 4) If required, annotate genes
-        if self._annotator:
-            features = self._annotator.annotate_features(features)
+        features = self.process_features(features, map_sort_by)
         
         #print "ENRICHERS"
         #for gene_mapping in features:
@@ -314,6 +322,18 @@ class GeneEnricher(Enricher):
         
         return features
     
+    def process_features(self, features, map_sort_by):
+        
+        sys.stderr.write("GeneEnricher: num features "+str(len(features))+"\n")
+        
+        features = self.sort_features(features, map_sort_by)
+        
+        if self._annotator:
+            with metrics_utils.stage("annotation", features = len(features)):
+                features = self._annotator.annotate_features(features)
+        
+        return features
+    
     def get_enricher_type(self):
         return DatasetsConfig.DATASET_TYPE_GENE
     
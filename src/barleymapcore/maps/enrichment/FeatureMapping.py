@@ -61,14 +61,12 @@ class FeaturesFactory(object):
 
 # This is a class with features which can be attached to
 # a MappingResult, including genes or markers in the same position, etc.
+# Note that the positions are those of its MappingResult (see MappingResult __slots__)
 class FeatureMapping(MappingResult):
-    _feature_id = ""
-    _dataset_id = ""
-    _dataset_name = ""
-    _feature_type = "" # genetic_marker, gene, ... see DatasetsConfig
-    _mapping_result = None # MappingResult object
-    _row_type = ""
-    _empty = False
+    __slots__ = ("_feature_id", "_dataset_id", "_dataset_name",
+                 "_feature_type", # genetic_marker, gene, ... see DatasetsConfig
+                 "_mapping_result", # MappingResult object
+                 "_row_type")
     
     ROW_TYPE_MAPPING_RESULT = "+"
     ROW_TYPE_ENRICHMENT = "."
@@ -82,6 +80,9 @@ class FeatureMapping(MappingResult):
         self._mapping_result = mapping_result
         self._row_type = row_type
         self._empty = empty
+        # Attributes of MappingResult which are not taken from mapping_result
+        self._feature = None
+        self._other_alignments = "No"
     
     def clone(self):
         new = FeatureMapping(self.get_feature_id(),
@@ -183,6 +184,8 @@ class FeatureMapping(MappingResult):
 ##############################
 #
 class MarkerMapping(FeatureMapping):
+    __slots__ = ()
+    
     # An empty MarkerMapping is used in enriched maps
     # for those mapping positions without features associated
     @staticmethod
@@ -202,6 +205,8 @@ class MarkerMapping(FeatureMapping):
 
 #
 class AnchoredMapping(FeatureMapping):
+    __slots__ = ()
+    
     # An empty MarkerMapping is used in enriched maps
     # for those mapping positions without features associated
     @staticmethod
@@ -222,18 +227,13 @@ class AnchoredMapping(FeatureMapping):
 ## This is a FeatureMapping
 ## which in addition can hold several anotations (see GenesAnnotator)
 class GeneMapping(FeatureMapping):
-    _annots = []
+    __slots__ = ("_annots",)
     
     def __init__(self, feature_id, dataset_id, dataset_name,
                  feature_type, mapping_result, row_type = FeatureMapping.ROW_TYPE_ENRICHMENT,
                  empty = False, annots = []):
-        self._feature_id = feature_id
-        self._dataset_id = dataset_id
-        self._dataset_name = dataset_name
-        self._feature_type = feature_type
-        self._mapping_result = mapping_result
-        self._row_type = row_type
-        self._empty = empty
+        FeatureMapping.__init__(self, feature_id, dataset_id, dataset_name,
+                                feature_type, mapping_result, row_type, empty)
         self._annots = annots
     
     def clone(self):
@@ -13,6 +13,7 @@ from barleymapcore.maps.MapInterval import MapInterval, FeaturedMapInterval
 from barleymapcore.maps.MapsBase import MapTypes
 
 from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
 
 from Enrichers import EnricherFactory
 from MarkerEnrichers import MarkerEnricherFactory
@@ -82,19 +83,59 @@ class MapEnricher(object):
         map_id = map_config.get_id()
         map_sort_by = mapping_results.get_sort_by()
         
-        ### Retrieve features (what type depends on the enricher used to retrieve them)
-        sys.stderr.write("MapEnricher: retrieve features...\n")
-        features = []
-        if len(map_intervals)>0:
-            features = self._enricher.retrieve_features(map_config, map_intervals, datasets_facade, dataset_list, map_sort_by)
-        if self._verbose: sys.stderr.write("\t features retrieved: "+str(len(features))+"\n")
-        
-        ## Enrich map
-        sys.stderr.write("MapEnricher: enrich map...\n")
-        enriched_map = self._enricher.enrich(mapping_results, features, collapsed_view)
+        with metrics_utils.stage("enrichment", map = map_config.get_name(), enricher = self._enricher.__class__.__name__):
+            ### Retrieve features (what type depends on the enricher used to retrieve them)
+            sys.stderr.write("MapEnricher: retrieve features...\n")
+            features = []
+            if len(map_intervals)>0:
+                features = self._enricher.retrieve_features(map_config, map_intervals, datasets_facade, dataset_list, map_sort_by)
+            if self._verbose: sys.stderr.write("\t features retrieved: "+str(len(features))+"\n")
+            
+            ## Enrich map
+            sys.stderr.write("MapEnricher: enrich map...\n")
+            enriched_map = self._enricher.enrich(mapping_results, features, collapsed_view)
         
         return enriched_map
     
+    ## Enriches the map with several enrichers at once (markers, genes, anchored...),
+    ## so that each dataset is read only once for all of them.
+    ## Returns a dict: enriched_maps[enricher_type] = enriched_map
+    def enrich_multiple(self, enrichers, map_intervals, datasets_facade, dataset_list, collapsed_view):
+        enriched_maps = {}
+        
+        mapping_results = self.get_mapping_results()
+        map_config = mapping_results.get_map_config()
+        
+        map_sort_by = mapping_results.get_sort_by()
+        
+        feature_types = [enricher.get_enricher_type() for enricher in enrichers]
+        enricher_names = ",".join([enricher.__class__.__name__ for enricher in enrichers])
+        
+        with metrics_utils.stage("enrichment", map = map_config.get_name(), enricher = enricher_names):
+            ### Retrieve features of all the types in a single pass over the datasets
+            sys.stderr.write("MapEnricher: retrieve features of types "+",".join(feature_types)+"...\n")
+            features_dict = dict([(feature_type, []) for feature_type in feature_types])
+            if len(map_intervals)>0:
+                # All the enrichers work on the same map
+                chrom_dict = enrichers[0].get_map_reader().get_chrom_dict()
+                features_dict = self._retrieve_features_types(map_config, map_intervals, datasets_facade, dataset_list,
+                                                              map_sort_by, chrom_dict, feature_types)
+            
+            for enricher in enrichers:
+                enricher_type = enricher.get_enricher_type()
+                
+                features = enricher.process_features(features_dict[enricher_type], map_sort_by)
+                if self._verbose: sys.stderr.write("\t features retrieved ("+enricher_type+"): "+str(len(features))+"\n")
+                
+                ## Enrich map
+                sys.stderr.write("MapEnricher: enrich map with "+enricher_type+"...\n")
+                enriched_maps[enricher_type] = enricher.enrich(mapping_results, features, collapsed_view)
+        
+        return enriched_maps
+    
+    def _retrieve_features_types(self, map_config, map_intervals, datasets_facade, dataset_list, map_sort_by, chrom_dict, feature_types):
+        return datasets_facade.retrieve_features_by_pos_types(map_intervals, map_config, chrom_dict, map_sort_by, dataset_list, feature_types)
+    
     def enrich_with_anchored(self, map_intervals, datasets_facade, collapsed_view):
         
         mapping_results = self.get_mapping_results()
@@ -282,6 +323,11 @@ class MarkerEnricher(MapEnricher):
         
         return
     
+    ### Overwrites _retrieve_features_types of MapEnricher
+    ### to retrieve the features on each FeaturedMapInterval
+    def _retrieve_features_types(self, map_config, map_intervals, datasets_facade, dataset_list, map_sort_by, chrom_dict, feature_types):
+        return datasets_facade.retrieve_features_on_pos_types(map_intervals, map_config, chrom_dict, map_sort_by, dataset_list, feature_types)
+    
     ### Overwrites _map_intervals of MapEnricher
     def _map_intervals(self, sorted_map, map_sort_by, extend_window):
         map_intervals = []
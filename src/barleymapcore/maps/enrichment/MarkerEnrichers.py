@@ -10,7 +10,9 @@ import sys
 from barleymapcore.db.DatasetsConfig import DatasetsConfig
 from barleymapcore.maps.enrichment.FeatureMapping import FeaturesFactory, FeatureMapping
 from barleymapcore.maps.MappingResults import MappingResult
+from barleymapcore.maps.MappingColumns import MappingColumns
 from barleymapcore.maps.MapInterval import MapInterval
+import barleymapcore.utils.metrics_utils as metrics_utils
 
 ROW_TYPE_POSITION = "pos"
 ROW_TYPE_FEATURE = "feature"
@@ -48,10 +50,24 @@ class Enricher(object):
     def retrieve_features(self, map_config, map_intervals, datasets_facade, map_sort_by):
         raise m2pException("Method 'retrieve_features' should be implemented in a class inheriting Enricher.")
     
+    # Prepares the features of each FeaturedMapInterval retrieved from the datasets to be enriched
+    def process_features(self, featured_map_intervals, map_sort_by):
+        # Sort the list by chrom and position
+        for featured_map_interval in featured_map_intervals:
+            features = featured_map_interval.get_features()
+            features = self.sort_features(features, map_sort_by)
+            featured_map_interval.set_features(features)
+        
+        return featured_map_intervals
+    
     def sort_features(self, features, map_sort_by):
+        # Large lists are sorted as columns (if NumPy is available)
+        if MappingColumns.can_be_used(features):
+            return MappingColumns(features, map_sort_by).sort_features()
+        
         features = sorted(features, key=lambda feature_mapping: \
-                        (int(feature_mapping.get_chrom_order()),
-                         float(feature_mapping.get_sort_pos(map_sort_by)), float(feature_mapping.get_sort_end_pos(map_sort_by)),
+                        (feature_mapping.get_chrom_order(),
+                         feature_mapping.get_sort_pos(map_sort_by), feature_mapping.get_sort_end_pos(map_sort_by),
                         feature_mapping.get_dataset_name(), feature_mapping.get_feature_id()))
         
         return features
@@ -156,10 +172,7 @@ class MarkerEnricher(Enricher):
                                                            DatasetsConfig.DATASET_TYPE_GENETIC_MARKER)
         
         # 3) Sort the list by chrom and position
-        for featured_map_interval in featured_map_intervals:
-            features = featured_map_interval.get_features()
-            features = self.sort_features(features, map_sort_by)
-            featured_map_interval.set_features(features)
+        featured_map_intervals = self.process_features(featured_map_intervals, map_sort_by)
         
         return featured_map_intervals
     
@@ -187,10 +200,7 @@ class AnchoredEnricher(Enricher):
                                                            DatasetsConfig.DATASET_TYPE_ANCHORED)
         
         # 3) Sort the list by chrom and position
-        for featured_map_interval in featured_map_intervals:
-            features = featured_map_interval.get_features()
-            features = self.sort_features(features, map_sort_by)
-            featured_map_interval.set_features(features)
+        featured_map_intervals = self.process_features(featured_map_intervals, map_sort_by)
         
         return featured_map_intervals
     
@@ -224,12 +234,7 @@ class GeneEnricher(Enricher):
         
         # 3) Sort the list by chrom and position
         # 4) If required, annotate genes
-        for featured_map_interval in featured_map_intervals:
-            features = featured_map_interval.get_features()
-            features = self.sort_features(features, map_sort_by)
-            featured_map_interval.set_features(features)
-            if self._annotator:
-                features = self._annotator.annotate_features(features)
+        featured_map_intervals = self.process_features(featured_map_intervals, map_sort_by)
         
         #sys.stderr.write("GeneEnricher\n")
         #
@@ -242,6 +247,18 @@ class GeneEnricher(Enricher):
         
         return featured_map_intervals
     
+    def process_features(self, featured_map_intervals, map_sort_by):
+        
+        for featured_map_interval in featured_map_intervals:
+            features = featured_map_interval.get_features()
+            features = self.sort_features(features, map_sort_by)
+            featured_map_interval.set_features(features)
+            if self._annotator:
+                with metrics_utils.stage("annotation", features = len(features)):
+                    features = self._annotator.annotate_features(features)
+        
+        return featured_map_intervals
+    
     def get_enricher_type(self):
         return DatasetsConfig.DATASET_TYPE_GENE
     
@@ -9,6 +9,7 @@
 import sys
 
 from barleymapcore.maps.MappingResults import MappingResult, MappingResults
+from barleymapcore.maps.MappingColumns import MappingColumns
 from barleymapcore.db.MapsConfig import MapsConfig
 
 NUM_FIELDS = 7
@@ -45,25 +46,12 @@ class Mapper(object):
         self._mapReader = mapReader
         self._verbose = verbose
     
-    def _existPosition(self, pos_list, test_pos):
-        retValue = False
-        
-        test_chr = test_pos["chr"]
-        test_cm = test_pos["cm_pos"]
-        test_bp = test_pos["bp_pos"]
-        test_bp_end = test_pos["bp_end_pos"]
-        
-        for pos in pos_list:
-            pos_chr = pos["chr"]
-            pos_cm = pos["cm_pos"]
-            pos_bp = pos["bp_pos"]
-            pos_bp_end = pos["bp_end_pos"]
-            
-            if pos_chr == test_chr and pos_cm == test_cm and pos_bp == test_bp and pos_bp_end == test_bp_end:
-                retValue = True
-                break
-            
-        return retValue
+    # Two positions of a marker are the same if they have the same key,
+    # so that a set of keys avoids adding twice a position
+    # without comparing it with each previous position of the marker
+    @staticmethod
+    def _get_position_key(pos):
+        return (pos["chr"], pos["cm_pos"], pos["bp_pos"], pos["bp_end_pos"])
     
     # Creates the final dictionary of markers with map positions
     # including sorting the map, and creating lists of unaligned and unmapped markers
@@ -131,10 +119,15 @@ class Mapper(object):
                 
                 # graph-alignment map position are treated just the same,
                 # with associated graph ranges as other_alignments
+                if "other_alignments" in pos:
+                    other_alignments = pos["other_alignments"]
+                else:
+                    other_alignments = "Yes" if num_contig_no_pos > 0 else "No"
+                
                 mapping_result = MappingResult(marker_id, chr_pos, chrom_order,
                                                pos["cm_pos"], pos["cm_end_pos"], 
                                                pos["bp_pos"], pos["bp_end_pos"], pos["strand"],
-                                               num_marker_pos > 1, pos["other_alignments"], map_name)
+                                               num_marker_pos > 1, other_alignments, map_name)
 
                 positions_list.append(mapping_result)
         
@@ -143,9 +136,13 @@ class Mapper(object):
     def _sort_positions_list(self, positions_list, sort_param):
         sorted_list = []
         
+        # Large lists are sorted as columns (if NumPy is available)
+        if MappingColumns.can_be_used(positions_list):
+            return MappingColumns(positions_list, sort_param).sort_positions()
+        
         sorted_list = sorted(positions_list, key=lambda mapping_result: \
-                             (int(mapping_result.get_chrom_order()), float(mapping_result.get_sort_pos(sort_param)),
-                              float(mapping_result.get_sort_sec_pos(sort_param)), mapping_result.get_marker_id()))
+                             (mapping_result.get_chrom_order(), mapping_result.get_sort_pos(sort_param),
+                              mapping_result.get_sort_sec_pos(sort_param), mapping_result.get_marker_id()))
         
         return sorted_list
     
@@ -227,6 +224,8 @@ class PhysicalMapper(Mapper):
         
         markers_positions = {}
         # marker_id --> {"positions":[], "hits_no_position":[]}
+        markers_keys = {}
+        # marker_id --> set([position key, ...])
         
         # Extract alignments from databases of this map
         #for db in map_config.get_db_list():
@@ -239,9 +238,12 @@ class PhysicalMapper(Mapper):
             
             if marker_id in markers_positions:
                 marker_pos = markers_positions[marker_id]["positions"]
+                marker_keys = markers_keys[marker_id]
             else:
                 marker_pos = []
                 markers_positions[marker_id] = {"positions":marker_pos, "hits_no_position":[]}
+                marker_keys = set()
+                markers_keys[marker_id] = marker_keys
             
             contig_id = alignment.get_subject_id()
             local_position = alignment.get_local_position()
@@ -258,8 +260,10 @@ class PhysicalMapper(Mapper):
             else:
                 new_pos = {"chr":contig_id, "cm_pos":-1, "cm_end_pos":-1,
                        "bp_pos":local_position, "bp_end_pos":end_position, "strand":strand}
-
-            if not self._existPosition(marker_pos, new_pos):
+            
+            pos_key = self._get_position_key(new_pos)
+            if pos_key not in marker_keys:
+                marker_keys.add(pos_key)
                 marker_pos.append(new_pos)
         
         return markers_positions
@@ -269,7 +273,9 @@ class PhysicalMapper(Mapper):
 class AnchoredMapper(Mapper):
     ## Obtain a finished map of markers from alignments to anchored sequences
     # def create_anchored_map
-    def create_map(self, alignment_results, unaligned_markers, map_config, sort_param, multiple_param):
+    # is_graph is not used, since graph alignments are only mapped to physical maps
+    def create_map(self, alignment_results, unaligned_markers, map_config, sort_param, multiple_param,
+                    is_graph = False):
         
         # Indexes the alignments by marker_id
         markers_dict = self._get_markers_dict(alignment_results)
@@ -323,6 +329,9 @@ class AnchoredMapper(Mapper):
         #contig_list = []
         contig_set = set()
         
+        # [marker_id] = set of contig_tuple, to check the hits already in markers_dict
+        markers_sets = {}
+        
         # Extract alignments from databases of this map
         #for db in map_config.get_db_list():#dbs_list:
         #    if db in alignment_results:
@@ -339,16 +348,16 @@ class AnchoredMapper(Mapper):
             
             # Add hit (contig, position) to list of hits of this marker
             if marker_id in markers_dict:
-                marker_contig_list = markers_dict[marker_id]
-                marker_contig_set = set(marker_contig_list)
+                marker_contig_set = markers_sets[marker_id]
                 if contig_tuple not in marker_contig_set:
-                    marker_contig_list.append(contig_tuple)
+                    marker_contig_set.add(contig_tuple)
+                    markers_dict[marker_id].append(contig_tuple)
             else:
                 markers_dict[marker_id] = [contig_tuple]
+                markers_sets[marker_id] = set([contig_tuple])
             
             # Add contig to the general list of contigs found in the alignments
-            if contig_id not in contig_set:#:
-                contig_set.add(contig_id)
+            contig_set.add(contig_id)
         
         markers_dict["contig_set"] = contig_set
         
@@ -370,6 +379,8 @@ class AnchoredMapper(Mapper):
                 marker_pos = []
                 markers_positions[marker_id] = {"positions":marker_pos, "hits_no_position":[]}
             
+            marker_keys = set([self._get_position_key(pos) for pos in marker_pos])
+            
             #sys.stderr.write("Current "+str(marker_pos)+"\n")
             
             # Associate contigs positions on the map, to the markers
@@ -386,7 +397,9 @@ class AnchoredMapper(Mapper):
                     #sys.stderr.write("Final position: "+str(final_contig_pos["bp_pos"])+"\n")
                     
                     # Avoid adding twice a position
-                    if not self._existPosition(marker_pos, final_contig_pos):
+                    pos_key = self._get_position_key(final_contig_pos)
+                    if pos_key not in marker_keys:
+                        marker_keys.add(pos_key)
                         marker_pos.append(final_contig_pos)
                 else:
                     # Alignments without map position
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# IndexFiles.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+import sys, os, mmap, struct, hashlib
+
+from barleymapcore.m2p_exception import m2pException
+from barleymapcore.maps.MapsBase import MapTypes
+
+# An index is used only if it is not older than the indexed file
+def index_is_available(index_path, data_path):
+    ret_value = False
+    
+    if os.path.exists(index_path) and os.path.isfile(index_path):
+        if os.path.getmtime(index_path) >= os.path.getmtime(data_path):
+            ret_value = True
+        else:
+            sys.stderr.write("WARNING: index "+index_path+" is older than "+data_path+" and it will be ignored.\n")
+    
+    return ret_value
+
+# KeysIndex: binary index of a tabular file based on its first field.
+# The index is a table of fixed-width records (key, byte offset of the row)
+# sorted by key, which is memory-mapped and searched by bisection,
+# so that the cost of a lookup does not depend on loading the whole index.
+#
+# A key can have several records (one for each row with that key),
+# and synonyms of the keys can be indexed as additional keys of the same rows.
+#
+# Format:
+#    header: MAGIC (8 bytes), flags (uint32), key width (uint32), number of records (uint64)
+#    records: key (NUL padded to key width), offset (uint64)
+class KeysIndex(object):
+    
+    FILE_EXT = ".kidx"
+    MAGIC = "BMAPKIDX"
+    HEADER_FORMAT = "<8sIIQ"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    OFFSET_FORMAT = "<Q"
+    OFFSET_SIZE = struct.calcsize(OFFSET_FORMAT)
+    
+    # flags
+    FLAG_SYNONYMS = 1 # synonyms have been indexed
+    
+    _index_path = None
+    _index_file = None
+    _index_map = None
+    _flags = 0
+    _key_width = 0
+    _record_size = 0
+    _num_records = 0
+    
+    def __init__(self, index_path):
+        self._index_path = index_path
+        self._index_file = open(index_path, 'rb')
+        try:
+            self._index_map = mmap.mmap(self._index_file.fileno(), 0, access = mmap.ACCESS_READ)
+        except Exception:
+            self._index_file.close()
+            raise
+        
+        if len(self._index_map) < KeysIndex.HEADER_SIZE:
+            self.close()
+            raise m2pException("KeysIndex: "+index_path+" is not a valid index file. Please, re-create it.")
+        
+        (magic, flags, key_width, num_records) = struct.unpack(KeysIndex.HEADER_FORMAT,
+                                                               self._index_map[:KeysIndex.HEADER_SIZE])
+        
+        record_size = key_width + KeysIndex.OFFSET_SIZE
+        
+        if magic != KeysIndex.MAGIC or \
+            len(self._index_map) != KeysIndex.HEADER_SIZE + num_records * record_size:
+            self.close()
+            raise m2pException("KeysIndex: "+index_path+" is not a valid index file. Please, re-create it.")
+        
+        self._flags = flags
+        self._key_width = key_width
+        self._record_size = record_size
+        self._num_records = num_records
+    
+    def get_num_records(self):
+        return self._num_records
+    
+    def has_synonyms(self):
+        return (self._flags & KeysIndex.FLAG_SYNONYMS) != 0
+    
+    def close(self):
+        if self._index_map:
+            self._index_map.close()
+            self._index_map = None
+        if self._index_file:
+            self._index_file.close()
+            self._index_file = None
+    
+    def _get_key(self, i):
+        record_pos = KeysIndex.HEADER_SIZE + i * self._record_size
+        return self._index_map[record_pos:record_pos+self._key_width]
+    
+    def _get_offset(self, i):
+        offset_pos = KeysIndex.HEADER_SIZE + i * self._record_size + self._key_width
+        return struct.unpack(KeysIndex.OFFSET_FORMAT,
+                             self._index_map[offset_pos:offset_pos+KeysIndex.OFFSET_SIZE])[0]
+    
+    # Returns the offsets of all the rows with this key,
+    # in the order in which they appear in the indexed file
+    def get_offsets(self, key):
+        offsets = []
+        
+        if len(key) > self._key_width: return offsets
+        
+        padded_key = key.ljust(self._key_width, "\0")
+        
+        # Bisection to the leftmost record with this key
+        lo = 0
+        hi = self._num_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._get_key(mid) < padded_key:
+                lo = mid + 1
+            else:
+                hi = mid
+        
+        i = lo
+        while i < self._num_records and self._get_key(i) == padded_key:
+            offsets.append(self._get_offset(i))
+            i += 1
+        
+        return offsets
+    
+    @staticmethod
+    def write_index(index_path, keys_offsets, flags = 0):
+        
+        keys_offsets.sort()
+        
+        key_width = max([len(key) for (key, offset) in keys_offsets]) if len(keys_offsets) > 0 else 0
+        
+        with open(index_path, 'wb') as index_f:
+            index_f.write(struct.pack(KeysIndex.HEADER_FORMAT, KeysIndex.MAGIC, flags, key_width, len(keys_offsets)))
+            for (key, offset) in keys_offsets:
+                index_f.write(key.ljust(key_width, "\0"))
+                index_f.write(struct.pack(KeysIndex.OFFSET_FORMAT, offset))
+        
+        return
+    
+    # Creates the index of a tabular file, using the first field of each row as key.
+    # Rows starting with ">" or "#" are skipped.
+    # If a synonyms dict is given ([key] = [key, synonym1, synonym2, ...]),
+    # each synonym of a key is indexed also with the rows of that key.
+    @staticmethod
+    def index_file(data_path, index_path, synonyms_dict = None, verbose = False):
+        keys_offsets = []
+        
+        num_rows = 0
+        
+        with open(data_path, 'r') as data_f:
+            curr_byte = 0
+            while True:
+                line = data_f.readline()
+                if not line: break
+                
+                if not line.startswith((">", "#")):
+                    key = line.strip().split("\t")[0]
+                    keys_offsets.append((key, curr_byte))
+                    num_rows += 1
+                    
+                    if synonyms_dict and key in synonyms_dict:
+                        for synonym in set(synonyms_dict[key]):
+                            if synonym != key:
+                                keys_offsets.append((synonym, curr_byte))
+                
+                curr_byte = data_f.tell()
+        
+        if verbose: sys.stderr.write("KeysIndex: "+str(num_rows)+" rows and "+str(len(keys_offsets))+" keys from "+data_path+"\n")
+        
+        flags = KeysIndex.FLAG_SYNONYMS if synonyms_dict != None else 0
+        
+        KeysIndex.write_index(index_path, keys_offsets, flags)
+        
+        return num_rows
+    
+# KeysFilter: Bloom filter of the keys (first field) of a tabular file,
+# and of their synonyms, to know without reading the file nor its KeysIndex
+# that none of a list of keys are in the file.
+# A key which is not in the filter is not in the file, whereas a key which is in the filter
+# is in the file except for a small fraction of false positives (about 1% with the default sizes).
+#
+# Format:
+#    header: MAGIC (8 bytes), flags (uint32), number of hashes (uint32), number of bits (uint64)
+#    bits: the bits of the filter (number of bits / 8 bytes)
+class KeysFilter(object):
+    
+    FILE_EXT = ".kbf"
+    MAGIC = "BMAPKBFL"
+    HEADER_FORMAT = "<8sIIQ"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    HASH_FORMAT = "<QQ"
+    
+    BITS_PER_KEY = 10
+    NUM_HASHES = 7
+    
+    # flags
+    FLAG_SYNONYMS = KeysIndex.FLAG_SYNONYMS # synonyms have been added
+    
+    _filter_path = None
+    _filter_file = None
+    _filter_map = None
+    _flags = 0
+    _num_hashes = 0
+    _num_bits = 0
+    
+    def __init__(self, filter_path):
+        self._filter_path = filter_path
+        self._filter_file = open(filter_path, 'rb')
+        try:
+            self._filter_map = mmap.mmap(self._filter_file.fileno(), 0, access = mmap.ACCESS_READ)
+        except Exception:
+            self._filter_file.close()
+            raise
+        
+        if len(self._filter_map) < KeysFilter.HEADER_SIZE:
+            self.close()
+            raise m2pException("KeysFilter: "+filter_path+" is not a valid filter file. Please, re-create it.")
+        
+        (magic, flags, num_hashes, num_bits) = struct.unpack(KeysFilter.HEADER_FORMAT,
+                                                             self._filter_map[:KeysFilter.HEADER_SIZE])
+        
+        if magic != KeysFilter.MAGIC or num_bits == 0 or num_bits % 8 != 0 or \
+            len(self._filter_map) != KeysFilter.HEADER_SIZE + num_bits // 8:
+            self.close()
+            raise m2pException("KeysFilter: "+filter_path+" is not a valid filter file. Please, re-create it.")
+        
+        self._flags = flags
+        self._num_hashes = num_hashes
+        self._num_bits = num_bits
+    
+    def has_synonyms(self):
+        return (self._flags & KeysFilter.FLAG_SYNONYMS) != 0
+    
+    def close(self):
+        if self._filter_map:
+            self._filter_map.close()
+            self._filter_map = None
+        if self._filter_file:
+            self._filter_file.close()
+            self._filter_file = None
+    
+    # The bits of a key are obtained by double hashing of the MD5 of the key
+    @staticmethod
+    def _get_bits(key, num_hashes, num_bits):
+        (hash_1, hash_2) = struct.unpack(KeysFilter.HASH_FORMAT, hashlib.md5(key).digest())
+        return [(hash_1 + i * hash_2) % num_bits for i in xrange(num_hashes)]
+    
+    def contains(self, key):
+        for bit in KeysFilter._get_bits(key, self._num_hashes, self._num_bits):
+            if not ord(self._filter_map[KeysFilter.HEADER_SIZE + bit // 8]) & (1 << (bit % 8)):
+                return False
+        
+        return True
+    
+    # True if any of the keys could be in the filtered file
+    def contains_any(self, keys):
+        for key in keys:
+            if self.contains(key):
+                return True
+        
+        return False
+    
+    @staticmethod
+    def write_filter(filter_path, keys, flags = 0):
+        
+        # Rounded up to whole bytes
+        num_bits = max(len(keys) * KeysFilter.BITS_PER_KEY, 8)
+        num_bits += (8 - num_bits % 8) % 8
+        
+        filter_bits = bytearray(num_bits // 8)
+        for key in keys:
+            for bit in KeysFilter._get_bits(key, KeysFilter.NUM_HASHES, num_bits):
+                filter_bits[bit // 8] |= 1 << (bit % 8)
+        
+        with open(filter_path, 'wb') as filter_f:
+            filter_f.write(struct.pack(KeysFilter.HEADER_FORMAT, KeysFilter.MAGIC, flags, KeysFilter.NUM_HASHES, num_bits))
+            filter_f.write(filter_bits)
+        
+        return
+    
+    # Creates the filter of a tabular file, with the first field of each row as key.
+    # Rows starting with ">" or "#" are skipped.
+    # If a synonyms dict is given ([key] = [key, synonym1, synonym2, ...]),
+    # the synonyms of the keys are added also.
+    @staticmethod
+    def filter_file(data_path, filter_path, synonyms_dict = None, verbose = False):
+        keys = set()
+        
+        with open(data_path, 'r') as data_f:
+            for line in data_f:
+                if line.startswith((">", "#")): continue
+                
+                key = line.strip().split("\t")[0]
+                keys.add(key)
+                
+                if synonyms_dict and key in synonyms_dict:
+                    keys.update(synonyms_dict[key])
+        
+        if verbose: sys.stderr.write("KeysFilter: "+str(len(keys))+" keys from "+data_path+"\n")
+        
+        flags = KeysFilter.FLAG_SYNONYMS if synonyms_dict != None else 0
+        
+        KeysFilter.write_filter(filter_path, keys, flags)
+        
+        return len(keys)
+    
+# PositionsIndex: binary index of the positions of a sorted dataset or map file.
+# The rows of each chromosome are grouped in blocks of consecutive rows,
+# and for each block the byte offset of its first row and the
+# minimum and maximum values of the position fields (3rd and 4th columns) are stored,
+# so that an interval query only reads the blocks which could overlap the interval.
+#
+# Format:
+#    header: MAGIC (8 bytes), rows per block (uint32), number of chromosomes (uint32), number of blocks (uint64)
+#    chromosomes: length of name (uint32), name
+#    blocks: chromosome (uint32), number of rows (uint32), offset (uint64),
+#            min and max of 3rd column, min and max of 4th column (doubles)
+class PositionsIndex(object):
+    
+    FILE_EXT = ".pidx"
+    MAGIC = "BMAPPIDX"
+    HEADER_FORMAT = "<8sIIQ"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    NAME_FORMAT = "<I"
+    NAME_SIZE = struct.calcsize(NAME_FORMAT)
+    BLOCK_FORMAT = "<IIQdddd"
+    BLOCK_SIZE = struct.calcsize(BLOCK_FORMAT)
+    
+    ROWS_PER_BLOCK = 512
+    
+    # Fields of the rows with positions
+    FIELD_CHROM = 1
+    FIELD_POS_1 = 2
+    FIELD_POS_2 = 3
+    
+    _index_path = None
+    _blocks_dict = None # [chrom] = [(offset, num_rows, min_1, max_1, min_2, max_2), ...]
+    
+    def __init__(self, index_path):
+        self._index_path = index_path
+        self._blocks_dict = {}
+        
+        with open(index_path, 'rb') as index_f:
+            index_data = index_f.read()
+        
+        if len(index_data) < PositionsIndex.HEADER_SIZE:
+            raise m2pException("PositionsIndex: "+index_path+" is not a valid index file. Please, re-create it.")
+        
+        (magic, rows_per_block, num_chroms, num_blocks) = struct.unpack_from(PositionsIndex.HEADER_FORMAT, index_data, 0)
+        
+        if magic != PositionsIndex.MAGIC:
+            raise m2pException("PositionsIndex: "+index_path+" is not a valid index file. Please, re-create it.")
+        
+        pos = PositionsIndex.HEADER_SIZE
+        chroms = []
+        for i in xrange(num_chroms):
+            name_len = struct.unpack_from(PositionsIndex.NAME_FORMAT, index_data, pos)[0]
+            pos += PositionsIndex.NAME_SIZE
+            chroms.append(index_data[pos:pos+name_len])
+            pos += name_len
+        
+        if len(index_data) != pos + num_blocks * PositionsIndex.BLOCK_SIZE:
+            raise m2pException("PositionsIndex: "+index_path+" is not a valid index file. Please, re-create it.")
+        
+        for i in xrange(num_blocks):
+            block = struct.unpack_from(PositionsIndex.BLOCK_FORMAT, index_data, pos)
+            pos += PositionsIndex.BLOCK_SIZE
+            
+            chrom = chroms[block[0]]
+            if chrom in self._blocks_dict:
+                self._blocks_dict[chrom].append(block[2:3]+block[1:2]+block[3:])
+            else:
+                self._blocks_dict[chrom] = [block[2:3]+block[1:2]+block[3:]]
+    
+    # Returns the blocks, as (offset, number of rows), of a chromosome
+    # which could have rows overlapping the interval.
+    # pos_fields: which of the position fields (1st, 2nd or both) have to be checked
+    def get_blocks(self, chrom, ini_pos, end_pos, pos_fields):
+        blocks = []
+        
+        if chrom in self._blocks_dict:
+            for (offset, num_rows, min_1, max_1, min_2, max_2) in self._blocks_dict[chrom]:
+                if pos_fields == (PositionsIndex.FIELD_POS_1,):
+                    block_min = min_1
+                    block_max = max_1
+                elif pos_fields == (PositionsIndex.FIELD_POS_2,):
+                    block_min = min_2
+                    block_max = max_2
+                else:
+                    block_min = min(min_1, min_2)
+                    block_max = max(max_1, max_2)
+                
+                if block_min <= end_pos and block_max >= ini_pos:
+                    blocks.append((offset, num_rows))
+        
+        return blocks
+    
+    # Position fields used to sort the rows of a map (or of a dataset for a map):
+    # physical maps have start and end positions, anchored maps have cM, bp or both.
+    # Returns None if the map has no positions of the sort type.
+    @staticmethod
+    def get_pos_fields(map_is_physical, map_has_cm_pos, map_has_bp_pos, map_sort_by):
+        pos_fields = None
+        
+        if map_is_physical:
+            if map_sort_by == MapTypes.MAP_SORT_PARAM_BP:
+                pos_fields = (PositionsIndex.FIELD_POS_1, PositionsIndex.FIELD_POS_2)
+        elif map_has_cm_pos and map_has_bp_pos:
+            if map_sort_by == MapTypes.MAP_SORT_PARAM_CM:
+                pos_fields = (PositionsIndex.FIELD_POS_1,)
+            elif map_sort_by == MapTypes.MAP_SORT_PARAM_BP:
+                pos_fields = (PositionsIndex.FIELD_POS_2,)
+        elif map_has_cm_pos:
+            if map_sort_by == MapTypes.MAP_SORT_PARAM_CM:
+                pos_fields = (PositionsIndex.FIELD_POS_1,)
+        elif map_has_bp_pos:
+            if map_sort_by == MapTypes.MAP_SORT_PARAM_BP:
+                pos_fields = (PositionsIndex.FIELD_POS_1,)
+        
+        return pos_fields
+    
+    # Creates the index of positions of a tabular file
+    # with the chromosome in the 2nd field and positions in the 3rd and 4th fields.
+    # Rows starting with ">" or "#" are skipped.
+    @staticmethod
+    def index_file(data_path, index_path, verbose = False):
+        chroms = []
+        chroms_dict = {}
+        blocks = []
+        
+        num_rows = 0
+        block = None
+        
+        with open(data_path, 'r') as data_f:
+            curr_byte = 0
+            while True:
+                line = data_f.readline()
+                if not line: break
+                
+                if not line.startswith((">", "#")):
+                    line_data = line.strip().split("\t")
+                    chrom = line_data[PositionsIndex.FIELD_CHROM]
+                    
+                    if not chrom in chroms_dict:
+                        chroms_dict[chrom] = len(chroms)
+                        chroms.append(chrom)
+                    chrom_num = chroms_dict[chrom]
+                    
+                    # New block for a new chromosome or when the current block is full
+                    if block == None or block[0] != chrom_num or block[1] == PositionsIndex.ROWS_PER_BLOCK:
+                        if block != None: blocks.append(block)
+                        block = [chrom_num, 0, curr_byte, float("inf"), float("-inf"), float("inf"), float("-inf")]
+                    
+                    block[1] += 1
+                    
+                    # Non numeric fields (for example, the "multiple positions" field
+                    # of maps with a single position) are not taken into account
+                    for (field, min_pos) in [(PositionsIndex.FIELD_POS_1, 3), (PositionsIndex.FIELD_POS_2, 5)]:
+                        if len(line_data) > field:
+                            try:
+                                pos = float(line_data[field])
+                            except ValueError:
+                                continue
+                            if pos < block[min_pos]: block[min_pos] = pos
+                            if pos > block[min_pos+1]: block[min_pos+1] = pos
+                    
+                    num_rows += 1
+                
+                curr_byte = data_f.tell()
+        
+        if block != None: blocks.append(block)
+        
+        if verbose: sys.stderr.write("PositionsIndex: "+str(num_rows)+" rows in "+str(len(blocks))+" blocks from "+data_path+"\n")
+        
+        with open(index_path, 'wb') as index_f:
+            index_f.write(struct.pack(PositionsIndex.HEADER_FORMAT, PositionsIndex.MAGIC,
+                                      PositionsIndex.ROWS_PER_BLOCK, len(chroms), len(blocks)))
+            for chrom in chroms:
+                index_f.write(struct.pack(PositionsIndex.NAME_FORMAT, len(chrom)))
+                index_f.write(chrom)
+            for block in blocks:
+                index_f.write(struct.pack(PositionsIndex.BLOCK_FORMAT, *block))
+        
+        return num_rows
+    
+## END
@@ -5,15 +5,23 @@
 # Copyright (C)  2013-2014  Carlos P Cantalapiedra.
 # (terms of use can be found within the distributed LICENSE file).
 
-import sys
+import sys, os
 
 #from barleymapcore.maps.MapsBase import MapTypes
 #from barleymapcore.maps.MappingResults import MappingResult
 #from barleymapcore.db.MapsConfig import MapsConfig
 
+from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
+
 from MapFiles import ChromosomesFile
 from MappingsParser import MappingsParser
 
+# Chromosome dicts already read in this process,
+# so that several MapReader of the same map do not read the chromosomes file again
+# [chrom_path] = (mtime, chrom_dict)
+_chrom_dicts_cache = {}
+
 class MapReader(object):
     
     _maps_path = ""
@@ -33,10 +41,12 @@ class MapReader(object):
     def get_chrom_dict(self, ):
         return self._chrom_dict
     
+    # The chromosome dict is shared by all the MapReader of the same map,
+    # and it is read again only if the chromosomes file has changed
     def _load_chrom_dict(self):#, filter_results = True):
         #
         chrom_dict = {}
-        # [chrom_name] = {"chrom_order"}
+        # [chrom_name] = chrom_order (int)
         
         map_config = self.get_map_config()
         map_id = map_config.get_id()
@@ -44,6 +54,15 @@ class MapReader(object):
         
         # File with map-DB positions
         map_path = self._maps_path+map_dir+"/"+map_dir+ChromosomesFile.FILE_EXT
+        
+        map_mtime = os.path.getmtime(map_path)
+        if map_path in _chrom_dicts_cache:
+            (cached_mtime, cached_chrom_dict) = _chrom_dicts_cache[map_path]
+            if cached_mtime == map_mtime:
+                if self._verbose: sys.stderr.write("\tMapReader: chromosome order of "+map_path+" already loaded\n")
+                metrics_utils.count("map_reader.cache_hits")
+                return cached_chrom_dict
+        
         if self._verbose: sys.stderr.write("\tMapReader: reading chromosome order from "+map_path+"\n")
         
         # Map data for this database
@@ -51,13 +70,15 @@ class MapReader(object):
             map_data = map_line.strip().split("\t")
             
             chrom_name = map_data[ChromosomesFile.CHROM_NAME]
-            chrom_order = map_data[ChromosomesFile.CHROM_ORDER]
+            chrom_order = int(map_data[ChromosomesFile.CHROM_ORDER])
             
             if chrom_name in chrom_dict:
                 raise m2pException("Duplicated chromosome name "+chrom_name+" in "+map_path+".")
             else:
                 chrom_dict[chrom_name] = chrom_order
         
+        _chrom_dicts_cache[map_path] = (map_mtime, chrom_dict)
+        
         return chrom_dict
     
     def obtain_map_positions(self, contig_set):
@@ -5,14 +5,87 @@
 # Copyright (C)  2017  Carlos P Cantalapiedra.
 # (terms of use can be found within the distributed LICENSE file).
 
-import sys, os
-import cPickle
+import sys, bisect
 
 from barleymapcore.maps.MappingResults import MappingResult
 from barleymapcore.maps.MapInterval import MapInterval
 from barleymapcore.maps.enrichment.FeatureMapping import FeaturesFactory
 
 from MapFiles import MapFile
+from IndexFiles import KeysIndex, PositionsIndex, index_is_available
+
+import barleymapcore.utils.metrics_utils as metrics_utils
+
+# Names of the counters of metrics_utils
+ROWS_SCANNED = "mappings_parser.rows_scanned" # rows read from data files
+ROWS_DECODED = "mappings_parser.rows_decoded" # rows from which a MappingResult was created
+INDEX_HITS = "mappings_parser.index_hits" # rows or blocks of rows found in an index
+FULL_SCANS = "mappings_parser.full_scans" # data files read completely (without index)
+
+### Finds the MapIntervals which overlap a row of a data file,
+### regardless of the order of the rows, among the intervals of its chromosome.
+### The intervals of each chromosome are sorted by their start, with the maximum end
+### up to each one, so that only the intervals which could overlap a row are compared.
+### An item (e.g. the FeaturedMapInterval of each MapInterval) can be returned instead of each interval.
+class ChromIntervals(object):
+    
+    _chrom_dict = None # [chrom] = (starts, maximum ends, [(start, end, num, map_interval, item), ...])
+    
+    def __init__(self, map_intervals, items = None):
+        self._chrom_dict = {}
+        
+        if items == None: items = map_intervals
+        
+        chrom_entries = {}
+        for (num, map_interval) in enumerate(map_intervals):
+            chrom = map_interval.get_chrom()
+            ini_pos = float(map_interval.get_ini_pos())
+            end_pos = float(map_interval.get_end_pos())
+            
+            entry = (min(ini_pos, end_pos), max(ini_pos, end_pos), num, map_interval, items[num])
+            if chrom in chrom_entries:
+                chrom_entries[chrom].append(entry)
+            else:
+                chrom_entries[chrom] = [entry]
+        
+        for (chrom, entries) in chrom_entries.iteritems():
+            entries.sort(key=lambda entry: (entry[0], entry[2]))
+            
+            starts = [chrom_entry[0] for chrom_entry in entries]
+            max_ends = []
+            max_end = float("-inf")
+            for entry in entries:
+                max_end = max(max_end, entry[1])
+                max_ends.append(max_end)
+            
+            self._chrom_dict[chrom] = (starts, max_ends, entries)
+    
+    def has_chrom(self, chrom):
+        return chrom in self._chrom_dict
+    
+    # Returns the items of the intervals overlapping dataset_interval, in the order of the intervals
+    def get_overlapping(self, dataset_interval):
+        overlapping = []
+        
+        chrom = dataset_interval.get_chrom()
+        if not chrom in self._chrom_dict: return overlapping
+        
+        (starts, max_ends, entries) = self._chrom_dict[chrom]
+        
+        ini_pos = float(dataset_interval.get_ini_pos())
+        end_pos = float(dataset_interval.get_end_pos())
+        
+        # Intervals starting after the row, or ending (all of them up to one) before the row, can not overlap it
+        first = bisect.bisect_left(max_ends, min(ini_pos, end_pos))
+        last = bisect.bisect_right(starts, max(ini_pos, end_pos))
+        
+        for entry in entries[first:last]:
+            if MapInterval.intervals_overlap(dataset_interval, entry[3]):
+                overlapping.append(entry)
+        
+        overlapping.sort(key=lambda entry: entry[2])
+        
+        return [overlapping_entry[4] for overlapping_entry in overlapping]
 
 ### Class to obtain mapping results from pre-calculated datasets
 ### "mapping results" are those which have already map positions
@@ -34,10 +107,15 @@ class MappingsParser(object):
             mapping_result = MappingResult.init_from_data(hit_data, map_name, chrom_dict, map_is_physical, map_has_cm_pos, map_has_bp_pos)
             mapping_results_list.append(mapping_result)
         
+        metrics_utils.count(FULL_SCANS)
+        metrics_utils.count(ROWS_SCANNED, len(mapping_results_list))
+        metrics_utils.count(ROWS_DECODED, len(mapping_results_list))
+        
         return mapping_results_list
     
+    # hits: rows to be processed (by default, all the rows of the data file)
     def _parse_mapping_file_by_id(self, query_ids_dict, data_path, map_config, chrom_dict,
-                                        multiple_param, dataset_synonyms = {}, test_set = None):
+                                        multiple_param, dataset_synonyms = {}, test_set = None, hits = None):
         mapping_results_list = []
         
         map_name = map_config.get_name()
@@ -45,18 +123,28 @@ class MappingsParser(object):
         map_has_bp_pos = map_config.has_bp_pos()
         map_is_physical = map_config.as_physical()
         
-        for hit in open(data_path, 'r'):
+        if hits == None:
+            hits = open(data_path, 'r')
+            metrics_utils.count(FULL_SCANS)
+        
+        rows_scanned = 0
+        rows_decoded = 0
+        
+        for hit in hits:
             #sys.stderr.write(" ONE**************************\n")
             #sys.stderr.write(str(hit)+"\n")
             if hit.startswith(">") or hit.startswith("#"): continue
-            hit_data = hit.strip().split("\t")
+            
+            rows_scanned += 1
+            
+            # Only the marker id is read from the row,
+            # the whole row is parsed only when the marker is one of the queries
+            hit_query = hit.split("\t", 1)[0].strip()
             
             #sys.stderr.write("data\n")
             
             if test_set:
                 
-                hit_query = hit_data[0]
-                
                 #if hit_query == "12_30924":
                 #    sys.stderr.write(str(test_set)+"\n")
                     
@@ -70,8 +158,10 @@ class MappingsParser(object):
                     if len(synonyms_found) > 0:
                         #if hit_query == "12_30924":
                         #    sys.stderr.write("-".join(synonyms_found)+"\n")
+                        hit_data = hit.strip().split("\t")
                         mapping_result = MappingResult.init_from_data(hit_data, map_name, chrom_dict, map_is_physical,
                                                                       map_has_cm_pos, map_has_bp_pos)
+                        rows_decoded += 1
                         
                         for synonym in synonyms_found: # all found
                             query_ids_dict[synonym] = 1
@@ -91,7 +181,9 @@ class MappingsParser(object):
                     #    sys.stderr.write("IS NOT IN SYNONYMS\n")
                     if hit_query in test_set:
                         #sys.stderr.write("create mapping data\n")
+                        hit_data = hit.strip().split("\t")
                         mapping_result = MappingResult.init_from_data(hit_data, map_name, chrom_dict, map_is_physical, map_has_cm_pos, map_has_bp_pos)
+                        rows_decoded += 1
                         
                         query_ids_dict[hit_query] = 1 # found
                         
@@ -105,7 +197,9 @@ class MappingsParser(object):
                         mapping_results_list.append(mapping_result)
                         
             else: # retrieve all mapping results
+                hit_data = hit.strip().split("\t")
                 mapping_result = MappingResult.init_from_data(hit_data, map_name, chrom_dict, map_is_physical, map_has_cm_pos, map_has_bp_pos)
+                rows_decoded += 1
                 
                 query_ids_dict[hit_query] = 1 # found
                 
@@ -118,49 +212,48 @@ class MappingsParser(object):
             #sys.stderr.write("**********NEXT\n")
             if len(test_set) == 0: break
         
+        metrics_utils.count(ROWS_SCANNED, rows_scanned)
+        metrics_utils.count(ROWS_DECODED, rows_decoded)
+        
         return mapping_results_list
     
+    # The index is used to obtain the rows of the queries (and of their synonyms),
+    # which are then processed in the same order and in the same way
+    # than when reading the whole data file
     def _parse_index_file_by_id(self, query_ids_dict, index_path, data_path, map_config, chrom_dict,
                                                                     multiple_param, dataset_synonyms, test_set):
         mapping_results_list = []
         
-        ## TODO: DO SOMETHING WITH THE SYNONYMS!!!
-        ##
-        
-        map_name = map_config.get_name()
-        map_has_cm_pos = map_config.has_cm_pos()
-        map_has_bp_pos = map_config.has_bp_pos()
-        map_is_physical = map_config.as_physical()
-        
-        sys.stderr.write("MappingsParser: loading index "+str(index_path)+"...\n")
-        
-        with open(index_path, 'r') as index_f:
-            index = cPickle.load(index_f)
-        
-        sys.stderr.write("MappingsParser: loaded index with "+str(len(index))+" entries.\n")
+        sys.stderr.write("MappingsParser: opening index "+str(index_path)+"...\n")
         
-        sys.stderr.write("MappingsParser: obtaining index of queries...\n")
-        queries_bytes = []
-        for query in test_set:
-            if query in index:
-                query_bytes = index[query]
+        keys_index = KeysIndex(index_path)
+        try:
+            sys.stderr.write("MappingsParser: index with "+str(keys_index.get_num_records())+" entries.\n")
+            
+            # Queries which are synonyms of the markers could not be found in an index without synonyms
+            if len(dataset_synonyms) > 0 and not keys_index.has_synonyms():
+                sys.stderr.write("WARNING: MappingsParser: index "+str(index_path)+" has no synonyms. "+\
+                                 "It will be ignored. Please, re-create it with the synonyms file.\n")
+                indexed = False
+            else:
+                indexed = True
                 
-                query_ids_dict[query] = 1 # found
+                sys.stderr.write("MappingsParser: obtaining index of queries...\n")
+                queries_bytes = set()
+                for query in test_set:
+                    queries_bytes.update(keys_index.get_offsets(query))
                 
-                queries_bytes.append(query_bytes)
+                metrics_utils.count(INDEX_HITS, len(queries_bytes))
+        finally:
+            keys_index.close()
         
-        with open(data_path, 'r') as data_f:
-            for query_bytes in queries_bytes:
-                data_f.seek(query_bytes)
-                mapping_line = data_f.readline()
-                mapping_data = mapping_line.strip().split("\t")
-                mapping_result = MappingResult.init_from_data(mapping_data, map_name, chrom_dict, map_is_physical, map_has_cm_pos, map_has_bp_pos)
-                
-                if mapping_result.has_multiple_pos():
-                    if multiple_param == False:
-                        continue
-                
-                mapping_results_list.append(mapping_result)
+        if indexed:
+            hits = self._read_rows(data_path, sorted(queries_bytes))
+        else:
+            hits = None
+        
+        mapping_results_list = self._parse_mapping_file_by_id(query_ids_dict, data_path, map_config, chrom_dict,
+                                                                multiple_param, dataset_synonyms, test_set, hits)
         
         return mapping_results_list
     
@@ -168,9 +261,9 @@ class MappingsParser(object):
                                         multiple_param, dataset_synonyms = {}, test_set = None):
         mapping_results_list = []
         
-        # check if there is an index
-        index_path = data_path+".idx"
-        if os.path.exists(index_path) and os.path.isfile(index_path):
+        # check if there is an index (bmap_datasets_index)
+        index_path = data_path+KeysIndex.FILE_EXT
+        if test_set != None and index_is_available(index_path, data_path):
             mapping_results_list = self._parse_index_file_by_id(query_ids_dict, index_path, data_path, map_config, chrom_dict,
                                                                     multiple_param, dataset_synonyms, test_set)
         else:
@@ -187,22 +280,30 @@ class MappingsParser(object):
         map_has_cm_pos = map_config.has_cm_pos()
         map_has_bp_pos = map_config.has_bp_pos()
         
+        # check if there is an index of positions (bmap_datasets_index)
+        positions_index = self._get_positions_index(data_path, map_config, map_sort_by)
+        if positions_index:
+            return self._parse_index_file_by_pos(positions_index, map_intervals, data_path, chrom_dict, map_config, map_sort_by)
+        
+        pos_fields = PositionsIndex.get_pos_fields(map_is_physical, map_has_cm_pos, map_has_bp_pos, map_sort_by)
+        
         current_interval_pos = 0
         current_interval = map_intervals[current_interval_pos]
         
         # Find all the hits for this map within intervals of interest
         # Note: hits/map features are pre-computed & sorted along chroms, chroms are in chrom_dict order
         # Note: intervals are pre-sorted as well
+        # Note: a MappingResult is created only for the hits which overlap an interval
+        rows_scanned = 0
         for hit in open(data_path, 'r'):
             if hit.startswith(">") or hit.startswith("#"): continue
-            hit_data = hit.strip().split("\t")
+            
+            rows_scanned += 1
             
             #sys.stderr.write(hit+"\n")
             #sys.stderr.write("\t"+str(current_interval)+"\n")
             
-            mapping_result = MappingResult.init_from_data(hit_data, map_name, chrom_dict, map_is_physical, map_has_cm_pos, map_has_bp_pos)
-            
-            chrom_name = mapping_result.get_chrom_name()
+            chrom_name = hit.split("\t", 2)[1]
             
             # move to next interval to match chrom (only if previous mappings exist)
             # Note: needed when last mapping matched exactly the last gene of a chrom
@@ -214,13 +315,11 @@ class MappingsParser(object):
             
             if chrom_name != current_interval.get_chrom(): continue
             
-            map_end_pos = mapping_result.get_sort_end_pos(map_sort_by)
+            hit_data = hit.strip().split("\t")
             
-            if float(map_end_pos) < float(current_interval.get_ini_pos()): continue
+            (map_pos, map_end_pos) = self._get_sort_positions(hit_data, pos_fields)
             
-            marker_id = mapping_result.get_marker_id()
-            chrom_order = mapping_result.get_chrom_order()
-            map_pos = mapping_result.get_sort_pos(map_sort_by)#float(mapping_result.get_sort_pos(map_sort_by))
+            if float(map_end_pos) < float(current_interval.get_ini_pos()): continue
             
             while (float(map_pos) > float(current_interval.get_end_pos())):
                 current_interval_pos += 1
@@ -244,88 +343,173 @@ class MappingsParser(object):
             
             # Check if alignment overlaps with some mapping interval
             if does_overlap:
+                mapping_result = MappingResult.init_from_data(hit_data, map_name, chrom_dict, map_is_physical, map_has_cm_pos, map_has_bp_pos)
                 mapping_results_list.append(mapping_result)
         
+        metrics_utils.count(FULL_SCANS)
+        metrics_utils.count(ROWS_SCANNED, rows_scanned)
+        metrics_utils.count(ROWS_DECODED, len(mapping_results_list))
+        
         return mapping_results_list
     
     def parse_mapping_file_on_pos(self, map_intervals, data_path, chrom_dict, map_config, map_sort_by,
                                   dataset, dataset_name, feature_type):
         
-        map_name = map_config.get_name()
         map_is_physical = map_config.as_physical()
         map_has_cm_pos = map_config.has_cm_pos()
         map_has_bp_pos = map_config.has_bp_pos()
         
-        current_interval_pos = 0
-        featured_current_interval = map_intervals[current_interval_pos]
-        current_interval = featured_current_interval.get_map_interval()
-        current_features = featured_current_interval.get_features()
+        # check if there is an index of positions (bmap_datasets_index)
+        positions_index = self._get_positions_index(data_path, map_config, map_sort_by)
+        if positions_index:
+            return self._parse_index_file_on_pos(positions_index, map_intervals, data_path, chrom_dict, map_config, map_sort_by,
+                                                 dataset, dataset_name, feature_type)
         
-        #sys.stderr.write("MappingsParser \n")
-        #sys.stderr.write("\t"+str(current_interval)+"\n")
-        #sys.stderr.write("\t"+str(len(current_features))+"\n")
-        #for feature in current_features:
-        #    sys.stderr.write("\t\t"+str(feature)+"\n")
+        pos_fields = PositionsIndex.get_pos_fields(map_is_physical, map_has_cm_pos, map_has_bp_pos, map_sort_by)
         
         # Find all the hits for this map
-        for hit in open(data_path, 'r'):
+        # Note: a MappingResult is created only for the hits which overlap an interval
+        with open(data_path, 'r') as hits:
+            (rows_scanned, rows_decoded) = self._add_features_on_pos(hits, pos_fields, map_intervals, chrom_dict, map_config,
+                                                                     dataset, dataset_name, feature_type)
+        
+        metrics_utils.count(FULL_SCANS)
+        metrics_utils.count(ROWS_SCANNED, rows_scanned)
+        metrics_utils.count(ROWS_DECODED, rows_decoded)
+        
+        return map_intervals
+    
+    # Adds a feature to each interval overlapped by each row (hit) of a data file.
+    # The rows are compared only with the intervals of their chromosome,
+    # so that the result does not depend on the rows read (all of them or only those of the index of positions)
+    # Returns (rows scanned, rows decoded)
+    def _add_features_on_pos(self, hits, pos_fields, map_intervals, chrom_dict, map_config,
+                             dataset, dataset_name, feature_type):
+        
+        map_name = map_config.get_name()
+        map_is_physical = map_config.as_physical()
+        map_has_cm_pos = map_config.has_cm_pos()
+        map_has_bp_pos = map_config.has_bp_pos()
+        
+        chrom_intervals = ChromIntervals([featured_map_interval.get_map_interval() for featured_map_interval in map_intervals],
+                                         map_intervals)
+        
+        rows_scanned = 0
+        rows_decoded = 0
+        for hit in hits:
             if hit.startswith(">") or hit.startswith("#"): continue
-            hit_data = hit.strip().split("\t")
             
-            #sys.stderr.write(hit+"\n")
-            #sys.stderr.write("\t"+str(current_interval)+"\n")
+            rows_scanned += 1
             
-            mapping_result = MappingResult.init_from_data(hit_data, map_name, chrom_dict, map_is_physical, map_has_cm_pos, map_has_bp_pos)
+            chrom_name = hit.split("\t", 2)[1]
             
-            chrom_name = mapping_result.get_chrom_name()
+            if not chrom_intervals.has_chrom(chrom_name): continue
             
-            if chrom_name != current_interval.get_chrom(): continue
+            hit_data = hit.strip().split("\t")
             
-            map_end_pos = mapping_result.get_sort_end_pos(map_sort_by)
+            (map_pos, map_end_pos) = self._get_sort_positions(hit_data, pos_fields)
             
-            if float(map_end_pos) < float(current_interval.get_ini_pos()): continue
+            dataset_interval = MapInterval(chrom_name, map_pos, map_end_pos)
+            
+            overlapping = chrom_intervals.get_overlapping(dataset_interval)
+            if len(overlapping) == 0: continue
             
+            mapping_result = MappingResult.init_from_data(hit_data, map_name, chrom_dict, map_is_physical, map_has_cm_pos, map_has_bp_pos)
+            rows_decoded += 1
             marker_id = mapping_result.get_marker_id()
-            chrom_order = mapping_result.get_chrom_order()
-            map_pos = mapping_result.get_sort_pos(map_sort_by)#float(mapping_result.get_sort_pos(map_sort_by))
             
+            # A feature for each interval overlapped
+            for featured_map_interval in overlapping:
+                feature = FeaturesFactory.get_feature(marker_id, dataset, dataset_name, feature_type, mapping_result)
+                featured_map_interval.get_features().append(feature)
+        
+        return (rows_scanned, rows_decoded)
+    
+    # Returns the positions (start, end) used to sort the row of a data file
+    # without creating its MappingResult
+    def _get_sort_positions(self, hit_data, pos_fields):
+        if pos_fields:
+            return (hit_data[pos_fields[0]], hit_data[pos_fields[-1]])
+        else:
+            return (-1, -1)
+    
+    # Returns the index of positions of a data file, or None if there is no index
+    # or if it can not be used with the positions of this map
+    def _get_positions_index(self, data_path, map_config, map_sort_by):
+        positions_index = None
+        
+        index_path = data_path+PositionsIndex.FILE_EXT
+        if index_is_available(index_path, data_path):
+            pos_fields = PositionsIndex.get_pos_fields(map_config.as_physical(), map_config.has_cm_pos(),
+                                                       map_config.has_bp_pos(), map_sort_by)
+            if pos_fields:
+                positions_index = (PositionsIndex(index_path), pos_fields)
+        
+        return positions_index
+    
+    # Returns the rows of the blocks which could overlap the intervals,
+    # in the same order as in the data file
+    def _read_indexed_intervals(self, positions_index, map_intervals, data_path):
+        
+        (index, pos_fields) = positions_index
+        
+        blocks = set()
+        for map_interval in map_intervals:
+            blocks.update(index.get_blocks(map_interval.get_chrom(), float(map_interval.get_ini_pos()),
+                                           float(map_interval.get_end_pos()), pos_fields))
+        
+        metrics_utils.count(INDEX_HITS, len(blocks))
+        
+        return self._read_blocks(data_path, sorted(blocks))
+    
+    # Reads only the rows which could overlap the intervals, and checks
+    # the overlap of each row with the intervals of its chromosome
+    def _parse_index_file_by_pos(self, positions_index, map_intervals, data_path, chrom_dict, map_config, map_sort_by):
+        mapping_results_list = []
+        
+        map_name = map_config.get_name()
+        map_is_physical = map_config.as_physical()
+        map_has_cm_pos = map_config.has_cm_pos()
+        map_has_bp_pos = map_config.has_bp_pos()
+        
+        chrom_intervals = ChromIntervals(map_intervals)
+        
+        pos_fields = positions_index[1]
+        
+        rows_scanned = 0
+        for hit in self._read_indexed_intervals(positions_index, map_intervals, data_path):
+            rows_scanned += 1
+            hit_data = hit.strip().split("\t")
+            
+            chrom_name = hit_data[PositionsIndex.FIELD_CHROM]
+            
+            if not chrom_intervals.has_chrom(chrom_name): continue
+            
+            (map_pos, map_end_pos) = self._get_sort_positions(hit_data, pos_fields)
             dataset_interval = MapInterval(chrom_name, map_pos, map_end_pos)
             
-            does_overlap = MapInterval.intervals_overlap(dataset_interval, current_interval)
-            # This if-else could be unnecessary, but hopefully is useful to read the code
-            if does_overlap:
-                next_interval_pos = current_interval_pos
-                next_interval = current_interval
-                next_features = current_features
-                while (does_overlap):
-                    feature = FeaturesFactory.get_feature(marker_id, dataset, dataset_name, feature_type, mapping_result)
-                    next_features.append(feature)
-                    
-                    next_interval_pos += 1
-                    if next_interval_pos >= len(map_intervals):
-                        break
-                    featured_next_interval = map_intervals[next_interval_pos]
-                    next_interval = featured_next_interval.get_map_interval()
-                    next_features = featured_next_interval.get_features()
-                    
-                    does_overlap = MapInterval.intervals_overlap(dataset_interval, next_interval)
-                    
-            else:
-                while (float(map_pos) > float(current_interval.get_end_pos())):
-                    current_interval_pos += 1
-                    if current_interval_pos >= len(map_intervals):
-                        break
-                    featured_current_interval = map_intervals[current_interval_pos]
-                    current_interval = featured_current_interval.get_map_interval()
-                    current_features = featured_current_interval.get_features()
-        
-        #sys.stderr.write("MappingsParser generated intervals\n")
-        #for featured_map_interval in map_intervals:
-        #    map_interval = featured_map_interval.get_map_interval()
-        #    sys.stderr.write("\tinterval: "+str(map_interval)+"\n")
-        #    features = featured_map_interval.get_features()
-        #    for feature in features:
-        #        sys.stderr.write("\t\tfeature: "+str(feature)+"\n")
+            if len(chrom_intervals.get_overlapping(dataset_interval)) > 0:
+                mapping_result = MappingResult.init_from_data(hit_data, map_name, chrom_dict, map_is_physical, map_has_cm_pos, map_has_bp_pos)
+                mapping_results_list.append(mapping_result)
+        
+        metrics_utils.count(ROWS_SCANNED, rows_scanned)
+        metrics_utils.count(ROWS_DECODED, len(mapping_results_list))
+        
+        return mapping_results_list
+    
+    def _parse_index_file_on_pos(self, positions_index, map_intervals, data_path, chrom_dict, map_config, map_sort_by,
+                                  dataset, dataset_name, feature_type):
+        
+        intervals = [featured_map_interval.get_map_interval() for featured_map_interval in map_intervals]
+        
+        pos_fields = positions_index[1]
+        
+        hits = self._read_indexed_intervals(positions_index, intervals, data_path)
+        (rows_scanned, rows_decoded) = self._add_features_on_pos(hits, pos_fields, map_intervals, chrom_dict, map_config,
+                                                                 dataset, dataset_name, feature_type)
+        
+        metrics_utils.count(ROWS_SCANNED, rows_scanned)
+        metrics_utils.count(ROWS_DECODED, rows_decoded)
         
         return map_intervals
     
@@ -343,24 +527,41 @@ class MappingsParser(object):
         
         #contig_set = set(contig_list) # A clone of contig_list. Used to shorten the search of contigs
         
+        map_has_cm_pos = map_config.has_cm_pos()
+        map_has_bp_pos = map_config.has_bp_pos()
+        
         # For this genetic_map, read the info related to each database of contigs
         for db in map_db_list:
             db_records_read = 0
+            db_records_decoded = 0
             
             # File with map-DB positions
             map_path = maps_path+map_dir+"/"+map_dir+"."+db
             if verbose: sys.stderr.write("\tMappingsParser: map file --> "+map_path+"\n")
             
+            # If there is an index of contigs (bmap_maps_index), use it
+            # instead of reading the whole map file
+            index_path = map_path+KeysIndex.FILE_EXT
+            if index_is_available(index_path, map_path):
+                if verbose: sys.stderr.write("\tMappingsParser: map index --> "+index_path+"\n")
+                map_lines = self._read_indexed_contigs(contig_set, index_path, map_path)
+            else:
+                map_lines = open(map_path, 'r')
+                metrics_utils.count(FULL_SCANS)
+            
             # Map data for this database
-            for map_line in open(map_path, 'r'):
+            for map_line in map_lines:
                 db_records_read += 1
-                map_data = map_line.strip().split("\t")
                 
-                contig_id = map_data[MapFile.MAP_FILE_CONTIG]
+                # The contig is the first field, the whole row is parsed only for the contigs of interest
+                contig_id = map_line.split("\t", 1)[0].strip()
                 
                 # Create positions for this contig
                 if contig_id in contig_set:
                     
+                    map_data = map_line.strip().split("\t")
+                    db_records_decoded += 1
+                    
                     map_pos_chr = map_data[MapFile.MAP_FILE_CHR]
                     
                     if not contig_id in positions_dict:
@@ -368,13 +569,11 @@ class MappingsParser(object):
                     
                     positions_dict[contig_id]["chr"] = map_pos_chr
                     
-                    map_has_cm_pos = map_config.has_cm_pos()
                     if map_has_cm_pos:
                         positions_dict[contig_id]["cm_pos"] = map_data[MapFile.MAP_FILE_CM]#float(map_data[MapFile.MAP_FILE_CM])
                     else:
                         positions_dict[contig_id]["cm_pos"] = -1.0
                     
-                    map_has_bp_pos = map_config.has_bp_pos()
                     if map_has_bp_pos: # "has_bp_pos"
                         positions_dict[contig_id]["bp_pos"] = map_data[MapFile.MAP_FILE_BP]#long(map_data[MapFile.MAP_FILE_BP])
                     else:
@@ -388,6 +587,58 @@ class MappingsParser(object):
             
             if verbose: sys.stderr.write("\t\t records read: "+str(db_records_read)+"\n")
             
+            metrics_utils.count(ROWS_SCANNED, db_records_read)
+            metrics_utils.count(ROWS_DECODED, db_records_decoded)
+            
         return positions_dict
-
+    
+    # Returns the rows of the map file for the contigs in contig_set,
+    # in the same order as in the map file, using the index of contigs
+    def _read_indexed_contigs(self, contig_set, index_path, map_path):
+        
+        contigs_offsets = []
+        keys_index = KeysIndex(index_path)
+        try:
+            for contig_id in contig_set:
+                offsets = keys_index.get_offsets(contig_id)
+                # Only the first row of each contig is used, as when reading the map file
+                if len(offsets) > 0:
+                    contigs_offsets.append(offsets[0])
+        finally:
+            keys_index.close()
+        
+        contigs_offsets.sort()
+        
+        metrics_utils.count(INDEX_HITS, len(contigs_offsets))
+        
+        return self._read_rows(map_path, contigs_offsets)
+    
+    # Returns the rows of a file from blocks of (offset, number of rows)
+    def _read_blocks(self, data_path, blocks):
+        rows = []
+        
+        with open(data_path, 'r') as data_f:
+            for (offset, num_rows) in blocks:
+                data_f.seek(offset)
+                block_rows = 0
+                while block_rows < num_rows:
+                    row = data_f.readline()
+                    if not row: break
+                    if row.startswith(">") or row.startswith("#"): continue
+                    rows.append(row)
+                    block_rows += 1
+        
+        return rows
+    
+    # Returns the rows of a file which start at the given byte offsets
+    def _read_rows(self, data_path, offsets):
+        rows = []
+        
+        with open(data_path, 'r') as data_f:
+            for offset in offsets:
+                data_f.seek(offset)
+                rows.append(data_f.readline())
+        
+        return rows
+    
 ## END
@@ -11,7 +11,8 @@ from barleymapcore.db.DatasetsConfig import DatasetsConfig
 from barleymapcore.maps.MapsBase import MapTypes
 from barleymapcore.m2p_exception import m2pException
 
-from barleymapcore.alignment.AlignmentEngines import ALIGNMENT_TYPE_GREEDY, ALIGNMENT_TYPE_HIERARCHICAL, ALIGNMENT_TYPE_BEST_SCORE
+from barleymapcore.alignment.AlignmentEngines import ALIGNMENT_TYPE_GREEDY, ALIGNMENT_TYPE_HIERARCHICAL, ALIGNMENT_TYPE_BEST_SCORE, \
+                                                     ALIGNMENT_TYPE_HIERARCHICAL_PARALLEL
 
 MAPPED_TITLE = ""
 UNMAPPED_TITLE = "_Unmapped"
@@ -86,7 +87,7 @@ class OutputFacade(object):
         
         if search_type == ALIGNMENT_TYPE_GREEDY:
             alignments_printer = AlignmentsGreedyPrinter(databases_config)
-        elif search_type == ALIGNMENT_TYPE_HIERARCHICAL:
+        elif search_type == ALIGNMENT_TYPE_HIERARCHICAL or search_type == ALIGNMENT_TYPE_HIERARCHICAL_PARALLEL:
             alignments_printer = AlignmentsHierarchicalPrinter(databases_config)
         elif search_type == ALIGNMENT_TYPE_BEST_SCORE:
             alignments_printer = AlignmentsBestScorePrinter(databases_config)
@@ -5,36 +5,266 @@
 # Copyright (C)  2013-2014  Carlos P Cantalapiedra.
 # (terms of use can be found within the distributed LICENSE file).
 
-import os, tempfile
+import sys, os, tempfile, threading, collections
+from subprocess import Popen, PIPE
 
-def load_fasta_lengths(fasta_path):
-    len_dict = {}
+# Number of FastaCatalog kept in memory (the query and its subsets)
+MAX_FASTA_CATALOGS = 32
+
+## This class holds the headers, sequence lengths and byte offsets
+## of the records of a fasta file, so that the file is read only once
+## to obtain its headers or lengths, or to write a subset of its records.
+## The catalogs are kept per process, and are loaded again if the file changes.
+class FastaCatalog(object):
     
-    currlen = 0
-    for fasta_line in open(fasta_path, 'r'):
-        if fasta_line.startswith(">"):
-            if currlen > 0:
-                len_dict[fasta_id] = currlen
-            fasta_id = fasta_line[1:].strip()
-            currlen = 0
-        else:
-            linelen = len(fasta_line.strip())
-            currlen += linelen
+    _fasta_path = ""
+    _headers = None
+    _lengths = None
+    _offsets = None
+    _sizes = None
+    
+    # [fasta_path] = ((mtime, size), FastaCatalog)
+    _catalogs = collections.OrderedDict()
+    _catalogs_lock = threading.Lock()
+    
+    def __init__(self, fasta_path):
+        self._fasta_path = fasta_path
+        self._headers = []
+        self._lengths = []
+        self._offsets = []
+        self._sizes = []
+    
+    @staticmethod
+    def get_catalog(fasta_path):
+        file_stat = os.stat(fasta_path)
+        file_version = (file_stat.st_mtime, file_stat.st_size)
+        
+        with FastaCatalog._catalogs_lock:
+            cached = FastaCatalog._catalogs.get(fasta_path)
+            if cached != None and cached[0] == file_version:
+                return cached[1]
+            
+            fasta_catalog = FastaCatalog(fasta_path)
+            fasta_catalog._load()
+            FastaCatalog._add_catalog(fasta_path, file_version, fasta_catalog)
+        
+        return fasta_catalog
+    
+    @staticmethod
+    def _add_catalog(fasta_path, file_version, fasta_catalog):
+        catalogs = FastaCatalog._catalogs
+        if fasta_path in catalogs: del catalogs[fasta_path]
+        catalogs[fasta_path] = (file_version, fasta_catalog)
+        while len(catalogs) > MAX_FASTA_CATALOGS:
+            catalogs.popitem(last=False)
     
-    if currlen > 0:
-        len_dict[fasta_id] = currlen
+    def _load(self):
+        headers = self._headers
+        lengths = self._lengths
+        offsets = self._offsets
+        sizes = self._sizes
+        
+        offset = 0
         currlen = 0
+        with open(self._fasta_path, 'rb') as fasta_file:
+            for fasta_line in fasta_file:
+                if fasta_line.startswith(">"):
+                    if len(offsets) > 0:
+                        lengths.append(currlen)
+                        sizes.append(offset-offsets[-1])
+                    headers.append(fasta_line[1:].strip())
+                    offsets.append(offset)
+                    currlen = 0
+                else:
+                    currlen += len(fasta_line.strip())
+                
+                offset += len(fasta_line)
+        
+        if len(offsets) > 0:
+            lengths.append(currlen)
+            sizes.append(offset-offsets[-1])
+        
+        return
+    
+    def get_fasta_path(self):
+        return self._fasta_path
+    
+    def get_headers(self):
+        return list(self._headers)
+    
+    # Returns a dict [header] = length of sequence,
+    # without the records with empty sequence
+    def get_lengths(self):
+        return dict((header, length) for (header, length) in zip(self._headers, self._lengths) if length > 0)
+    
+    # Returns a FastaSubset with the records with the given identifiers (the header up to the first space),
+    # among the records with the given indexes (all of them by default)
+    def get_subset(self, headers_list, indexes = None):
+        headers_set = set(headers_list)
+        headers = self._headers
+        
+        if indexes == None: indexes = xrange(len(headers))
+        
+        return FastaSubset(self, [i for i in indexes if headers[i].split(" ")[0] in headers_set])
+    
+    # Writes the records with the given identifiers (the header up to the first space)
+    # to a new temporary fasta file, reading only those records from the fasta file.
+    # The catalog of the new file is created without reading it.
+    def write_subset(self, headers_list, tmp_files_dir):
+        headers_set = set(headers_list)
+        
+        subset_catalog = None
+        (file_desc, new_fasta_path) = tempfile.mkstemp(suffix="_m2p_facade", dir=tmp_files_dir)
+        with os.fdopen(file_desc, 'wb') as output_file:
+            subset_catalog = FastaCatalog(new_fasta_path)
+            
+            offset = 0
+            with open(self._fasta_path, 'rb') as fasta_file:
+                for (header, length, record_offset, record_size) in zip(self._headers, self._lengths, self._offsets, self._sizes):
+                    if header.split(" ")[0] not in headers_set: continue
+                    
+                    fasta_file.seek(record_offset)
+                    output_file.write(fasta_file.read(record_size))
+                    
+                    subset_catalog._headers.append(header)
+                    subset_catalog._lengths.append(length)
+                    subset_catalog._offsets.append(offset)
+                    subset_catalog._sizes.append(record_size)
+                    offset += record_size
+        
+        file_stat = os.stat(new_fasta_path)
+        with FastaCatalog._catalogs_lock:
+            FastaCatalog._add_catalog(new_fasta_path, (file_stat.st_mtime, file_stat.st_size), subset_catalog)
+        
+        return new_fasta_path
+
+## This class is a view of some of the records of a fasta file,
+## which is used instead of writing those records to a new fasta file.
+## Its records are written to the stdin of the aligners (see get_query_input).
+class FastaSubset(object):
+    
+    _fasta_catalog = None
+    _indexes = None
+    
+    def __init__(self, fasta_catalog, indexes):
+        self._fasta_catalog = fasta_catalog
+        self._indexes = indexes
+    
+    def get_fasta_catalog(self):
+        return self._fasta_catalog
+    
+    def get_indexes(self):
+        return self._indexes
+    
+    def get_fasta_path(self):
+        return self._fasta_catalog.get_fasta_path()
+    
+    def get_headers(self):
+        headers = self._fasta_catalog._headers
+        return [headers[i] for i in self._indexes]
+    
+    def get_lengths(self):
+        headers = self._fasta_catalog._headers
+        lengths = self._fasta_catalog._lengths
+        return dict((headers[i], lengths[i]) for i in self._indexes if lengths[i] > 0)
+    
+    # Yields the text of each record, as in the fasta file
+    def get_records_data(self):
+        offsets = self._fasta_catalog._offsets
+        sizes = self._fasta_catalog._sizes
+        
+        with open(self.get_fasta_path(), 'rb') as fasta_file:
+            for i in self._indexes:
+                fasta_file.seek(offsets[i])
+                yield fasta_file.read(sizes[i])
+        
+        return
+    
+    def __str__(self):
+        return self.get_fasta_path()+" (subset of "+str(len(self._indexes))+" records)"
+
+# Most functions below accept either the path to a fasta file or a FastaSubset
+def get_fasta(fasta):
+    if isinstance(fasta, FastaSubset):
+        return fasta
+    else:
+        return FastaCatalog.get_catalog(fasta)
+
+# Returns a FastaSubset of the fasta with the given identifiers
+def get_fasta_subset(fasta, headers_list):
+    if isinstance(fasta, FastaSubset):
+        return fasta.get_fasta_catalog().get_subset(headers_list, fasta.get_indexes())
+    else:
+        return FastaCatalog.get_catalog(fasta).get_subset(headers_list)
+
+# Returns the query argument for the command of an aligner,
+# and the data to be written to its stdin (None if the query is a file)
+def get_query_input(fasta, stdin_path = "/dev/stdin"):
+    if isinstance(fasta, FastaSubset):
+        return (stdin_path, fasta.get_records_data())
+    else:
+        return (fasta, None)
+
+def load_fasta_lengths(fasta):
+    return get_fasta(fasta).get_lengths()
+
+def get_fasta_headers(fasta):
+    return get_fasta(fasta).get_headers()
+
+# Returns a list of (header, sequence) of the records of a fasta file,
+# where header is the header line without ">" and sequence is a single string
+def get_fasta_records(fasta):
     
-    return len_dict
+    if isinstance(fasta, FastaSubset):
+        fasta_lines = (fasta_line for record_data in fasta.get_records_data() for fasta_line in record_data.splitlines())
+        fasta_records = _parse_fasta_lines(fasta_lines)
+    else:
+        with open(fasta, 'r') as fasta_file:
+            fasta_records = _parse_fasta_lines(fasta_file)
+    
+    return fasta_records
 
-def get_fasta_headers(fasta_path):
-    fasta_headers = []
+def _parse_fasta_lines(fasta_lines):
+    fasta_records = []
     
-    for fasta_line in open(fasta_path, 'r'):
+    header = None
+    seq_lines = []
+    for fasta_line in fasta_lines:
         if fasta_line.startswith(">"):
-            fasta_headers.append(fasta_line[1:].strip())
+            if header != None:
+                fasta_records.append((header, "".join(seq_lines)))
+            header = fasta_line[1:].strip()
+            seq_lines = []
+        else:
+            seq_lines.append(fasta_line.strip())
+    
+    if header != None:
+        fasta_records.append((header, "".join(seq_lines)))
     
-    return fasta_headers
+    return fasta_records
+
+# Writes a list of (header, sequence) to a new temporary fasta file
+def write_fasta_records(fasta_records, tmp_files_dir):
+    (file_desc, new_fasta_path) = tempfile.mkstemp(suffix="_m2p_facade", dir=tmp_files_dir)
+    
+    fasta_catalog = FastaCatalog(new_fasta_path)
+    offset = 0
+    with os.fdopen(file_desc, 'w') as output_file:
+        for (header, sequence) in fasta_records:
+            record = ">"+header+"\n"+sequence+"\n"
+            output_file.write(record)
+            
+            fasta_catalog._headers.append(header)
+            fasta_catalog._lengths.append(len(sequence))
+            fasta_catalog._offsets.append(offset)
+            fasta_catalog._sizes.append(len(record))
+            offset += len(record)
+    
+    file_stat = os.stat(new_fasta_path)
+    with FastaCatalog._catalogs_lock:
+        FastaCatalog._add_catalog(new_fasta_path, (file_stat.st_mtime, file_stat.st_size), fasta_catalog)
+    
+    return new_fasta_path
 
 def filter_list(list_to_filter, filters_list):
     filtered_list = []
@@ -51,37 +281,78 @@ def filter_list(list_to_filter, filters_list):
     return filtered_list
 
 def extract_fasta_headers(fasta_path, headers_list, tmp_files_dir):
-    new_fasta_path = ""
+    return FastaCatalog.get_catalog(fasta_path).write_subset(headers_list, tmp_files_dir)
+
+# Runs an external command and yields its stdout lines (without the trailing newline)
+# as soon as they are produced, so that the whole output of an aligner
+# is never held in memory. Stderr goes to a temporary file when not verbose,
+# to avoid blocking the process when the stderr pipe buffer is full.
+# If input_data (a list of strings) is given, it is written to the stdin of the command
+# from another thread, so that writing and reading the output do not block each other.
+def stream_command_output(cmd, caller, verbose = False, input_data = None):
     
-    headers_set = set(headers_list)
+    stdin = PIPE if input_data != None else None
     
-    input_file = None
+    if verbose:
+        err_file = None
+        p = Popen(cmd, shell=True, stdin=stdin, stdout=PIPE, stderr=sys.stderr)
+    else:
+        err_file = tempfile.TemporaryFile()
+        p = Popen(cmd, shell=True, stdin=stdin, stdout=PIPE, stderr=err_file)
+    
+    writer = None
+    if input_data != None:
+        writer = threading.Thread(target=_write_command_input, args=(p.stdin, input_data))
+        writer.daemon = True
+        writer.start()
+    
+    finished = False
     try:
-        (file_desc, new_fasta_path) = tempfile.mkstemp(suffix="_m2p_facade", dir=tmp_files_dir)
-        input_file = os.fdopen(file_desc, 'w')
-        
-        seq_found = False
-        fasta_headers = get_fasta_headers(fasta_path)
-        for line in open(fasta_path):
-            if line.startswith(">"):
-                seqid = line[1:].strip().split(" ")[0] # To ensure that only identifier (and no fasta comments) are compared:
-                if seqid in headers_set:
-                    seq_found = True
-                    input_file.write(line)
-                else:
-                    seq_found = False
-                    
-            elif seq_found:
-                input_file.write(line)
-                
-        input_file.close()
+        for line in iter(p.stdout.readline, ""):
+            yield line.rstrip("\n")
+        
+        finished = True
+        
+    finally:
+        p.stdout.close()
         
-    except Exception:
-        raise
+        # The consumer stopped reading before the end of the output
+        if not finished and p.poll() == None:
+            p.terminate()
+        
+        retValue = p.wait()
+        
+        if writer: writer.join()
+        
+        output_err = ""
+        if err_file:
+            err_file.seek(0)
+            output_err = err_file.read()
+            err_file.close()
+        
+        if finished:
+            if retValue != 0:
+                if verbose:
+                    raise Exception(caller+": return != 0. "+cmd+"\n")
+                else:
+                    raise Exception(caller+": return != 0. "+cmd+"\nError: "+str(output_err)+"\n")
+            
+            if verbose: sys.stderr.write(caller+": return value "+str(retValue)+"\n")
+    
+    return
+
+def _write_command_input(stdin, input_data):
+    try:
+        for data in input_data:
+            stdin.write(data)
+    except IOError: # the command exited before reading all its input
+        pass
     finally:
-        if input_file:
-            input_file.close()
+        try:
+            stdin.close()
+        except IOError:
+            pass
     
-    return new_fasta_path
+    return
 
 ## END
\ No newline at end of file
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# metrics_utils.py is part of Barleymap.
+# Copyright (C)  2017  Carlos P Cantalapiedra.
+# (terms of use can be found within the distributed LICENSE file).
+
+############################################
+# Instrumentation of the stages of barleymap
+# (alignment, mapping, dataset retrieval, enrichment,
+# annotation and output), enabled with the --metrics option
+# of the bmap_* scripts, which write a JSON report when finishing.
+#
+# Each stage records its wall time, its CPU time and the peak RSS.
+# Note that CPU time and peak RSS are those of the whole process
+# (and of its finished children, like the aligners),
+# so that the stages run in parallel threads overlap.
+# The parent of a stage is the stage running in the same thread,
+# or the one passed to a worker thread with parent_stage.
+############################################
+
+import sys, os, time, json, atexit, threading, resource
+from contextlib import contextmanager
+
+_enabled = False
+_report_path = None
+_start_usage = None
+
+_stages = []
+_counters = {}
+_lock = threading.Lock()
+
+# Stages being recorded by each thread, to know the parent of a stage
+_running = threading.local()
+
+def enable(report_path):
+    global _enabled, _report_path, _start_usage
+    
+    if _enabled: return
+    
+    _enabled = True
+    _report_path = report_path
+    _start_usage = _get_usage()
+    
+    atexit.register(_write_report_at_exit)
+    
+    return
+
+def is_enabled():
+    return _enabled
+
+# Returns (wall time, CPU time, CPU time of children, peak RSS, peak RSS of children)
+# Peak RSS in KB
+def _get_usage():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    
+    return (time.time(),
+            self_usage.ru_utime+self_usage.ru_stime,
+            children_usage.ru_utime+children_usage.ru_stime,
+            self_usage.ru_maxrss,
+            children_usage.ru_maxrss)
+
+def _get_record(name, attrs, start_usage, end_usage):
+    record = {"name":name,
+              "attrs":dict([(attr, str(value)) for (attr, value) in attrs.iteritems()]),
+              "start_time":round(start_usage[0]-_start_usage[0], 6),
+              "wall_time":round(end_usage[0]-start_usage[0], 6),
+              "cpu_time":round(end_usage[1]-start_usage[1], 6),
+              "children_cpu_time":round(end_usage[2]-start_usage[2], 6),
+              "peak_rss_kb":end_usage[3],
+              "children_peak_rss_kb":end_usage[4]}
+    
+    return record
+
+## Records a stage of the code within the "with" block:
+##     with metrics_utils.stage("alignment", db = db):
+##         ...
+@contextmanager
+def stage(name, **attrs):
+    if not _enabled:
+        yield
+        return
+    
+    running = _get_running()
+    
+    parent = running[-1] if len(running) > 0 else None
+    running.append(name)
+    
+    start_usage = _get_usage()
+    try:
+        yield
+    finally:
+        end_usage = _get_usage()
+        running.pop()
+        
+        record = _get_record(name, attrs, start_usage, end_usage)
+        record["parent"] = parent
+        
+        with _lock:
+            _stages.append(record)
+
+def _get_running():
+    running = getattr(_running, "stages", None)
+    if running == None:
+        running = []
+        _running.stages = running
+    
+    return running
+
+# Returns the stage being recorded by this thread, or None,
+# to be passed to the worker threads started within it (see parent_stage)
+def get_current_stage():
+    if not _enabled: return None
+    
+    running = _get_running()
+    
+    return running[-1] if len(running) > 0 else None
+
+## The stages recorded by a worker thread within the "with" block
+## are children of parent, a stage of the thread which started the worker:
+##     parent = metrics_utils.get_current_stage()
+##     def worker():
+##         with metrics_utils.parent_stage(parent):
+##             ...
+@contextmanager
+def parent_stage(parent):
+    if not _enabled or parent == None:
+        yield
+        return
+    
+    running = _get_running()
+    running.append(parent)
+    try:
+        yield
+    finally:
+        running.pop()
+
+## Adds n to a counter (rows scanned, cache hits, ...)
+## Counters should be added once for a whole loop, not for each iteration
+def count(name, n = 1):
+    if not _enabled: return
+    
+    with _lock:
+        _counters[name] = _counters.get(name, 0)+n
+    
+    return
+
+def get_report():
+    with _lock:
+        stages = sorted(_stages, key=lambda record: record["start_time"])
+        counters = dict(_counters)
+    
+    # Totals of each type of stage
+    summary = {}
+    for record in stages:
+        name = record["name"]
+        if name in summary:
+            stage_summary = summary[name]
+        else:
+            stage_summary = {"calls":0, "wall_time":0.0, "cpu_time":0.0, "children_cpu_time":0.0}
+            summary[name] = stage_summary
+        
+        stage_summary["calls"] += 1
+        stage_summary["wall_time"] += record["wall_time"]
+        stage_summary["cpu_time"] += record["cpu_time"]
+        stage_summary["children_cpu_time"] += record["children_cpu_time"]
+    
+    report = {"command":" ".join(sys.argv),
+              "pid":os.getpid(),
+              "total":_get_record("total", {}, _start_usage, _get_usage()),
+              "stages":stages,
+              "summary":summary,
+              "counters":counters}
+    
+    return report
+
+def write_report(report_path):
+    report = get_report()
+    
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=1, sort_keys=True)
+        report_file.write("\n")
+    
+    return
+
+def _write_report_at_exit():
+    try:
+        write_report(_report_path)
+        sys.stderr.write("Metrics written to "+str(_report_path)+"\n")
+    except (IOError, OSError) as e:
+        sys.stderr.write("WARNING: the metrics report could not be written to "+str(_report_path)+": "+str(e)+"\n")
+    
+    return
+
+## END
@@ -24,6 +24,7 @@ from barleymapcore.datasets.DatasetsFacade import DatasetsFacade
 from barleymapcore.annotators.GenesAnnotator import AnnotatorsFactory
 from barleymapcore.maps.MapMarkers import MapMarkers
 from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
 from barleymapcore.output.OutputFacade import OutputFacade
 from barleymapcore.maps.enrichment.MapEnricher import SHOW_ON_INTERVALS, SHOW_ON_MARKERS
 
@@ -39,6 +40,7 @@ DEFAULT_THRES_COV = 95.0
 DEFAULT_N_THREADS = 1
 DEFAULT_SORT_PARAM = "map default"
 DEFAULT_EXTEND_WINDOW = 0.0
+DEFAULT_DATASETS_THREADS = 1
 
 def _print_parameters(fasta_path, genetic_map_name, aligner_list,
                       threshold_id, threshold_cov, n_threads,
@@ -123,6 +125,10 @@ try:
                          help='Centimorgans or basepairs (depending on sort) to extend the search of -g or -m.'+\
                          '(default '+str(DEFAULT_EXTEND_WINDOW)+')')
     
+    optParser.add_option('--datasets-threads', action='store', dest='datasets_threads', type='string',
+                         help='Number of datasets read at the same time to search -g, -m or -a features '+\
+                         '(default '+str(DEFAULT_DATASETS_THREADS)+').')
+    
     #optParser.add_option('-a', '--annot', action='store_true', dest='load_annot',
     #                     help='Annotation info for genes will be shown.')
     
@@ -135,12 +141,17 @@ try:
     optParser.add_option('-f', action='store_true', dest='format_numbers', \
                          help='cM positions will be output with all decimals (default, 2 decimals).')
     
+    optParser.add_option('--metrics', action='store', dest='metrics_path', type='string',
+                         help='Write a JSON report of the time, CPU and memory used by each stage to this file.')
+    
     optParser.add_option('-v', '--verbose', action='store_true', dest='verbose', help='More information printed.')
     
     ########### Read parameters
     ###########
     (options, arguments) = optParser.parse_args()
     
+    if options.metrics_path: metrics_utils.enable(options.metrics_path)
+    
     if not arguments or len(arguments)==0:
         optParser.exit(0, "You may wish to run '-help' option.\n")
     
@@ -235,6 +246,10 @@ try:
     else:
         extend_window = DEFAULT_EXTEND_WINDOW
     
+    ## Datasets read at the same time
+    if options.datasets_threads: datasets_threads = int(options.datasets_threads)
+    else: datasets_threads = DEFAULT_DATASETS_THREADS
+    
     ## Show unmapped
     show_unmapped = options.show_unmapped if options.show_unmapped else False
     
@@ -296,7 +311,7 @@ try:
     
     # Load DatasetsFacade
     datasets_path = paths_config.get_datasets_path() #__app_path+config_path_dict["datasets_path"]
-    datasets_facade = DatasetsFacade(datasets_config, datasets_path, maps_path, verbose = verbose_param)
+    datasets_facade = DatasetsFacade(datasets_config, datasets_path, maps_path, verbose = verbose_param, n_threads = datasets_threads)
     
     # GenesAnnotator
     if show_genes and load_annot:
@@ -344,18 +359,19 @@ try:
         mapping_results = mapMarkers.get_mapping_results()
         
         ############################################################ OUTPUT
-        if show_markers:
-            outputPrinter.print_map_with_markers(mapping_results.get_map_with_markers(), map_config, multiple_param)
-        elif show_genes:
-            outputPrinter.print_map_with_genes(mapping_results.get_map_with_genes(), map_config, multiple_param, load_annot, annotator)
-        elif show_anchored:
-            outputPrinter.print_map_with_anchored(mapping_results.get_map_with_anchored(), map_config, multiple_param)
-        else:
-            outputPrinter.print_map(mapping_results.get_mapped(), map_config, multiple_param)
-        
-        if show_unmapped:
-            outputPrinter.print_unmapped(mapping_results.get_unmapped(), map_config)
-            outputPrinter.print_unaligned(mapping_results.get_unaligned(), map_config)
+        with metrics_utils.stage("output", map = map_config.get_name()):
+            if show_markers:
+                outputPrinter.print_map_with_markers(mapping_results.get_map_with_markers(), map_config, multiple_param)
+            elif show_genes:
+                outputPrinter.print_map_with_genes(mapping_results.get_map_with_genes(), map_config, multiple_param, load_annot, annotator)
+            elif show_anchored:
+                outputPrinter.print_map_with_anchored(mapping_results.get_map_with_anchored(), map_config, multiple_param)
+            else:
+                outputPrinter.print_map(mapping_results.get_mapped(), map_config, multiple_param)
+            
+            if show_unmapped:
+                outputPrinter.print_unmapped(mapping_results.get_unmapped(), map_config)
+                outputPrinter.print_unaligned(mapping_results.get_unaligned(), map_config)
 
 except m2pException as m2pe:
     sys.stderr.write("\nThere was an error.\n")
@@ -22,6 +22,7 @@ from barleymapcore.alignment.AlignmentEngines import ALIGNMENT_TYPE_GREEDY
 from barleymapcore.db.DatabasesConfig import REF_TYPE_STD, DatabasesConfig
 from barleymapcore.output.OutputFacade import OutputFacade
 from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
 
 DATABASES_CONF = ConfigBase.DATABASES_CONF
 
@@ -82,16 +83,21 @@ try:
                          help='Number of threads to perform alignments (default '+str(DEFAULT_N_THREADS)+').')
     
     optParser.add_option('--search', action='store', dest='search_type', type='string',
-                         help='Whether obtain the hits from all DBs (greedy), only best score hits (best_score), or first hit found (hierarchical); '+\
+                         help='Whether obtain the hits from all DBs (greedy), only best score hits (best_score), or first hit found (hierarchical, or hierarchical_parallel to search all DBs at once); '+\
                          '(default '+str(DEFAULT_HIERARCHICAL)+').')
     
     optParser.add_option('--ref-type', action='store', dest='ref_type', type='string',
                          help='Whether use GMAP (std) or GMAPL (big), when using --databases-ids only.')
     
+    optParser.add_option('--metrics', action='store', dest='metrics_path', type='string',
+                         help='Write a JSON report of the time, CPU and memory used by each stage to this file.')
+    
     optParser.add_option('-v', '--verbose', action='store_true', dest='verbose', help='More information printed.')
     
     (options, arguments) = optParser.parse_args()
     
+    if options.metrics_path: metrics_utils.enable(options.metrics_path)
+    
     if not arguments or len(arguments)==0:
         optParser.exit(0, "You may wish to run '-help' option.\n")
     
@@ -188,7 +194,8 @@ try:
     sys.stderr.write("\n")
     
     alignments_printer = OutputFacade.get_alignments_printer(search_type, databases_config)
-    alignments_printer.output_results(aligned, databases_ids)
+    with metrics_utils.stage("output"):
+        alignments_printer.output_results(aligned, databases_ids)
     
 except m2pException as m2pe:
     sys.stderr.write("\nThere was an error.\n")
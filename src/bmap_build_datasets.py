@@ -14,6 +14,7 @@ from subprocess import Popen, PIPE
 from optparse import OptionParser
 
 from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
 from barleymapcore.db.DatasetsConfig import DatasetsConfig
 from barleymapcore.db.ConfigBase import ConfigBase
 from barleymapcore.db.PathsConfig import PathsConfig
@@ -52,7 +53,8 @@ def __features_to_map_file(features, maps_path, map_config, map_output_path, ver
         outputPrinter = OutputFacade.get_expanded_printer(map_output, verbose = verbose_param,
                                                           beauty_nums = False, show_headers = True)
         
-        outputPrinter.print_map(mapping_results.get_mapped(), map_config, multiple_param)
+        with metrics_utils.stage("output", map = map_config.get_name()):
+            outputPrinter.print_map(mapping_results.get_mapped(), map_config, multiple_param)
         
     except Exception as e:
         raise e
@@ -138,10 +140,15 @@ try:
     optParser.add_option('--dataset', action='store', dest='dataset_param', type='string',
                     help='A single dataset to process. By default all datasets are processed..')
     
+    optParser.add_option('--metrics', action='store', dest='metrics_path', type='string',
+                         help='Write a JSON report of the time, CPU and memory used by each stage to this file.')
+    
     optParser.add_option('-v', '--verbose', action='store_true', dest='verbose', help='More information printed.')
     
     (options, arguments) = optParser.parse_args()
     
+    if options.metrics_path: metrics_utils.enable(options.metrics_path)
+    
     verbose_param = options.verbose if options.verbose else False
     
     if verbose_param: sys.stderr.write("Command: "+" ".join(sys.argv)+"\n")
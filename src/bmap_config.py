@@ -13,6 +13,7 @@
 import sys, os
 from optparse import OptionParser
 from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
 
 from barleymapcore.db.ConfigBase import ConfigBase
 from barleymapcore.db.PathsConfig import PathsConfig
@@ -70,8 +71,13 @@ try:
     __usage = "usage: bmap_config.py"
     optParser = OptionParser(__usage)
     
+    optParser.add_option('--metrics', action='store', dest='metrics_path', type='string',
+                         help='Write a JSON report of the time, CPU and memory used by each stage to this file.')
+    
     (options, arguments) = optParser.parse_args()
     
+    if options.metrics_path: metrics_utils.enable(options.metrics_path)
+    
     sys.stdout.write("Warning: this command outputs to stderr.\n")
     
     sys.stderr.write("Command: "+" ".join(sys.argv)+"\n")
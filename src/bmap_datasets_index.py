@@ -7,66 +7,79 @@
 
 ############################################
 # This script allows to create a binary index
-# of a text file based on the first field
+# of a text file based on the first field,
+# an index of its positions and a filter of its keys
+# Usage: bmap_datasets_index dataset_file [synonyms_file]
 ############################################
 
 import sys, os, traceback
-import cPickle
-#import json It seems json is slower than cPickle with protocol 2
+from optparse import OptionParser
 
-file_to_index = sys.argv[1]
-index_file = file_to_index+".idx"
+from barleymapcore.maps.reader.IndexFiles import KeysIndex, PositionsIndex, KeysFilter
+from barleymapcore.datasets.DatasetsRetriever import DatasetsRetriever
+import barleymapcore.utils.metrics_utils as metrics_utils
 
-index = {}
+optParser = OptionParser("usage: bmap_datasets_index.py [OPTIONS] dataset_file [synonyms_file]")
+
+optParser.add_option('--metrics', action='store', dest='metrics_path', type='string',
+                     help='Write a JSON report of the time, CPU and memory used by each stage to this file.')
+
+(options, arguments) = optParser.parse_args()
+
+if options.metrics_path: metrics_utils.enable(options.metrics_path)
+
+if len(arguments) < 1:
+    optParser.exit(0, "You may wish to run '-help' option.\n")
+
+file_to_index = arguments[0]
+index_file = file_to_index+KeysIndex.FILE_EXT
+positions_index_file = file_to_index+PositionsIndex.FILE_EXT
+keys_filter_file = file_to_index+KeysFilter.FILE_EXT
+
+# Synonyms of the dataset (as in datasets.conf), which will be indexed also
+if len(arguments) > 1:
+    synonyms_file = arguments[1]
+else:
+    synonyms_file = None
 
 sys.stderr.write("File to index: "+str(file_to_index)+"\n")
 
-## Create the dictionary
-prev = False
-#i=0
-curr_byte = 0
+if synonyms_file:
+    sys.stderr.write("Loading synonyms from "+str(synonyms_file)+"...\n")
+    synonyms_dict = DatasetsRetriever(None, None, None).load_synonyms(synonyms_file)
+    sys.stderr.write("Markers with synonyms "+str(len(synonyms_dict))+"\n")
+else:
+    synonyms_dict = None
+
+## Create the index: a table of (first field, bytes of the row)
+## sorted by the first field, which is memory-mapped when reading
 sys.stderr.write("Indexing rows...\n")
-with open(file_to_index, 'r') as f_i:
-    #for i, line in enumerate(f_i):
-    while True:
-        line = f_i.readline()
-        if not line: break
-        
-        if line.startswith((">", "#")):
-            #i+=1
-            continue
-        
-        line_data = line.strip().split("\t")
-        
-        # Assign the previous bytes
-        index[line_data[0]] = curr_byte
-        # Obtain bytes for the next line
-        curr_byte = f_i.tell()
-        
-        #if (i+1) % 10000 == 0:
-        #    sys.stderr.write("lines indexed "+str(i+1)+"\n")
-        
-        #i+=1
-    
-sys.stderr.write("Final lines in index "+str(len(index))+"\n")
-
-# example of how to read using bytes
-#with open(file_to_index, 'r') as f_i:
-#    f_i.seek(0)
-#    line = f_i.readline()
-#    sys.stderr.write("Line: "+str(line)+"\n")
-    
-sys.stderr.write("Writing the index to "+index_file+"...\n")
-
-## Serialize the dictionary
-with open(index_file, 'w') as index_f:
-    cPickle.dump(index, index_f, protocol = 2)
-    #json.dump(index, index_f)
-
-sys.stderr.write("Loading the index to "+index_file+"...\n")
-with open(index_file, 'r') as index_f:
-    cPickle.load(index_f)
-    #json.load(index_f)
+
+num_rows = KeysIndex.index_file(file_to_index, index_file, synonyms_dict)
+
+sys.stderr.write("Final lines in index "+str(num_rows)+"\n")
+sys.stderr.write("Written the index to "+index_file+"\n")
+
+sys.stderr.write("Checking the index "+index_file+"...\n")
+keys_index = KeysIndex(index_file)
+keys_index.close()
+
+## Create the index of positions: blocks of rows of each chromosome
+## with their minimum and maximum positions
+sys.stderr.write("Indexing positions...\n")
+
+PositionsIndex.index_file(file_to_index, positions_index_file)
+
+sys.stderr.write("Written the index of positions to "+positions_index_file+"\n")
+
+## Create the filter of keys: a Bloom filter of the first field (and synonyms)
+## used to skip the dataset when none of the queries are in it
+sys.stderr.write("Creating the filter of keys...\n")
+
+num_keys = KeysFilter.filter_file(file_to_index, keys_filter_file, synonyms_dict)
+
+sys.stderr.write("Keys in filter "+str(num_keys)+"\n")
+sys.stderr.write("Written the filter of keys to "+keys_filter_file+"\n")
 
 sys.stderr.write("finished indexing "+file_to_index+" to "+index_file+"\n")
 
@@ -0,0 +1,114 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# bmap_dbs_warm.py is part of Barleymap.
+# Copyright (C) 2017 Carlos P Cantalapiedra
+# (terms of use can be found within the distributed LICENSE file).
+
+############################################
+# This script keeps in memory the files of the configured databases
+# of the given aligners, reading them again periodically,
+# so that the aligners started by barleymap (e.g. by the web app)
+# do not have to load the indexes from disk for each request.
+# It is intended to be run as a long-lived process,
+# along with memory mapped GMAP batch modes (1 or 2) in databases.conf.
+############################################
+
+import sys, os, time, traceback
+from optparse import OptionParser
+
+from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
+from barleymapcore.db.ConfigBase import ConfigBase
+from barleymapcore.db.PathsConfig import PathsConfig
+from barleymapcore.db.DatabasesConfig import DatabasesConfig
+from barleymapcore.alignment.Aligners import AlignersFactory
+from barleymapcore.alignment.DatabasesWarmer import DatabasesWarmer
+
+_SCRIPT = os.path.basename(__file__)
+
+DATABASES_CONF = ConfigBase.DATABASES_CONF
+
+DEFAULT_ALIGNER_LIST = ["gmap"]
+DEFAULT_INTERVAL = 600 # seconds
+
+try:
+    ## Argument parsing
+    __usage = "usage: "+_SCRIPT+" [OPTIONS]"
+    optParser = OptionParser(__usage)
+    
+    optParser.add_option('--databases', action='store', dest='databases_param', type='string', help='Comma delimited list of database names '+\
+                         'to keep in memory (default all).')
+    
+    optParser.add_option('--aligner', action='store', dest='aligner', type='string', help='Comma delimited list of aligners '+\
+                         'whose databases will be kept in memory (default '+",".join(DEFAULT_ALIGNER_LIST)+').')
+    
+    optParser.add_option('--interval', action='store', dest='interval', type='string', help='Seconds between each reading '+\
+                         'of the databases (default '+str(DEFAULT_INTERVAL)+'). 0 to read them only once and exit.')
+    
+    optParser.add_option('--metrics', action='store', dest='metrics_path', type='string',
+                         help='Write a JSON report of the time, CPU and memory used by each stage to this file.')
+    
+    optParser.add_option('-v', '--verbose', action='store_true', dest='verbose', help='More information printed.')
+    
+    (options, arguments) = optParser.parse_args()
+    
+    if options.metrics_path: metrics_utils.enable(options.metrics_path)
+    
+    verbose_param = options.verbose if options.verbose else False
+    
+    if verbose_param: sys.stderr.write("Command: "+" ".join(sys.argv)+"\n")
+    
+    if options.aligner: aligner_list = options.aligner.strip().split(",")
+    else: aligner_list = DEFAULT_ALIGNER_LIST
+    
+    if options.interval: interval = int(options.interval)
+    else: interval = DEFAULT_INTERVAL
+    
+    ## Read conf file
+    app_abs_path = os.path.dirname(os.path.abspath(__file__))
+    
+    paths_config = PathsConfig()
+    paths_config.load_config(app_abs_path)
+    __app_path = paths_config.get_app_path()
+    
+    databases_conf_file = __app_path+DATABASES_CONF
+    databases_config = DatabasesConfig(databases_conf_file, verbose_param)
+    
+    if options.databases_param:
+        databases_ids = databases_config.get_databases_ids(options.databases_param.strip().split(","))
+    else:
+        databases_ids = databases_config.get_databases().keys()
+    
+    aligners = [AlignersFactory.get_aligner([aligner_name], 1, paths_config, verbose_param) for aligner_name in aligner_list]
+    
+    warmer = DatabasesWarmer(aligners, verbose_param)
+    
+    while True:
+        start_time = time.time()
+        warm_bytes = warmer.warm(databases_ids)
+        
+        sys.stderr.write(_SCRIPT+": read "+str(warm_bytes/(1024*1024))+" MB of databases in "+\
+                         str(int(time.time()-start_time))+" seconds\n")
+        
+        if interval <= 0: break
+        
+        time.sleep(interval)
+    
+    warmer.close()
+
+except m2pException as e:
+    sys.stderr.write("\nThere was an error.\n")
+    sys.stderr.write(e.msg+"\n")
+except KeyboardInterrupt:
+    pass
+except Exception as e:
+    traceback.print_exc(file=sys.stderr)
+    sys.stderr.write("\nThere was an error.\n")
+    sys.stderr.write(str(e)+"\n")
+    sys.stderr.write('If you can not solve it please contact compbio@eead.csic.es ('+\
+                                   'Computational and structural biology group at EEAD-CSIC).\n')
+
+sys.stderr.write(_SCRIPT+": Finished.\n")
+
+## END
@@ -0,0 +1,106 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# bmap_maps_index.py is part of Barleymap.
+# Copyright (C) 2017 Carlos P Cantalapiedra
+# (terms of use can be found within the distributed LICENSE file).
+
+############################################
+# This script creates a binary index of contigs
+# for each map file (map_dir.db) of the configured maps,
+# which is used to obtain the positions of aligned contigs
+# without reading the whole map file,
+# and an index of the positions of the contigs.
+############################################
+
+import sys, os, traceback
+from optparse import OptionParser
+
+from barleymapcore.m2p_exception import m2pException
+import barleymapcore.utils.metrics_utils as metrics_utils
+from barleymapcore.db.ConfigBase import ConfigBase
+from barleymapcore.db.PathsConfig import PathsConfig
+from barleymapcore.db.MapsConfig import MapsConfig
+from barleymapcore.maps.reader.IndexFiles import KeysIndex, PositionsIndex
+
+_SCRIPT = os.path.basename(__file__)
+
+MAPS_CONF = ConfigBase.MAPS_CONF
+
+try:
+    ## Argument parsing
+    __usage = "usage: "+_SCRIPT+" [OPTIONS]"
+    optParser = OptionParser(__usage)
+    
+    optParser.add_option('--maps', action='store', dest='maps_param', type='string', help='Comma delimited list of maps to index (default all).')
+    
+    optParser.add_option('--metrics', action='store', dest='metrics_path', type='string',
+                         help='Write a JSON report of the time, CPU and memory used by each stage to this file.')
+    
+    optParser.add_option('-v', '--verbose', action='store_true', dest='verbose', help='More information printed.')
+    
+    (options, arguments) = optParser.parse_args()
+    
+    if options.metrics_path: metrics_utils.enable(options.metrics_path)
+    
+    verbose_param = options.verbose if options.verbose else False
+    
+    if verbose_param: sys.stderr.write("Command: "+" ".join(sys.argv)+"\n")
+    
+    ## Read conf file
+    app_abs_path = os.path.dirname(os.path.abspath(__file__))
+    
+    paths_config = PathsConfig()
+    paths_config.load_config(app_abs_path)
+    __app_path = paths_config.get_app_path()
+    
+    maps_path = paths_config.get_maps_path()
+    
+    maps_conf_file = __app_path+MAPS_CONF
+    maps_config = MapsConfig(maps_conf_file, verbose_param)
+    if options.maps_param:
+        maps_ids = maps_config.get_maps_ids(options.maps_param.strip().split(","))
+    else:
+        maps_ids = maps_config.get_maps_list()
+    
+    for map_id in maps_ids:
+        map_config = maps_config.get_map_config(map_id)
+        map_dir = map_config.get_map_dir()
+        
+        sys.stderr.write(_SCRIPT+": map "+map_config.get_name()+"\n")
+        
+        for db in map_config.get_db_list():
+            map_path = maps_path+map_dir+"/"+map_dir+"."+db
+            
+            if not (os.path.exists(map_path) and os.path.isfile(map_path)):
+                sys.stderr.write("\tWARNING: map file "+map_path+" not found. Skipped.\n")
+                continue
+            
+            index_path = map_path+KeysIndex.FILE_EXT
+            
+            sys.stderr.write("\tindexing "+map_path+" to "+index_path+"\n")
+            
+            num_rows = KeysIndex.index_file(map_path, index_path, verbose = verbose_param)
+            
+            sys.stderr.write("\trows in index: "+str(num_rows)+"\n")
+            
+            # Index of positions, used when the map is enriched with features of this map (anchored)
+            positions_index_path = map_path+PositionsIndex.FILE_EXT
+            
+            sys.stderr.write("\tindexing positions of "+map_path+" to "+positions_index_path+"\n")
+            
+            PositionsIndex.index_file(map_path, positions_index_path, verbose_param)
+
+except m2pException as e:
+    sys.stderr.write("\nThere was an error.\n")
+    sys.stderr.write(e.msg+"\n")
+except Exception as e:
+    traceback.print_exc(file=sys.stderr)
+    sys.stderr.write("\nThere was an error.\n")
+    sys.stderr.write(str(e)+"\n")
+    sys.stderr.write('If you can not solve it please contact compbio@eead.csic.es ('+\
+                                   'Computational and structural biology group at EEAD-CSIC).\n')
+
+sys.stderr.write(_SCRIPT+": Finished.\n")
+
+## END